@@ -23,8 +23,16 @@ This library package is for making PyWebApi Server. See the following homepage f
 
 import bottle
 
-from .func import execute, ModuleImporter, RequestArguments
+from .func import execute, execute_async, ModuleImporter, RequestArguments, RouteTable, default_route_table, register_body_decoder
 from .fmtr import MediaTypeFormatter, MediaTypeFormatterManager
+from .watch import ModuleWatcher
+from .pool import ProcessPool, cpu_bound
+from .batch import BatchExecutor
+from .preload import Preloader
+from .cache import ResultCache, SingleFlight, cached, versioned
+from .admission import AdmissionController, AdmissionError
+from .deadline import ExecutionTimeout, time_limit, is_cancelled, check_cancelled
+from .columnar import ColumnarBatch, vectorized
 
 
 __version__ = "0.1a6"
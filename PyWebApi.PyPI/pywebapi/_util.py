@@ -10,7 +10,10 @@ This module implements some utility functions commonly used in this library.
 
 import os
 import sys
-from collections import Iterable, namedtuple
+import site
+import threading
+from collections import namedtuple, Counter
+from collections.abc import Iterable
 
 
 RequestModuleFunction = namedtuple('RequestModuleFunction', ['directory', 'module', 'function'])
@@ -119,6 +122,142 @@ def remove_sys_path_set(path_set:set) -> set:
     return removed
 
 
+class SysPathRegistry(object):
+    """This class keeps a normalized view of sys.path which is maintained incrementally,
+    so that entering and leaving the sys.path scope of a user module directory does not normalize the sys.path entries again or access the file system.
+    Each ``enter`` or ``leave`` still walks sys.path once (comparing the elements with the mirror, and locating the head or the entry to be removed),
+    which is linear in the length of sys.path but involves no path computation.
+
+    - The normalized form of each absolute sys.path entry is computed only once;
+    - The sys.path entries contributed by a directory (itself and the paths added by its .pth files) are recorded
+      the first time the directory is entered, subsequent entries just re-insert the recorded paths which are missing;
+    - Changes made to sys.path by others are detected by comparing sys.path with a shallow mirror,
+      then only the normalized view is rebuilt from the cache.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._normalized = {}       # {absolute sys.path entry: normalized path}
+        self._mirror = []           # a shallow copy of sys.path as of the last synchronization
+        self._paths = Counter()     # {normalized path: number of occurrences in sys.path}
+        self._contributions = {}    # {directory: [sys.path entries contributed by the directory and its .pth files]}
+
+
+    def _normalize(self, entry) -> str:
+        if not entry or entry == '.' or not isinstance(entry, str):
+            return None
+
+        path = self._normalized.get(entry)
+        if path is None:
+            path = full_path(entry)
+            if os.path.isabs(entry):    # a relative entry depends on the current working directory
+                self._normalized[entry] = path
+        return path
+
+
+    def _sync(self) -> list:
+        """Synchronize the normalized view with sys.path, and return the entries which appeared since the last synchronization."""
+        if self._mirror == sys.path:
+            return []
+
+        old_paths = self._paths
+        self._mirror = list(sys.path)
+        self._paths = Counter(filter(None, (self._normalize(p) for p in self._mirror)))
+        return [p for p in self._mirror if self._normalize(p) and self._normalize(p) not in old_paths]
+
+
+    def _insert(self, index:int, entry:str):
+        sys.path.insert(index, entry)
+        self._mirror.insert(index, entry)
+        self._paths[self._normalize(entry)] += 1
+
+
+    def _remove(self, entry:str):
+        for i in range(len(sys.path) - 1, -1, -1):
+            if sys.path[i] == entry:
+                del sys.path[i]
+                del self._mirror[i]
+                path = self._normalize(entry)
+                self._paths[path] -= 1
+                if self._paths[path] <= 0:
+                    del self._paths[path]
+                return
+
+
+    def _head_index(self) -> int:
+        """The position right after '' or '.', otherwise the first position."""
+        for i, p in enumerate(self._mirror):
+            if not p or p == '.':
+                return i + 1
+        return 0
+
+
+    def contains(self, path:str) -> bool:
+        """Check whether a path is currently in sys.path."""
+        with self._lock:
+            self._sync()
+            return self._normalize(path) in self._paths
+
+
+    def enter(self, directory:str) -> list:
+        """Insert a directory into sys.path right after '' or '.' (otherwise in the first position), and add the paths of its .pth files.
+
+    :param directory: The full path of the directory.
+    :return: A list of the sys.path entries actually added, to be passed to ``leave``.
+        """
+        with self._lock:
+            self._sync()
+            added = []
+
+            contribution = self._contributions.get(directory)
+            if contribution is None:
+                if self._normalize(directory) not in self._paths:
+                    self._insert(self._head_index(), directory)
+                    added.append(directory)
+                known_paths = {os.path.normcase(p) for p in self._paths}
+                site.addsitedir(directory, known_paths)     # handle .pth files in this directory, known_paths spares the rescan of sys.path
+                added.extend(self._sync())
+                self._contributions[directory] = [directory] + [p for p in added if p != directory]
+            else:
+                for i, entry in enumerate(contribution):
+                    if self._normalize(entry) not in self._paths:
+                        if i == 0:
+                            self._insert(self._head_index(), entry)
+                        else:
+                            self._insert(len(self._mirror), entry)
+                        added.append(entry)
+
+            return added
+
+
+    def collect(self, added:list):
+        """Append the sys.path entries which appeared since the last call of ``enter`` (E.g. added by a module while it was being imported) to the list."""
+        with self._lock:
+            added.extend(self._sync())
+
+
+    def leave(self, added:list):
+        """Remove the sys.path entries returned by ``enter``."""
+        if not added:
+            return
+
+        with self._lock:
+            self._sync()
+            for entry in reversed(added):
+                self._remove(entry)
+
+
+    def forget(self, directory:str=None):
+        """Forget the recorded contribution of a directory (or all directories), E.g. after its .pth files have been changed."""
+        with self._lock:
+            if directory:
+                self._contributions.pop(directory, None)
+            else:
+                self._contributions.clear()
+
+
+sys_path_registry = SysPathRegistry()
+
+
 def extend_or_append(iterable:list, item):
     if isinstance(item, Iterable) and not isinstance(item, str):
         iterable.extend(item)
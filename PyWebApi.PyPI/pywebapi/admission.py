@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""admission.py
+
+This module implements the admission control of calls - concurrency limits with bounded wait queues per app, per module and per function.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Iterator
+from typing import List, Dict
+
+from . import _util as util
+
+
+class AdmissionError(RuntimeError):
+    """The exception raised when a call is not admitted, because the wait queue of a limit is full or the wait has timed out.
+
+    :param scope: The scope of the limit which rejected the call.
+    :param retry_after: The estimated number of seconds after which the client may retry.
+    """
+    def __init__(self, message:str, scope:str, retry_after:int):
+        super().__init__(message)
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class _ThreadWaiter(threading.Event):
+    """A call waiting in the queue of a ConcurrencyLimiter in a blocked thread."""
+    def set(self) -> bool:
+        super().set()
+        return True
+
+
+class _AsyncWaiter(object):
+    """A call waiting in the queue of a ConcurrencyLimiter in a coroutine, its future is resolved on its own event loop."""
+    def __init__(self, loop:asyncio.AbstractEventLoop):
+        self._loop = loop
+        self.future = loop.create_future()
+        self._handed = False
+
+    def is_set(self) -> bool:
+        return self._handed
+
+    def set(self) -> bool:
+        """Hand over the slot (the caller holds the lock of the limiter), return False if the event loop of the waiter has been closed."""
+        try:
+            self._loop.call_soon_threadsafe(self._resolve)
+        except RuntimeError:
+            return False
+        self._handed = True
+        return True
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ConcurrencyLimiter(object):
+    """This class limits the number of calls running at the same time in one scope, the calls beyond the limit wait in a FIFO queue.
+
+    :param max_concurrency: The maximum number of calls running at the same time.
+    :param max_queue: The maximum number of calls waiting for a free slot, a call beyond it is rejected immediately.
+    :param queue_timeout: The maximum number of seconds a call waits in the queue, None means waiting without timeout.
+    """
+    def __init__(self, max_concurrency:int, max_queue:int=0, queue_timeout:float=None):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be greater than 0 - receiving {repr(max_concurrency)} is not acceptable")
+
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters = deque()     # _ThreadWaiter or _AsyncWaiter of each waiting call in FIFO order
+        self._active = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_hold = 0.0
+        self._released = 0
+
+
+    def _retry_after(self) -> int:
+        """Estimate when a slot may be available: the average running time times the queue length per slot."""
+        average_hold = self._total_hold / self._released if self._released else 1.0
+        return max(1, math.ceil(average_hold * (len(self._waiters) + 1) / self.max_concurrency))
+
+
+    def try_acquire(self) -> bool:
+        """Take a free slot without waiting, return False if there is no free slot (or other calls are already waiting)."""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                self._admitted += 1
+                return True
+            return False
+
+
+    def _enqueue(self, scope:str, waiter):
+        """Take a free slot (and return None), or else append the waiter to the queue (and return it)."""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                self._admitted += 1
+                return None
+
+            if len(self._waiters) >= self.max_queue:
+                self._rejected += 1
+                raise AdmissionError(f"too many concurrent calls to {repr(scope)}: {self._active} running, {len(self._waiters)} waiting",
+                                     scope, self._retry_after())
+
+            self._waiters.append(waiter)
+            return waiter
+
+
+    def _admit_waiter(self, waiter, waited:float, scope:str):
+        with self._lock:
+            if not waiter.is_set():     # timed out, the slot was not handed over
+                self._waiters.remove(waiter)
+                self._timed_out += 1
+                raise AdmissionError(f"the call to {repr(scope)} waited in the queue for more than {self.queue_timeout} seconds",
+                                     scope, self._retry_after())
+
+            self._admitted += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+
+    def acquire(self, scope:str=''):
+        """Take a slot, waiting in the queue if all slots are taken.
+
+    :param scope: The name of the scope, for the error message.
+    :raise AdmissionError: If the queue is full or the wait has timed out.
+        """
+        waiter = self._enqueue(scope, _ThreadWaiter())
+        if waiter is None:
+            return
+
+        start = time.monotonic()
+        waiter.wait(self.queue_timeout)
+        self._admit_waiter(waiter, time.monotonic() - start, scope)
+
+
+    async def acquire_async(self, scope:str=''):
+        """The asynchronous counterpart of ``acquire``, a call waits in the queue on a future of the current event loop,
+    so that neither the event loop nor any executor thread is blocked by the wait.
+        """
+        waiter = self._enqueue(scope, _AsyncWaiter(asyncio.get_running_loop()))
+        if waiter is None:
+            return
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                handed = waiter.is_set()
+                if not handed:
+                    self._waiters.remove(waiter)
+            if handed:      # the slot handed over meanwhile must be given back
+                self.release()
+            raise
+
+        self._admit_waiter(waiter, time.monotonic() - start, scope)
+
+
+    def release(self, held:float=None):
+        """Give back a slot, it is handed over to the first waiting call if any.
+
+    :param held: The number of seconds the slot was held by a completed call, for the estimation of ``Retry-After``.
+        """
+        with self._lock:
+            if held is not None:
+                self._released += 1
+                self._total_hold += held
+            while self._waiters:
+                if self._waiters.popleft().set():       # the slot stays active for the waiter
+                    return
+            self._active -= 1
+
+
+    def stats(self) -> dict:
+        """The current queue depth and the accumulated counters of this limiter."""
+        with self._lock:
+            return {"MaxConcurrency": self.max_concurrency, "MaxQueue": self.max_queue, "QueueTimeout": self.queue_timeout,
+                    "Running": self._active, "Queued": len(self._waiters),
+                    "Admitted": self._admitted, "Rejected": self._rejected, "TimedOut": self._timed_out,
+                    "AverageWait": self._total_wait / self._admitted if self._admitted else 0.0, "MaxWait": self._max_wait}
+
+
+def _release_all(limiters:list):
+    for limiter in reversed(limiters):
+        limiter.release()
+
+
+class Admission(object):
+    """A ticket of an admitted call, which holds one slot of each applicable limit until it is released.
+
+    It can be used as a context manager, or released explicitly (releasing it more than once has no effect).
+    """
+    def __init__(self, limiters:list):
+        self._limiters = limiters
+        self._start = time.monotonic()
+        self._released = False
+        self._deferred = False
+
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+
+        held = time.monotonic() - self._start
+        for limiter in reversed(self._limiters):
+            limiter.release(held)
+
+
+    def release_after(self, iterator:Iterator) -> Iterator:
+        """Hold the slots until a streamed result has been consumed (or closed), then release them. 
+    The exit of the context no longer releases the slots, unless it exits by an exception.
+        """
+        self._deferred = True
+        return self._iter_and_release(iterator)
+
+
+    def _iter_and_release(self, iterator:Iterator):
+        try:
+            yield from iterator
+        finally:
+            self.release()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if exc_type is not None or not self._deferred:
+            self.release()
+
+
+class AdmissionController(object):
+    """This class applies the concurrency limits configured per app, per module and per function to each call,
+    so that a burst of calls to a heavy function cannot exhaust the memory or the downstream resources,
+    and cheap calls do not queue behind them.
+
+    A call is admitted once it holds a slot of every applicable limit - the limits are acquired in the order app, module, function.
+    If the wait queue of any limit is full, or the wait has timed out, the call is rejected by an ``AdmissionError``,
+    which the web server should respond as ``503 Service Unavailable`` with its ``retry_after`` as the ``Retry-After`` header.
+
+    Scopes are named as below:
+
+        - An app: the app id, E.g. ``reporting``;
+        - A module: ``path/module``, relative to the root directory of user modules, E.g. ``etl/loader``;
+        - A function: ``path/module.function``, E.g. ``etl/loader.run``.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._apps = {}         # {app_id: ConcurrencyLimiter}
+        self._modules = {}      # {path/module: ConcurrencyLimiter}
+        self._functions = {}    # {path/module.function: ConcurrencyLimiter}
+
+
+    def limit_app(self, app_id:str, max_concurrency:int, max_queue:int=0, queue_timeout:float=None):
+        """Limit the concurrent calls to all functions of an app (see ``ConcurrencyLimiter`` for the parameters)."""
+        with self._lock:
+            self._apps[app_id] = ConcurrencyLimiter(max_concurrency, max_queue, queue_timeout)
+
+
+    def limit_module(self, module_path:str, max_concurrency:int, max_queue:int=0, queue_timeout:float=None):
+        """Limit the concurrent calls to all functions of a module ``path/module`` (see ``ConcurrencyLimiter`` for the parameters)."""
+        with self._lock:
+            self._modules[module_path.strip('/')] = ConcurrencyLimiter(max_concurrency, max_queue, queue_timeout)
+
+
+    def limit_function(self, function_path:str, max_concurrency:int, max_queue:int=0, queue_timeout:float=None):
+        """Limit the concurrent calls to a function ``path/module.function`` (see ``ConcurrencyLimiter`` for the parameters)."""
+        with self._lock:
+            self._functions[function_path.strip('/')] = ConcurrencyLimiter(max_concurrency, max_queue, queue_timeout)
+
+
+    def _scopes(self, routed_path:str, app_id:str=None) -> List[tuple]:
+        """[(scope name, ConcurrencyLimiter)] of all limits applicable to a call."""
+        scopes = []
+        if not (self._apps or self._modules or self._functions):
+            return scopes
+
+        if app_id is not None and app_id in self._apps:
+            scopes.append((app_id, self._apps[app_id]))
+
+        try:
+            module_func = util.extract_path_info(routed_path)
+        except (NameError, ModuleNotFoundError, NotADirectoryError):
+            return scopes       # the invalid path will be reported by execute
+
+        module_path = f'{module_func.directory}/{module_func.module}'
+        if module_path in self._modules:
+            scopes.append((module_path, self._modules[module_path]))
+
+        function_path = f'{module_path}.{module_func.function}'
+        if function_path in self._functions:
+            scopes.append((function_path, self._functions[function_path]))
+
+        return scopes
+
+
+    def admit(self, routed_path:str, app_id:str=None) -> Admission:
+        """Admit a call, waiting in the queues of the applicable limits if necessary.
+
+    :param routed_path: The ``path/module.function`` path comes from URL routing.
+    :param app_id: The optional app id of the call.
+    :return: An Admission ticket, the call must release it after completion.
+    :raise AdmissionError: If the call is rejected by any limit.
+        """
+        acquired = []
+        try:
+            for scope, limiter in self._scopes(routed_path, app_id):
+                limiter.acquire(scope)
+                acquired.append(limiter)
+        except:
+            _release_all(acquired)
+            raise
+
+        return Admission(acquired)
+
+
+    async def admit_async(self, routed_path:str, app_id:str=None) -> Admission:
+        """The asynchronous counterpart of ``admit`` for the event loop of an async server,
+    a call which has to wait in a queue awaits its turn without blocking the event loop or occupying an executor thread.
+        """
+        acquired = []
+        try:
+            for scope, limiter in self._scopes(routed_path, app_id):
+                await limiter.acquire_async(scope)
+                acquired.append(limiter)
+        except:
+            _release_all(acquired)
+            raise
+
+        return Admission(acquired)
+
+
+    def stats(self) -> Dict[str, dict]:
+        """The current queue depths and wait times of all configured limits: {"Apps": {...}, "Modules": {...}, "Functions": {...}}."""
+        with self._lock:
+            groups = (("Apps", dict(self._apps)), ("Modules", dict(self._modules)), ("Functions", dict(self._functions)))
+        return {name: {scope: limiter.stats() for scope, limiter in limiters.items()} for name, limiters in groups}
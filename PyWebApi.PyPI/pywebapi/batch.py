@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""batch.py
+
+This module implements the concurrent execution of batch calls (a list of argument dictionaries) on the same function.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import inspect
+import asyncio
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections.abc import Mapping, Sequence
+from typing import List, Dict, Iterator, Iterable
+
+from .func import ResolvedRoute, _run_coroutine
+from .deadline import ExecutionTimeout, current_token, call_with_token
+
+
+def item_succeeded(result) -> dict:
+    """The per-item report of a successful call in a concurrent batch."""
+    return {"Succeeded": True, "Result": result}
+
+
+def item_failed(err:Exception) -> dict:
+    """The per-item report of a failed call in a concurrent batch, it uses the same keys as the error response of the sample server."""
+    return {"Succeeded": False, "ExceptionType": type(err).__name__, "ExceptionMessage": str(err)}
+
+
+def _invalid_item(i:int, args) -> TypeError:
+    return TypeError(f"each item in the 'args' list must be a dictionary - receiving args[{i}]={repr(args)} is not acceptable")
+
+
+def _report(future) -> dict:
+    if isinstance(future, Future):
+        try:
+            return item_succeeded(future.result())
+        except Exception as err:
+            return item_failed(err)
+    elif isinstance(future, Exception):
+        return item_failed(future)
+    else:
+        return item_succeeded(None)
+
+
+def _check_cancelled(token):
+    if token is not None and token.cancelled:
+        raise ExecutionTimeout("the batch has been cancelled, since it did not complete within its timeout")
+
+
+class BatchExecutor(object):
+    """This class executes a batch of calls (a list of argument dictionaries) on the same function concurrently.
+
+    Unlike the default sequential batch, every item reports its own success or error, and a failed item does not stop the others.
+    The results are returned in input order, each item is either ``{"Succeeded": true, "Result": ...}`` or
+    ``{"Succeeded": false, "ExceptionType": "...", "ExceptionMessage": "..."}``, so the client only needs to resend the failed items.
+
+    :param max_workers: The degree of parallelism - the maximum number of calls running at the same time.
+
+        - A regular function is called by a pool of threads shared by all batches of this executor;
+        - A coroutine function (``async def``) is awaited on an event loop, at most ``max_workers`` calls of a batch are awaited at the same time;
+        - A function accepted by the ``process_pool`` passed to ``execute`` is called by the worker processes of that pool,
+          the parallelism is then limited by the pool's ``max_workers``.
+
+    .. note::
+
+        If the RouteTable is not in isolation mode, all threads share the process-global working directory and sys.path,
+        which are switched to the module directory for the whole batch.
+    """
+    def __init__(self, max_workers:int=8):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._thread_pool = None
+
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            with self._lock:
+                if self._thread_pool is None:
+                    self._thread_pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='pywebapi-batch')
+        return self._thread_pool
+
+
+    def invoke(self, route:ResolvedRoute, args_list:Iterable[Dict], process_pool=None) -> List[Dict]:
+        """Invoke the module level function of a resolved route for each argument dictionary in the list concurrently.
+
+    :param route: The ResolvedRoute of the function.
+    :param args_list: A list (or an iterator) of argument dictionaries.
+    :param process_pool: An optional ``pool.ProcessPool``, the items are called by its worker processes if it accepts the route.
+    :return: A list of per-item reports (see above) in input order. A ``None`` item gets a successful report with a ``None`` result.
+        """
+        return list(self.iter_invoke(route, args_list, process_pool))
+
+
+    def iter_invoke(self, route:ResolvedRoute, args_list:Iterable[Dict], process_pool=None) -> Iterator[Dict]:
+        """The same as ``invoke``, but the per-item reports are yielded in input order as soon as each of them completes, 
+    so they can be sent incrementally. All items of a list are submitted when the first report is requested, 
+    while the items of an iterator (E.g. an incrementally parsed request body) are taken from it as a sliding window of ``max_workers * 2`` calls in flight, 
+    so that neither the arguments nor the results of a huge batch are held in memory as a whole.
+
+    If the batch runs with a timeout, the CancellationToken of the calling thread is passed on to the threads of the items,
+    and no more items are submitted once it has been cancelled.
+        """
+        return self._iter_invoke(route, args_list, process_pool, current_token())
+
+
+    def _iter_invoke(self, route:ResolvedRoute, args_list:Iterable[Dict], process_pool, token):
+        window = len(args_list) if isinstance(args_list, Sequence) else self.max_workers * 2
+
+        if inspect.iscoroutinefunction(route.function) and not (process_pool is not None and process_pool.accepts(route)):
+            items = iter(args_list)
+            for start in itertools.count(0, window or 1):
+                _check_cancelled(token)
+                chunk = list(itertools.islice(items, window))
+                if not chunk:
+                    break
+                yield from _run_coroutine(self._gather(route, chunk, start), token)
+            return
+
+        if process_pool is not None and process_pool.accepts(route):
+            submit = lambda args: process_pool.submit(route, args)
+        elif token is not None:
+            thread_pool = self._get_thread_pool()
+            submit = lambda args: thread_pool.submit(call_with_token, token, route.binder.call, route.function, args)
+        else:
+            thread_pool = self._get_thread_pool()
+            submit = lambda args: thread_pool.submit(route.binder.call, route.function, args)
+
+        futures = deque()
+        try:
+            for i, args in enumerate(args_list):
+                if len(futures) >= window:
+                    yield _report(futures.popleft())
+                _check_cancelled(token)
+
+                if isinstance(args, Mapping):
+                    try:
+                        futures.append(submit(args))
+                    except Exception as err:
+                        futures.append(err)
+                elif args is None:
+                    futures.append(None)
+                else:
+                    futures.append(_invalid_item(i, args))
+
+            while futures:
+                yield _report(futures.popleft())
+        finally:
+            for future in futures:      # the consumer has given up (E.g. the client disconnected)
+                if isinstance(future, Future):
+                    future.cancel()
+
+
+    async def _gather(self, route:ResolvedRoute, args_list:List[Dict], start:int=0) -> List[Dict]:
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def call_one(i:int, args):
+            if args is None:
+                return item_succeeded(None)
+            elif not isinstance(args, Mapping):
+                return item_failed(_invalid_item(i, args))
+
+            async with semaphore:
+                try:
+                    return item_succeeded(await route.binder.call(route.function, args))
+                except Exception as err:
+                    return item_failed(err)
+
+        return list(await asyncio.gather(*(call_one(i, args) for i, args in enumerate(args_list, start))))
+
+
+    def shutdown(self, wait:bool=True):
+        """Shut down the pool of threads."""
+        with self._lock:
+            thread_pool, self._thread_pool = self._thread_pool, None
+        if thread_pool is not None:
+            thread_pool.shutdown(wait=wait)
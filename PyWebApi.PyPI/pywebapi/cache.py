@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""cache.py
+
+This module implements an opt-in cache of formatted responses and the coalescing of identical concurrent calls for pure user functions
+(E.g. reference-data lookups), and the version tokens of the functions whose results change only with their data.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import os
+import math
+import time
+import inspect
+import functools
+import asyncio
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict, namedtuple, Counter
+from collections.abc import Mapping, Set, Iterator
+from typing import Union, Dict, List, Callable
+
+from . import _util as util
+from .func import RouteTable, ResolvedRoute, ArgumentBinder, default_route_table
+from .conditional import make_etag
+
+
+def cached(ttl:float=60.0):
+    """This decorator marks a module level function as pure, so its formatted responses can be cached by a ``ResultCache`` for ``ttl`` seconds.
+
+    A plain module can also declare its cached functions without importing this package, by a module level dictionary
+    ``__pywebapi_cached__ = {"function_name": ttl_seconds}``.
+    """
+    if callable(ttl):           # used as @cached without arguments
+        return cached()(ttl)
+
+    def decorator(func):
+        func.__pywebapi_cached__ = ttl
+        return func
+    return decorator
+
+
+def get_cache_ttl(route:ResolvedRoute) -> float:
+    """Get the time-to-live (in seconds) declared for the function of a resolved route, or None if the function is not declared as cached."""
+    ttl = getattr(route.function, '__pywebapi_cached__', None)
+    if ttl is None:
+        declared = getattr(route.module, '__pywebapi_cached__', None)
+        if isinstance(declared, Mapping):
+            ttl = declared.get(route.function_name)
+
+    if isinstance(ttl, (int, float)) and not isinstance(ttl, bool) and ttl > 0:
+        return ttl
+    else:
+        return None
+
+
+def versioned(version:Union[Callable, str]):
+    """This decorator gives a module level function a cheap version token of its result, E.g. the last modified time of the underlying table.
+    Calls with the same arguments and the same version token are regarded as giving the same content, so the ``ETag`` of a response
+    can be known before calling the function (a matching ``If-None-Match`` is answered by 304 without calling it at all),
+    and a ``ResultCache`` keeps the formatted response until the version changes (or the entry is evicted, or its ``cached`` ttl expires).
+
+    :param version: A function which receives the arguments of the function (bound by the same rules, the extra ones are ignored)
+        and returns a version token (any value with a stable ``repr``), or the name of such a function in the same module.
+
+    A plain module can also declare its versioned functions without importing this package, by a module level dictionary
+    ``__pywebapi_versioned__ = {"function_name": "version_function_name"}``.
+    """
+    def decorator(func):
+        func.__pywebapi_version__ = version
+        return func
+    return decorator
+
+
+@functools.lru_cache(maxsize=256)
+def _version_binder(version:Callable) -> ArgumentBinder:
+    return ArgumentBinder(inspect.signature(version))
+
+
+def get_version(route:ResolvedRoute, args:Mapping):
+    """Get the version token of a call of the function of a resolved route, or None if the function is not versioned.
+
+    :raise TypeError: If any required parameter of the version function can not be found from the passed arguments.
+    """
+    version = getattr(route.function, '__pywebapi_version__', None)
+    if version is None:
+        declared = getattr(route.module, '__pywebapi_versioned__', None)
+        if isinstance(declared, Mapping):
+            version = declared.get(route.function_name)
+    if isinstance(version, str):
+        version = getattr(route.module, version, None)
+    if not callable(version):
+        return None
+
+    bound_args, bound_kwargs = _version_binder(version).bind(args)
+    return version(*bound_args, **bound_kwargs)
+
+
+def _freeze(value):
+    """Convert a bound argument value into a canonical hashable form, equal values of the same types give equal forms."""
+    if isinstance(value, Mapping):
+        return ('{}', tuple(sorted(((_freeze(k), _freeze(v)) for k, v in value.items()), key=repr)))
+    elif isinstance(value, (list, tuple)):
+        return ('[]', tuple(_freeze(v) for v in value))
+    elif isinstance(value, Set):
+        return ('()', tuple(sorted((_freeze(v) for v in value), key=repr)))
+
+    try:
+        hash(value)
+    except TypeError:
+        return (type(value).__name__, repr(value))
+    else:
+        return (type(value).__name__, value)
+
+
+def _bound_arguments_key(route:ResolvedRoute, args:Mapping) -> tuple:
+    """The canonical form of the arguments bound to the function of a resolved route.
+
+    :raise TypeError: If any required parameter can not be found from the passed arguments.
+    """
+    bound_args, bound_kwargs = route.binder.bind(args)
+    return (_freeze(bound_args), _freeze(bound_kwargs))
+
+
+CacheKey = namedtuple('CacheKey', ['directory', 'function', 'variant', 'arguments', 'ttl', 'version'])
+
+CacheEntry = namedtuple('CacheEntry', ['expires', 'body', 'headers', 'etag'])
+
+
+class ResultCache(object):
+    """This class caches the formatted responses (the content already converted by a ``MediaTypeFormatter``) of pure user functions,
+    so that a hit skips both the function call and the formatting.
+
+    Only the functions declared by the ``cached`` decorator or the module level ``__pywebapi_cached__`` dictionary are cached,
+    each entry expires after the time-to-live declared by its function, and the least recently used entries are evicted beyond ``max_size``.
+    The functions declared by the ``versioned`` decorator (or ``__pywebapi_versioned__``) are cached as well, the version token is a part of the key,
+    so an entry is never hit again once the version changes (it does not expire by time unless the function is also declared as cached).
+
+    Each entry keeps the ``ETag`` of its content, so a poll of an unchanged result costs a lookup and a 304 (see ``conditional.not_modified``).
+
+    The key of an entry is made of the function object, the canonical form of its bound arguments (so that different spellings of
+    the same call - positional or named - share one entry) and a variant (usually the ``Accept`` header, since the content depends on it).
+    The entries of a reloaded module are never hit again, since the function object changes, they are also discarded by ``invalidate``
+    (a ``ModuleWatcher`` given this cache calls it for the reloaded directories).
+
+    :param max_size: The maximum number of entries.
+    :param route_table: The RouteTable used by ``execute``, the module level ``default_route_table`` is used if it is omitted.
+    """
+    def __init__(self, max_size:int=1024, route_table:RouteTable=None):
+        self.max_size = max_size
+        self.route_table = default_route_table if route_table is None else route_table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()     # {CacheKey: CacheEntry} in LRU order
+
+
+    def key(self, root:str, routed_path:str, args:Union[Dict, List[Dict]], variant:str='') -> CacheKey:
+        """Build the cache key of a call.
+
+    :param root: The root directory for centrally organizing user modules, the same one passed to ``execute``.
+    :param routed_path: The ``path/module.function`` path comes from URL routing.
+    :param args: The argument dictionary to be passed to ``execute``.
+    :param variant: Anything else the response content depends on, usually the ``Accept`` header.
+    :return: The CacheKey, or None if the call cannot be cached: the function is declared as neither cached nor versioned, the route has not been resolved
+        by ``execute`` yet (no import is done here), the arguments are a batch (a list of dictionaries) or cannot be bound.
+        """
+        if not isinstance(args, Mapping):
+            return None
+
+        route = self.route_table.lookup(root, routed_path)
+        if route is None:
+            return None
+
+        try:
+            version = get_version(route, args)
+            ttl = get_cache_ttl(route)
+            if ttl is None and version is None:
+                return None
+            arguments = _bound_arguments_key(route, args)
+        except TypeError:
+            return None
+
+        return CacheKey(route.directory, route.function, variant, arguments, ttl, version)
+
+
+    @staticmethod
+    def version_etag(key:CacheKey) -> str:
+        """The ``ETag`` of a versioned call, which is known before calling the function, or None if the key has no version token.
+        It is derived from the function, the arguments, the variant and the version token, so it is the same in any server process."""
+        if key is None or key.version is None:
+            return None
+
+        function = f"{getattr(key.function, '__module__', '')}.{getattr(key.function, '__qualname__', '')}"
+        return make_etag(repr((function, key.variant, key.arguments, key.version)))
+
+
+    def get(self, key:CacheKey) -> CacheEntry:
+        """Get the unexpired entry of a key, or None if it is missing or expired."""
+        if key is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+
+    def put(self, key:CacheKey, body:Union[bytes, str], headers:dict=None, etag:str=None):
+        """Store a formatted response under a key.
+
+    :param key: The CacheKey returned by ``key``, nothing is stored if it is None.
+    :param body: The formatted content, a streamed response (an iterator of chunks) is never stored.
+    :param headers: The response headers to be restored on a hit, E.g. ``{"Content-Type": "application/json"}``.
+    :param etag: The ``ETag`` of the content, it is computed over the content if it is omitted.
+        """
+        if key is None or not isinstance(body, (bytes, str)):
+            return
+
+        expires = time.monotonic() + key.ttl if key.ttl is not None else math.inf
+        entry = CacheEntry(expires, body, dict(headers) if headers else {}, etag or make_etag(body))
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self, directory:str=None):
+        """Discard cached entries.
+
+    :param directory: Only discard the entries of functions in this directory (or its subdirectories). All entries will be discarded if it is omitted.
+        """
+        with self._lock:
+            if directory:
+                scope = util.full_path(directory)
+                prefix = os.path.join(scope, '')
+                for key in [k for k in self._entries if k.directory == scope or k.directory.startswith(prefix)]:
+                    del self._entries[key]
+            else:
+                self._entries.clear()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SingleFlight(object):
+    """This class coalesces identical concurrent calls of pure user functions: while a call is in flight, 
+    any other call of the same function with the same (canonical) bound arguments does not run the function again, 
+    but waits for the in-flight call and shares its result (or its exception).
+    Within a batch call (a list of argument dictionaries), duplicate argument dictionaries are evaluated only once.
+
+    Only the functions declared as cached (by the ``cached`` decorator or the module level ``__pywebapi_cached__`` dictionary) are coalesced,
+    since the callers of a function with side effects expect it to run once per call. Generator functions are never coalesced,
+    as their results can be consumed only once.
+
+    Pass it to ``execute`` (or ``execute_async``) as the ``single_flight`` argument.
+
+    Attributes:
+
+        - ``coalesced``: The number of calls (including duplicate batch items) served by the result of another call.
+    """
+    def __init__(self):
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls = {}        # {(function, arguments): Future} of the calls in flight
+
+
+    def accepts(self, route:ResolvedRoute) -> bool:
+        """Check whether the calls of a resolved route can be coalesced."""
+        return get_cache_ttl(route) is not None and not inspect.isgeneratorfunction(route.function) and not inspect.isasyncgenfunction(route.function)
+
+
+    def _key(self, route:ResolvedRoute, args) -> tuple:
+        try:
+            return (route.function, _bound_arguments_key(route, args))
+        except TypeError:
+            return None
+
+
+    def _join(self, key:tuple) -> tuple:
+        """Return (future, is_leader) of the call in flight for the key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+
+    def _complete(self, key:tuple, future:Future, result=None, error:BaseException=None):
+        with self._lock:
+            del self._calls[key]
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+
+    def execute(self, route:ResolvedRoute, args:Union[Dict, List[Dict]], call:Callable):
+        """Execute ``call(args)``, sharing the result with identical concurrent calls.
+
+    :param route: The ResolvedRoute of the function.
+    :param args: A argument dictionary or a list of argument dictionary to be passed to the function.
+    :param call: The function which actually executes the route with the arguments.
+    :return: The result of ``call``, for a batch call the (list or iterator of) results are expanded back to the original items.
+        """
+        if not self.accepts(route):
+            return call(args)
+
+        if isinstance(args, list):
+            return self._execute_batch(args, call, route)
+
+        key = self._key(route, args) if isinstance(args, Mapping) else None
+        if key is None:
+            return call(args)
+
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = call(args)
+        except BaseException as err:
+            self._complete(key, future, error=err)
+            raise
+        else:
+            self._complete(key, future, result)
+            return result
+
+
+    async def execute_async(self, route:ResolvedRoute, args:Dict, call:Callable):
+        """The asynchronous counterpart of ``execute`` for a single call, ``call(args)`` returns an awaitable."""
+        key = self._key(route, args) if self.accepts(route) and isinstance(args, Mapping) else None
+        if key is None:
+            return await call(args)
+
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await call(args)
+        except BaseException as err:
+            self._complete(key, future, error=err)
+            raise
+        else:
+            self._complete(key, future, result)
+            return result
+
+
+    def _execute_batch(self, args_list:List[Dict], call:Callable, route:ResolvedRoute):
+        unique_args = []
+        unique_index = {}       # {key: index in unique_args}
+        mapping = []            # the index in unique_args of each original item
+
+        for args in args_list:
+            if args is None:
+                key = None
+            elif isinstance(args, Mapping):
+                key = self._key(route, args)
+                if key is None:
+                    return call(args_list)      # let the call report the binding error of this item
+            else:
+                return call(args_list)          # let the call report the invalid item at its original position
+
+            i = unique_index.get(key)
+            if i is None:
+                i = unique_index[key] = len(unique_args)
+                unique_args.append(args)
+            mapping.append(i)
+
+        if len(unique_args) == len(args_list):
+            return call(args_list)
+
+        with self._lock:
+            self.coalesced += len(args_list) - len(unique_args)
+
+        results = call(unique_args)
+        if isinstance(results, Iterator):
+            return _expand_iter(results, mapping)
+        else:
+            return [results[i] for i in mapping]
+
+
+def _expand_iter(results:Iterator, mapping:list):
+    """Expand the streamed results of the unique items back to the original items.
+    A result is held only until its last duplicate has been yielded, so the memory is bounded by the pending duplicates."""
+    remaining = Counter(mapping)        # {index in unique_args: the number of occurrences not yielded yet}
+    held = {}
+    produced = 0
+    for i in mapping:
+        if i == produced:       # the unique items are in the order of their first occurrences
+            result = next(results)
+            produced += 1
+        else:
+            result = held[i]
+
+        remaining[i] -= 1
+        if remaining[i]:
+            held[i] = result
+        else:
+            held.pop(i, None)
+        yield result
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""columnar.py
+
+This module implements the columnar batch input (column names with value arrays) and the vectorized functions which receive whole columns in a single call.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+from collections.abc import Mapping, Sequence
+from typing import Callable, List
+
+
+_ARRAY_KINDS = ('list', 'numpy')
+
+
+def vectorized(array:str='list'):
+    """This decorator marks a module level function as vectorized: a batch call (columnar or a list of argument dictionaries)
+    calls the function only once, each named argument receives a whole column instead of a single value,
+    and the function returns a sequence of per-row results (a NumPy array is converted to a list).
+
+    :param array: The type of the columns passed to the function - ``'list'`` or ``'numpy'`` (``numpy.ndarray``, NumPy must be installed).
+
+    A plain module can also declare its vectorized functions without importing this package, by a module level dictionary
+    ``__pywebapi_vectorized__ = {"function_name": "list"}``.
+    """
+    if callable(array):         # used as @vectorized without arguments
+        return vectorized()(array)
+
+    if array not in _ARRAY_KINDS:
+        raise ValueError(f"array must be one of {repr(_ARRAY_KINDS)} - receiving {repr(array)} is not acceptable")
+
+    def decorator(func):
+        func.__pywebapi_vectorized__ = array
+        return func
+    return decorator
+
+
+def get_vectorized(func:Callable) -> str:
+    """Get the array type declared for a vectorized module level function, or None if the function is not vectorized."""
+    array = getattr(func, '__pywebapi_vectorized__', None)
+    if array is None:
+        declared = getattr(func, '__globals__', {}).get('__pywebapi_vectorized__')
+        if isinstance(declared, Mapping):
+            array = declared.get(getattr(func, '__name__', None))
+
+    return array if array in _ARRAY_KINDS else None
+
+
+class ColumnarBatch(Sequence):
+    """A batch of calls in the columnar shape - ``{"column_name": [value_of_row_0, value_of_row_1, ...], ...}``,
+    so that the names of the arguments are not repeated for every row.
+
+    A vectorized function receives all columns in a single call, any other function is called for each row as usual.
+
+    :param columns: A dictionary of column name to the list of values, all lists must have the same length.
+    :param layer: An optional callable which wraps the argument dictionary of a row (or of the whole columns)
+        with the arguments shared by all rows (E.g. ``RequestArguments`` adds the query string and the server overrides).
+    :raise ValueError: If the columns are not lists of the same length, or any column is named by the empty key (positional arguments).
+    """
+    def __init__(self, columns:Mapping, layer:Callable[[Mapping], Mapping]=None):
+        length = None
+        for name, values in columns.items():
+            if not (name and name.strip()):
+                raise ValueError("positional arguments (the empty key) cannot be passed as a column")
+            if not isinstance(values, list):
+                raise ValueError(f"each column must be an array - receiving {repr(name)}={repr(values)} is not acceptable")
+            if length is None:
+                length = len(values)
+            elif len(values) != length:
+                raise ValueError(f"all columns must have the same length - the column {repr(name)} has {len(values)} values instead of {length}")
+
+        self.columns = columns
+        self.layer = layer
+        self._length = length or 0
+
+
+    @classmethod
+    def from_rows(cls, rows:List[Mapping]) -> 'ColumnarBatch':
+        """Pivot a list of argument dictionaries into columns, a value missing from a row is None.
+
+    :raise TypeError: If any item in the list is not a dictionary.
+        """
+        names = {}
+        for i, row in enumerate(rows):
+            if not isinstance(row, Mapping):
+                raise TypeError(f"each item in the 'args' list must be a dictionary - receiving args[{i}]={repr(row)} is not acceptable")
+            names.update(dict.fromkeys(row))
+
+        return cls({name: [row.get(name) for row in rows] for name in names})
+
+
+    def __len__(self) -> int:
+        return self._length
+
+
+    def __getitem__(self, index:int) -> Mapping:
+        if isinstance(index, slice):
+            return ColumnarBatch({name: values[index] for name, values in self.columns.items()}, self.layer)
+
+        row = {name: values[index] for name, values in self.columns.items()}
+        return self.layer(row) if self.layer is not None else row
+
+
+    def __iter__(self):
+        names = list(self.columns)
+        layer = self.layer
+        for values in zip(*self.columns.values()):
+            row = dict(zip(names, values))
+            yield layer(row) if layer is not None else row
+
+
+    def column_arguments(self, array:str='list') -> Mapping:
+        """The argument dictionary of a vectorized call: each column as a whole, in the type of ``array`` (see ``vectorized``)."""
+        if array == 'numpy':
+            import numpy
+            columns = {name: numpy.asarray(values) for name, values in self.columns.items()}
+        else:
+            columns = self.columns
+
+        return self.layer(columns) if self.layer is not None else columns
+
+
+def rows_of(result):
+    """Convert the per-row results of a vectorized call into a list, any other result (E.g. a dictionary of columns) is returned as it is."""
+    tolist = getattr(result, 'tolist', None)        # E.g. numpy.ndarray, pandas.Series
+    if callable(tolist):
+        return tolist()
+    return list(result) if isinstance(result, tuple) else result
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""compress.py
+
+This module implements the HTTP content coding: the response compression negotiated by the ``Accept-Encoding`` header
+(gzip and deflate, plus zstd and br if the optional packages zstandard and brotli are installed),
+and the transparent decoding of the compressed request bodies (``Content-Encoding: gzip``, deflate or zstd).
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import zlib
+from io import BytesIO
+from tempfile import NamedTemporaryFile
+from collections.abc import Iterator
+from bottle import Request, Response, HTTPError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_CHUNK_SIZE = 65536
+
+
+class _ZlibEncoder(object):
+    def __init__(self, wbits:int, level:int=6):
+        self._compressobj = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data:bytes) -> bytes:
+        return self._compressobj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressobj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressobj.flush(zlib.Z_FINISH)
+
+
+class _ZstdEncoder(object):
+    def __init__(self, level:int=3):
+        self._compressobj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data:bytes) -> bytes:
+        return self._compressobj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressobj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressobj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class _BrotliEncoder(object):
+    def __init__(self, quality:int=4):      # the higher qualities are too slow for dynamic contents
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data:bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+# The content codings in the order of preference of the server, when the client accepts several of them with the same q-value
+_encoders = {}
+if zstandard is not None:
+    _encoders['zstd'] = _ZstdEncoder
+if brotli is not None:
+    _encoders['br'] = _BrotliEncoder
+_encoders['gzip'] = lambda: _ZlibEncoder(31)
+_encoders['deflate'] = lambda: _ZlibEncoder(15)     # the "deflate" of HTTP is the zlib format
+
+
+def available_encodings() -> list:
+    """The content codings which can be used to compress a response, in the order of preference."""
+    return list(_encoders)
+
+
+def negotiate_encoding(accept_encoding:str) -> str:
+    """Pick the content coding to compress a response by the ``Accept-Encoding`` header (the q-values are honoured).
+
+    :param accept_encoding: The value of the ``Accept-Encoding`` request header, E.g. ``'gzip, deflate, br;q=0.9'``.
+    :return: The name of the content coding, or None if the response should not be compressed (``identity``).
+    """
+    if not accept_encoding:
+        return None
+
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [s.strip() for s in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+
+    wildcard = qvalues.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in _encoders:
+        q = qvalues.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+
+    if best is not None and best_q < qvalues.get('identity', 0.0):
+        return None
+    return best
+
+
+def _to_bytes(chunk, charset:str) -> bytes:
+    if chunk is None:
+        return b''
+    elif isinstance(chunk, str):
+        return chunk.encode(charset)
+    else:
+        return bytes(chunk)
+
+
+def _set_encoding(response:Response, coding:str):
+    response.set_header('Content-Encoding', coding)
+    etag = response.get_header('ETag')
+    if etag and not etag.startswith('W/'):      # the compressed bytes are not the ones the strong entity tag was computed over
+        response.set_header('ETag', 'W/' + etag)
+
+
+def _iter_compressed(encoder, head:list, chunks:Iterator, charset:str):
+    """Compress the chunks as soon as each of them is produced, the compressed data is flushed at least every 64 KB of content,
+    so that a slow stream still reaches the client progressively."""
+    try:
+        pending = 0
+        for chunk in head:
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+            pending += len(chunk)
+        for chunk in chunks:
+            chunk = _to_bytes(chunk, charset)
+            data = encoder.compress(chunk)
+            pending += len(chunk)
+            if pending >= _CHUNK_SIZE:
+                data += encoder.flush()
+                pending = 0
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if callable(close):
+            close()
+
+
+def encode_response(body, request:Request, response:Response, min_size:int=1024):
+    """Compress a response body by the content coding negotiated from the ``Accept-Encoding`` header of the request,
+    and set the ``Content-Encoding`` and ``Vary`` response headers accordingly (a strong ``ETag`` of a compressed response becomes weak).
+
+    :param body: The response body - bytes, a str, or an iterator of content chunks (a streamed response, which is compressed chunk by chunk,
+        without buffering the whole content).
+    :param request: The bottle.request object (current request).
+    :param response: The bottle.response object.
+    :param min_size: A body smaller than this number of bytes is not compressed (the first chunks of a streamed response are held until they reach this size).
+    :return: The body to be returned to bottle - the compressed bytes, an iterator of compressed chunks, or the original body if it is not compressed.
+    """
+    if response.get_header('Content-Encoding') or response.status_code in (204, 304) or body is None:
+        return body
+
+    vary = response.get_header('Vary')
+    if not vary:
+        response.set_header('Vary', 'Accept-Encoding')
+    elif 'accept-encoding' not in vary.lower():
+        response.set_header('Vary', vary + ', Accept-Encoding')
+
+    coding = negotiate_encoding(request.get_header('Accept-Encoding'))
+    if coding is None:
+        return body
+
+    charset = response.charset or 'UTF-8'
+    if isinstance(body, Iterator):
+        head, size = [], 0
+        for chunk in body:
+            chunk = _to_bytes(chunk, charset)
+            head.append(chunk)
+            size += len(chunk)
+            if size >= min_size:
+                break
+        else:
+            return b''.join(head)       # the whole stream is too small to be worth compressing
+
+        _set_encoding(response, coding)
+        if 'Content-Length' in response:
+            del response['Content-Length']
+        return _iter_compressed(_encoders[coding](), head, body, charset)
+
+    data = _to_bytes(body, charset) if isinstance(body, (str, bytes, bytearray, memoryview)) else None
+    if data is None or len(data) < min_size:
+        return body
+
+    encoder = _encoders[coding]()
+    _set_encoding(response, coding)
+    return encoder.compress(data) + encoder.finish()
+
+
+def _iter_zlib_decoded(fp, wbits:int):
+    decompressobj = zlib.decompressobj(wbits)
+    chunk = fp.read(_CHUNK_SIZE)
+    while chunk:
+        data = chunk
+        while data:
+            yield decompressobj.decompress(data, _CHUNK_SIZE)     # bounded, however high the compression ratio is
+            data = decompressobj.unconsumed_tail
+            if decompressobj.eof and decompressobj.unused_data:     # the next member of a multi-member gzip
+                data = decompressobj.unused_data
+                decompressobj = zlib.decompressobj(wbits)
+        chunk = fp.read(_CHUNK_SIZE)
+
+    if not decompressobj.eof:
+        raise zlib.error("the compressed data is truncated")
+
+
+def _iter_zstd_decoded(fp):
+    reader = zstandard.ZstdDecompressor().stream_reader(fp, read_across_frames=True)
+    chunk = reader.read(_CHUNK_SIZE)
+    while chunk:
+        yield chunk
+        chunk = reader.read(_CHUNK_SIZE)
+
+
+def _iter_decoded(fp, coding:str):
+    if coding in ('gzip', 'x-gzip'):
+        return _iter_zlib_decoded(fp, 31)
+    elif coding == 'deflate':
+        return _iter_zlib_decoded(fp, 15)
+    elif coding == 'zstd' and zstandard is not None:
+        return _iter_zstd_decoded(fp)
+    else:
+        return None
+
+
+def decode_request(request:Request, max_size:int=1 << 30) -> bool:
+    """Decode a compressed request body (``Content-Encoding: gzip``, ``deflate`` or ``zstd``) in place,
+    so that ``request.body`` (and ``request.json``) return the original content.
+    Like bottle, the decoded body is spooled to a temporary file once it exceeds ``request.MEMFILE_MAX``.
+
+    :param request: The bottle.request object (current request), before its body has been parsed.
+    :param max_size: The maximum number of bytes of the decoded body, which guards against decompression bombs.
+    :return: True if the body has been decoded, False if the body was not compressed.
+    :raise HTTPError: 415 if the content coding is not supported, 400 if the body cannot be decoded, 413 if the decoded body exceeds ``max_size``.
+    """
+    codings = [c.strip().lower() for c in request.environ.get('HTTP_CONTENT_ENCODING', '').split(',')]
+    codings = [c for c in codings if c and c != 'identity']
+    if not codings:
+        return False
+
+    body = request.body
+    for coding in reversed(codings):        # the codings are listed in the order in which they were applied
+        decoded = _iter_decoded(body, coding)
+        if decoded is None:
+            raise HTTPError(415, f"Unsupported Content-Encoding: {repr(coding)}")
+
+        body, size, is_temp_file = BytesIO(), 0, False
+        try:
+            for part in decoded:
+                body.write(part)
+                size += len(part)
+                if size > max_size:
+                    raise HTTPError(413, 'Request entity too large')
+                if not is_temp_file and size > request.MEMFILE_MAX:
+                    body, tmp = NamedTemporaryFile(mode='w+b'), body
+                    body.write(tmp.getvalue())
+                    del tmp
+                    is_temp_file = True
+        except HTTPError:
+            raise
+        except Exception as err:        # zlib.error, zstandard.ZstdError
+            raise HTTPError(400, f"Invalid {coding} request body", exception=err)
+        body.seek(0)
+
+    environ = request.environ
+    environ['wsgi.input'] = environ['bottle.request.body'] = body
+    environ['CONTENT_LENGTH'] = str(size)
+    del environ['HTTP_CONTENT_ENCODING']
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    environ.pop('bottle.request.json', None)
+    environ.pop('bottle.request.post', None)
+    return True
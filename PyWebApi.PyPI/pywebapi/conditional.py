@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""conditional.py
+
+This module implements the entity tags (ETag) of the responses and the conditional requests (``If-None-Match``),
+so that a client polling an unchanged result receives a bodiless 304 Not Modified instead of the same content again.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import hashlib
+from typing import Union
+from bottle import Request, Response, HTTPError
+
+
+_SAFE_METHODS = ('GET', 'HEAD')
+
+
+def make_etag(content:Union[bytes, str]) -> str:
+    """Compute a strong entity tag over the formatted content of a response (a str is hashed by its UTF-8 encoding).
+
+    :return: The quoted entity tag, E.g. ``'"5d41402abc4b2a76b9719d911017c592"'``.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return '"' + hashlib.blake2b(content, digest_size=16).hexdigest() + '"'
+
+
+def _opaque_tag(etag:str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def if_none_match(request:Request, etag:str) -> bool:
+    """Check whether the ``If-None-Match`` header of the request matches an entity tag, by the weak comparison (RFC 7232).
+
+    :param request: The bottle.request object (current request).
+    :param etag: The entity tag of the current content.
+    :return: True if the client already has the current content.
+    """
+    header = request.get_header('If-None-Match')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+
+    opaque = _opaque_tag(etag)
+    return any(_opaque_tag(tag) == opaque for tag in header.split(','))
+
+
+def not_modified(request:Request, response:Response, etag:str, precondition:bool=True) -> bool:
+    """Set the ``ETag`` response header, and then evaluate the ``If-None-Match`` header of the request against it (RFC 7232):
+    a GET or HEAD whose entity tag matches is turned into a 304 Not Modified, any other method fails with 412 Precondition Failed.
+
+    :param request: The bottle.request object (current request).
+    :param response: The bottle.response object.
+    :param etag: The entity tag of the content, nothing is done if it is None.
+    :param precondition: Whether the ``If-None-Match`` of a method other than GET and HEAD is evaluated.
+        Pass False once the function has been called, a 412 can no longer prevent its effect then.
+    :return: True if the response has become a 304, then the caller should return an empty body.
+    :raise HTTPError: 412 if the request is neither GET nor HEAD and its ``If-None-Match`` matches the entity tag.
+    """
+    if not etag:
+        return False
+
+    response.set_header('ETag', etag)
+    if request.method not in _SAFE_METHODS:
+        if precondition and if_none_match(request, etag):
+            raise HTTPError(412, f"Precondition failed: the current entity tag {repr(etag)} matches If-None-Match")
+        return False
+
+    if if_none_match(request, etag):
+        response.status = 304
+        return True
+    return False
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""deadline.py
+
+This module implements the per-call timeout of user functions and the cooperative cancellation of timed out calls.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import time
+import threading
+from collections.abc import Mapping, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable
+
+
+class ExecutionTimeout(TimeoutError):
+    """The exception raised when a call of a user function does not complete within its timeout,
+    the web server should respond it as ``504 Gateway Timeout``."""
+    pass
+
+
+def time_limit(seconds:float):
+    """This decorator sets the timeout (in seconds) of a module level function, a shorter timeout passed to ``execute`` still takes precedence.
+
+    A plain module can also declare the timeouts of its functions without importing this package, by a module level dictionary
+    ``__pywebapi_timeout__ = {"function_name": seconds}``.
+    """
+    def decorator(func):
+        func.__pywebapi_timeout__ = seconds
+        return func
+    return decorator
+
+
+def get_timeout(route, timeout:float=None) -> float:
+    """Get the effective timeout of a call: the shorter one of the timeout declared by the function of a resolved route and the requested timeout.
+
+    :return: The timeout in seconds, or None if neither is set.
+    """
+    declared = getattr(route.function, '__pywebapi_timeout__', None)
+    if declared is None:
+        declared_timeouts = getattr(route.module, '__pywebapi_timeout__', None)
+        if isinstance(declared_timeouts, Mapping):
+            declared = declared_timeouts.get(route.function_name)
+
+    timeouts = [t for t in (declared, timeout) if isinstance(t, (int, float)) and not isinstance(t, bool) and t > 0]
+    return min(timeouts) if timeouts else None
+
+
+class CancellationToken(object):
+    """The cancellation state of a call with a timeout, a long-running user function should check it cooperatively (see ``is_cancelled``)."""
+    def __init__(self, timeout:float):
+        self.deadline = time.monotonic() + timeout
+        self._cancelled = threading.Event()
+
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or time.monotonic() >= self.deadline
+
+
+    def remaining(self) -> float:
+        """The number of seconds left before the deadline."""
+        return max(0.0, self.deadline - time.monotonic())
+
+
+_local = threading.local()
+
+
+def current_token() -> CancellationToken:
+    """Get the CancellationToken of the call running in the current thread, or None if the call has no timeout."""
+    return getattr(_local, 'token', None)
+
+
+def is_cancelled() -> bool:
+    """A user function with a timeout can call this function in its loops, and return as soon as it becomes True,
+    since the caller has already given up waiting for the result.
+
+    Coroutine functions (``async def``) are cancelled by ``asyncio`` directly, functions running in worker processes are killed.
+    """
+    token = current_token()
+    return token is not None and token.cancelled
+
+
+def check_cancelled():
+    """The same as ``is_cancelled``, but raises an ExecutionTimeout if the current call has been cancelled."""
+    if is_cancelled():
+        raise ExecutionTimeout("the call has been cancelled, since it did not complete within its timeout")
+
+
+def call_with_token(token:CancellationToken, call:Callable, *args, **kwargs):
+    """Run a call in the current thread with a CancellationToken."""
+    outer_token = current_token()
+    _local.token = token
+    try:
+        return call(*args, **kwargs)
+    finally:
+        _local.token = outer_token
+
+
+class TokenThreadPoolExecutor(ThreadPoolExecutor):
+    """A ThreadPoolExecutor which runs every job with the CancellationToken of a call,
+    E.g. as the default executor of the event loop of a coroutine function called with a timeout."""
+    def __init__(self, token:CancellationToken, max_workers:int=None):
+        super().__init__(max_workers)
+        self.token = token
+
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(call_with_token, self.token, fn, *args, **kwargs)
+
+
+def run_with_timeout(call:Callable, args, timeout:float, description:str):
+    """Run ``call(args)`` in a new daemon thread and wait for its result until the timeout,
+    a timed out call is cancelled cooperatively and keeps only its own thread until it returns.
+
+    :raise ExecutionTimeout: If the call does not complete within the timeout.
+    """
+    token = CancellationToken(timeout)
+    result = Future()
+
+    def target():
+        try:
+            result.set_result(call_with_token(token, call, args))
+        except BaseException as err:
+            result.set_exception(err)
+
+    threading.Thread(target=target, name='pywebapi-call', daemon=True).start()
+
+    try:
+        return result.result(timeout)
+    except FutureTimeoutError:
+        token.cancel()
+        raise timeout_error(description, timeout) from None
+
+
+def iter_until(iterator:Iterator, deadline:float, description:str, timeout:float):
+    """Iterate a streamed result until the deadline (a ``time.monotonic()`` value), the time limit is checked between items."""
+    try:
+        for item in iterator:
+            if time.monotonic() > deadline:
+                raise timeout_error(description, timeout)
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+def timeout_error(description:str, timeout:float) -> ExecutionTimeout:
+    return ExecutionTimeout(f"the call to {description} did not complete within {timeout} seconds")
@@ -8,9 +8,11 @@ This module implements the conversion from the result object returned by the fun
 | License: MIT (See LICENSE file in the repository root for details)
 """
 
-from collections import Iterable
-from collections.abc import MutableMapping
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, MutableMapping, Iterator
 from abc import ABCMeta, abstractmethod
+from typing import List, Tuple
 
 
 def _str_iterable_to_set(str_iterable) -> set:
@@ -22,6 +24,50 @@ def _str_iterable_to_set(str_iterable) -> set:
     return set()
 
 
+def _parse_accept(accept:str) -> List[tuple]:
+    """Parse an ``Accept`` header into [(type, subtype, q, index)], the media ranges with malformed q-values are ignored."""
+    ranges = []
+    for index, item in enumerate(accept.split(',')):
+        media_range, *params = item.split(';')
+        media_type, _, subtype = media_range.strip().lower().partition('/')
+        if not media_type or not subtype:
+            continue
+
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = None
+                break
+        if q is None or not 0 <= q <= 1:
+            continue
+
+        ranges.append((media_type, subtype.strip(), q, index))
+    return ranges
+
+
+def _match_accept(ranges:List[tuple], media_type:str) -> tuple:
+    """Find the most specific media range matching a concrete media type, return (q, specificity, -index) of it, or None if no range matches."""
+    media_type, _, subtype = media_type.partition('/')
+    best = None
+    for range_type, range_subtype, q, index in ranges:
+        if range_type == media_type and range_subtype == subtype:
+            specificity = 2
+        elif range_type == media_type and range_subtype == '*':
+            specificity = 1
+        elif range_type == '*' and range_subtype == '*':
+            specificity = 0
+        else:
+            continue
+
+        if best is None or specificity > best[1]:
+            best = (q, specificity, -index)
+    return best
+
+
 class MediaTypeFormatter(metaclass=ABCMeta):
     """This is the abstract base class for the concrete class of MediaTypeFormatter"""
 
@@ -40,7 +86,7 @@ class MediaTypeFormatter(metaclass=ABCMeta):
         """
         supported_media_types = this.supported_media_types
         if not supported_media_types:
-            raise NotImplementedError(f"property 'supported_media_types(self)' is not defined in {rept(this.__class__.__name__)}")
+            raise NotImplementedError(f"property 'supported_media_types(self)' is not defined in {repr(this.__class__.__name__)}")
 
         if isinstance(media_types, str):
             mt_set = _str_iterable_to_set(media_types)
@@ -65,14 +111,37 @@ class MediaTypeFormatter(metaclass=ABCMeta):
         pass
 
 
+    def format_iter(self, iterable:Iterable, media_type:str, **kwargs) -> Iterator:
+        """This method converts the elements of an iterable result (E.g. the results of a streamed batch call, or a generator returned by the function) 
+    to the target media type content incrementally. A concrete MediaTypeFormatter can override it to produce the content chunk by chunk 
+    as each element is available, the default implementation collects all elements into a list and formats them at once.
+
+    :param iterable: The iterable result.
+    :param media_type: The target media type.
+    :param kwargs: Other optional keyworded arguments will be passed to the provider that implements the format conversion.
+    :return: An iterator of the converted content chunks for a streamed response.
+        """
+        yield self.format(list(iterable), media_type, **kwargs)
+
+
 class MediaTypeFormatterManager(object):
     """This class manages all media type formatters that will be needed for responses. Pick the appropriate media type formatter for each request.
 
     :param default_formatter: The default MediaTypeFormatter can be registered when initializing this manager class, or it can be registered separately later.
+    :param cache_size: The maximum number of distinct ``Accept`` headers whose negotiation results are cached (least recently used ones are evicted).
+
+    The ``Accept`` header is negotiated with q-values and wildcards (E.g. ``text/*;q=0.5, application/json``):
+    the supported media type with the highest q-value wins, a more specific media range takes precedence over a wildcard, 
+    then the media range listed first by the client, then the default formatter and the earlier registered formatters. 
+    If the client accepts none of the supported media types, the default formatter is picked.
     """
-    def __init__(self, default_formatter:MediaTypeFormatter=None):
+    def __init__(self, default_formatter:MediaTypeFormatter=None, cache_size:int=256):
         self._register = []
         self._default_formatter = None
+        self._media_types = []      # [(media type, formatter)] of all supported media types in the order of precedence
+        self._cache = OrderedDict()     # {Accept header: (formatter, media type)}
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
 
         if default_formatter:
             self.register(default_formatter, True)
@@ -90,12 +159,12 @@ class MediaTypeFormatterManager(object):
 
         new_mts = _str_iterable_to_set(new_formatter.supported_media_types)
         if not new_mts:
-            raise TypeError(f"the {rept(new_formatter.__class__.__name__)} to be registered must support at least one media type")
+            raise TypeError(f"the {repr(new_formatter.__class__.__name__)} to be registered must support at least one media type")
 
         i = len(self._register) - 1
         while i >= 0:
             mtf = self._register[i]
-            if new_mts.issuperset(mtf):
+            if new_mts.issuperset(_str_iterable_to_set(mtf.supported_media_types)):
                 self._register[i] = new_formatter
                 break
             i -= 1
@@ -106,6 +175,27 @@ class MediaTypeFormatterManager(object):
         if set_as_default:
             self._default_formatter = new_formatter
 
+        self._compile()
+
+
+    def _compile(self):
+        """Precompute the supported media types of all registered formatters, and discard the cached negotiation results."""
+        media_types = []
+        seen = set()
+        formatters = [self._default_formatter] if self._default_formatter else []
+        formatters.extend(mtf for mtf in self._register if mtf is not self._default_formatter)
+
+        for mtf in formatters:
+            for mt in mtf.supported_media_types:
+                mt = mt.strip().lower()
+                if mt and mt not in seen:
+                    seen.add(mt)
+                    media_types.append((mt, mtf))
+
+        with self._lock:
+            self._media_types = media_types
+            self._cache.clear()
+
 
     @property
     def default_formatter(self) -> MediaTypeFormatter:
@@ -116,32 +206,64 @@ class MediaTypeFormatterManager(object):
             raise NotImplementedError("the default MediaTypeFormatter has not been registered")
 
 
-    def _get_formatter(self, media_types:str):
+    def _get_formatter(self, media_types:str) -> Tuple[MediaTypeFormatter, str]:
         if not self._register:
             raise NotImplementedError("no MediaTypeFormatter has been registered")
 
         if media_types:
-            for mtf in self._register:
-                ss = mtf.can_support_media_types(media_types)
-                if ss:
-                    return (mtf, ss.pop())
+            with self._lock:
+                resolved = self._cache.get(media_types)
+                if resolved is not None:
+                    self._cache.move_to_end(media_types)
+                    return resolved
+
+            resolved = self._negotiate(media_types) or self._default_pair()
+            with self._lock:
+                self._cache[media_types] = resolved
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+            return resolved
 
+        return self._default_pair()
+
+
+    def _default_pair(self) -> Tuple[MediaTypeFormatter, str]:
         return (self.default_formatter, self.default_formatter.supported_media_types[0])
 
 
+    def _negotiate(self, accept:str) -> Tuple[MediaTypeFormatter, str]:
+        """Pick the (formatter, media type) best matching an ``Accept`` header, or None if the client accepts none of the supported media types."""
+        ranges = _parse_accept(accept)
+        best = None
+        best_rank = None
+
+        for position, (media_type, mtf) in enumerate(self._media_types):
+            matched = _match_accept(ranges, media_type)
+            if matched is None or matched[0] <= 0:
+                continue
+            rank = matched + (-position,)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = (mtf, media_type), rank
+
+        return best
+
+
     def respond_as(self, obj, media_types:str, response_headers:MutableMapping, **kwargs):
         """This method picks a registered MediaTypeFormatter which matches the media type expected by the request, 
     and converts the original result object to the target media type content
 
-    :param obj: The original result object.
+    :param obj: The original result object. If it is an iterator (E.g. a generator), it will be converted by ``MediaTypeFormatter.format_iter``.
     :param media_types: The media type(s) expected by current request - it usually comes from the ``Accept`` header, separated by commas between multiple media types.
     :param response_headers: the response.headers.dict - if this argument is a dict container, the final matched media type information will be set back to the ``Content-Type`` header.
     :param kwargs: Other optional keyworded arguments will be passed to the provider that implements the format conversion.
-    :return: The converted content for response.
+    :return: The converted content for response, or an iterator of content chunks for a streamed response if the ``obj`` is an iterator.
         """
         formatter, media_type = self._get_formatter(media_types)
 
         if isinstance(response_headers, MutableMapping):
             response_headers['Content-Type'] = [media_type]
 
-        return formatter.format(obj, media_type, **kwargs)
+        if isinstance(obj, Iterator):
+            return formatter.format_iter(obj, media_type, **kwargs)
+        else:
+            return formatter.format(obj, media_type, **kwargs)
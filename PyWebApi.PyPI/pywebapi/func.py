@@ -9,21 +9,163 @@ This is the main module of the package.
 """
 
 import os
+import sys
 import site
+import time
+import types
 import inspect
+import builtins
 import importlib
-from collections import Iterable, OrderedDict
-from collections.abc import Mapping, MutableMapping
-from typing import Union, Dict, List
-
-from bottle import Request, FormsDict
+import importlib.abc
+import importlib.util
+import importlib.machinery
+import threading
+import itertools
+import functools
+import asyncio
+from collections import OrderedDict, namedtuple
+from collections.abc import Iterable, Mapping, MutableMapping, Iterator
+from typing import Union, Dict, List, Callable
+
+from bottle import Request, FormsDict, HTTPError
 from . import _util as util
+from .jsonstream import iter_json_array, peek_json_array
+from .columnar import ColumnarBatch, get_vectorized, rows_of
+from .compress import decode_request
+from .deadline import CancellationToken, TokenThreadPoolExecutor, get_timeout, current_token, call_with_token, run_with_timeout, iter_until, timeout_error
 
 
 ####################################################################################################
 # bind_arguments - implements flexible function arguments binding.
 #region
 #
+class ArgumentBinder(object):
+    """This class compiles the signature of a function once into a flat binding plan, 
+    so that each argument dictionary passed in later can be bound and applied to the function directly, 
+    without walking the signature again for every call (especially for every element of a batch call).
+
+    :param sig: The signature of the function.
+
+    The binding rules are the same as ``bind_arguments``:
+
+        - Named arguments are bound to keyword parameters defined by the function - Case Sensitive Matching;
+        - All values listed in the empty key (or blank key) are sequentially bound to positional parameters;
+        - Any extra arguments will be ignored without error.
+    """
+    def __init__(self, sig:inspect.Signature):
+        self.signature = sig
+        self._positional = []       # [(name, default)] of POSITIONAL_ONLY and POSITIONAL_OR_KEYWORD parameters
+        self._var_positional = None
+        self._keyword = []          # [(name, default)] of KEYWORD_ONLY parameters
+        self._var_keyword = None
+
+        for param in sig.parameters.values():
+            if param.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+                self._positional.append((param.name, param.default))
+            elif param.kind == inspect.Parameter.VAR_POSITIONAL:
+                self._var_positional = param.name
+            elif param.kind == inspect.Parameter.VAR_KEYWORD:
+                self._var_keyword = param.name
+            else:
+                self._keyword.append((param.name, param.default))
+
+        self._positional_index = {name: i for i, (name, _) in enumerate(self._positional)}
+
+
+    def bind(self, args:Mapping) -> tuple:
+        """Bind the passed argument dictionary to the parameters of the function.
+
+    :param args: A argument dictionary to be passed to the function.
+    :return: A tuple of (args, kwargs) which can be applied to the function directly.
+    :raise TypeError: If any required parameter can not be found from the passed arguments.
+        """
+        empty = inspect.Parameter.empty
+        in_pos_args = []
+        in_kw_args = {}
+
+        if args:
+            for name, value in args.items():
+                if name and name.strip():
+                    in_kw_args[name] = value
+                else:
+                    util.extend_or_append(in_pos_args, value)
+
+        out_args = []
+        out_kwargs = {}
+        pos_count = len(in_pos_args)
+        p = 0
+
+        for name, default in self._positional:
+            value = in_kw_args.pop(name, default)
+            if p < pos_count:
+                value = in_pos_args[p]
+                p += 1
+            out_args.append(value)
+
+        if self._var_positional:
+            del in_pos_args[:p]
+            kw_value = in_kw_args.pop(self._var_positional, empty)
+            if kw_value is not empty:
+                util.extend_or_append(in_pos_args, kw_value)
+            out_args.extend(in_pos_args)
+
+        for name, default in self._keyword:
+            out_kwargs[name] = in_kw_args.pop(name, default)
+
+        if self._var_keyword:
+            kw_value = in_kw_args.pop(self._var_keyword, empty)
+            if kw_value is not empty and isinstance(kw_value, Iterable) and not isinstance(kw_value, str):
+                try:
+                    vk = dict(kw_value)
+                except:
+                    in_kw_args.setdefault(self._var_keyword, kw_value)
+                else:
+                    for k, v in vk.items():
+                        if k:
+                            if not self._fill_missing(k, v, out_args, out_kwargs):
+                                in_kw_args.setdefault(k, v)
+            out_kwargs.update(in_kw_args)
+
+        self._check_missing(out_args, out_kwargs)
+        return out_args, out_kwargs
+
+
+    def _fill_missing(self, name:str, value, out_args:list, out_kwargs:dict) -> bool:
+        i = self._positional_index.get(name)
+        if i is not None:
+            if i < len(out_args) and out_args[i] is inspect.Parameter.empty:
+                out_args[i] = value
+                return True
+        elif out_kwargs.get(name, None) is inspect.Parameter.empty:
+            out_kwargs[name] = value
+            return True
+        return False
+
+
+    def _check_missing(self, out_args:list, out_kwargs:dict):
+        empty = inspect.Parameter.empty
+        missing_args = [repr(name) for (name, _), value in zip(self._positional, out_args) if value is empty]
+        missing_args.extend(repr(name) for name, _ in self._keyword if out_kwargs[name] is empty)
+
+        missing_count = len(missing_args)
+        if missing_count > 0:
+            missing_list = ', '.join(missing_args)
+            plural = 's' if missing_count > 1 else ''
+            error_msg = f"missing {missing_count} required argument{plural}: {missing_list}"
+            raise TypeError(error_msg) from None
+
+
+    def call(self, func, args:Mapping):
+        """Bind the passed argument dictionary and call the function with it.
+
+    :param func: The function compiled by this binder.
+    :param args: A argument dictionary to be passed to the function.
+    :return: The result object of the function returned.
+        """
+        out_args, out_kwargs = self.bind(args)
+        return func(*out_args, **out_kwargs)
+
+
 def bind_arguments(sig:inspect.Signature, args:Mapping) -> inspect.BoundArguments:
     """According to the signature of the function, create a mapping from the passed argument dictionary to the function parameters.
     This implementation is a variant of Signature.bind () in inspect module.
@@ -37,69 +179,51 @@ def bind_arguments(sig:inspect.Signature, args:Mapping) -> inspect.BoundArgument
 
     :return: A BoundArguments object.
     :raise TypeError: If any required parameter can not be found from the passed arguments.
+    
+    .. note::
+
+        For repeated calls to the same function, create an ``ArgumentBinder`` once and use it instead.
     """
-    in_pos_args = []
-    in_kw_args = {}
-    out_args = OrderedDict()
-
-    if args:
-        for name, value in args.items():
-            if name and name.strip():
-                in_kw_args[name] = value
-            else:
-                util.extend_or_append(in_pos_args, value)
+    out_args, out_kwargs = ArgumentBinder(sig).bind(args)
+    bound_arguments = sig.bind(*out_args, **out_kwargs)
+    bound_arguments.apply_defaults()
+    return bound_arguments
 
-    for param in sig.parameters.values():
-        kw_value = in_kw_args.pop(param.name, param.default)
 
-        if param.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
-            out_args[param.name] = in_pos_args.pop(0) if len(in_pos_args) > 0 else kw_value
-        elif param.kind == inspect.Parameter.VAR_POSITIONAL:
-            if kw_value is not inspect.Parameter.empty:
-                util.extend_or_append(in_pos_args, kw_value)
-            out_args[param.name] = tuple(in_pos_args)
-            #in_pos_args.clear()
-        elif param.kind == inspect.Parameter.VAR_KEYWORD:
-            if kw_value is not inspect.Parameter.empty:
-                if isinstance(kw_value, Iterable) and not isinstance(kw_value, str):
-                    try:
-                        vk = dict(kw_value)
-                    except:
-                        in_kw_arg.setdefault(param.name, kw_value)
-                    else:
-                        for k, v in vk.items():
-                            if k:
-                                before = out_args.get(k)
-                                if before is inspect.Parameter.empty:
-                                    out_args[k] = v
-                                else:
-                                    in_kw_arg.setdefault(k, v)
-            out_args[param.name] = in_kw_args
-            #in_kw_args.clear()
-        else:
-            out_args[param.name] = kw_value
+def _one_call(func, binder:ArgumentBinder, args:Mapping):
+    return binder.call(func, args)
+
+
+def _is_batch(args) -> bool:
+    """A batch of calls is a list of argument dictionaries, an iterator of them (E.g. ``RequestArguments.arguments`` in stream mode)
+    or a ``ColumnarBatch``."""
+    return isinstance(args, (list, Iterator, ColumnarBatch))
+
 
-    missing_args = [repr(k) for k, v in out_args.items() if v is inspect.Parameter.empty]
-    missing_count = len(missing_args)
-    if missing_count > 0:
-        missing_list = ', '.join(missing_args)
-        plural = 's' if missing_count > 1 else ''
-        error_msg = f"missing {missing_count} required argument{plural}: {missing_list}"
-        raise TypeError(error_msg) from None
+def _vectorized_arguments(args, array:str) -> Mapping:
+    if not isinstance(args, ColumnarBatch):
+        rows = list(args)
+        layers = {(id(row.shared), id(row.overrides)) for row in rows if isinstance(row, LayeredArguments)}
+        if rows and len(layers) == 1 and all(isinstance(row, LayeredArguments) for row in rows):
+            # pivot only the body items, the shared layers are passed as they are rather than repeated in every column
+            args = ColumnarBatch.from_rows([row.item for row in rows])
+            args.layer = functools.partial(LayeredArguments, shared=rows[0].shared, overrides=rows[0].overrides)
+        else:
+            args = ColumnarBatch.from_rows(rows)
 
-    return inspect.BoundArguments(sig, out_args)
+    return args.column_arguments(array) if len(args) else None
 
 
-def _one_call(func, sig:inspect.Signature, args:Mapping):
-    bound_arguments = bind_arguments(sig, args)
-    return func(*bound_arguments.args, **bound_arguments.kwargs)
+def _vectorized_result(result, stream:bool):
+    result = rows_of(result)
+    return iter(result) if stream and isinstance(result, list) else result
 
 
-def _bulk_call(func, sig:inspect.Signature, args_list:list):
+def _bulk_call(func, binder:ArgumentBinder, args_list:Iterable):
     i = 0
     for args in args_list:
         if isinstance(args, Mapping):
-            yield _one_call(func, sig, args)
+            yield binder.call(func, args)
         elif args is None:
             yield None
         else:
@@ -114,17 +238,160 @@ def _bulk_call(func, sig:inspect.Signature, args_list:list):
 # ModuleImporter - implements dynamic module loading.
 #region
 #
+# The per-directory namespace packages of isolated user modules: {directory: namespace package name}
+_isolated_namespaces = {}
+# {namespace package name: _IsolatedNamespace}
+_isolated_namespace_objects = {}
+_isolated_namespaces_lock = threading.Lock()
+_isolated_namespace_ids = itertools.count(1)
+_ISOLATED_NAMESPACE_PREFIX = '_pywebapi_isolated_'
+
+_builtin_import = builtins.__import__
+
+
+class _IsolatedNamespace(object):
+    """The namespace package of a directory of isolated user modules, and the builtins seen by its modules.
+
+    The ``__import__`` of these builtins resolves an absolute import of a sibling module (E.g. ``import helpers`` or ``from helpers import x``
+    of a ``helpers.py`` or a regular package ``helpers/__init__.py`` in the same directory) within the namespace package, so that same-named sibling modules of different directories do not clash,
+    without adding the directory to sys.path. Whether a top-level name is a sibling is looked up once (the result is kept until ``importlib.invalidate_caches``).
+    """
+    def __init__(self, directory:str, name:str):
+        self.directory = directory
+        self.name = name
+        self._siblings = {}     # {top-level module name: whether it is found in the directory}
+        self.builtins = dict(builtins.__dict__)
+        self.builtins['__import__'] = self._import
+
+
+    def _is_sibling(self, top_name:str) -> bool:
+        found = self._siblings.get(top_name)
+        if found is None:
+            spec = importlib.machinery.PathFinder.find_spec(top_name, [self.directory])
+            # a plain subdirectory (E.g. a data folder named "json") is found as a namespace package, which has no origin - it is not a sibling
+            found = self._siblings[top_name] = spec is not None and spec.origin not in (None, 'namespace')
+        return found
+
+
+    def _import(self, name:str, globals=None, locals=None, fromlist=(), level:int=0):
+        if level == 0 and name:
+            top_name = name.partition('.')[0]
+            if self._is_sibling(top_name):
+                module = _builtin_import(f'{self.name}.{name}', globals, locals, fromlist, 0)
+                return module if fromlist else sys.modules[f'{self.name}.{top_name}']
+        return _builtin_import(name, globals, locals, fromlist, level)
+
+
+class _IsolatedLoader(importlib.abc.Loader):
+    """Wraps the loader of a module in an isolated namespace package, to give the module the builtins of its namespace before it is executed."""
+    def __init__(self, loader, builtins:dict):
+        self._loader = loader
+        self._builtins = builtins
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__builtins__ = self._builtins
+        self._loader.exec_module(module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _IsolatedFinder(importlib.abc.MetaPathFinder):
+    """Finds the modules in the isolated namespace packages the same way as the default path finder, with an ``_IsolatedLoader``."""
+    def find_spec(self, fullname:str, path=None, target=None):
+        if not fullname.startswith(_ISOLATED_NAMESPACE_PREFIX):
+            return None
+        namespace = _isolated_namespace_objects.get(fullname.partition('.')[0])
+        if namespace is None or path is None:
+            return None
+
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is not None and spec.loader is not None:
+            spec.loader = _IsolatedLoader(spec.loader, namespace.builtins)
+        return spec
+
+    def invalidate_caches(self):
+        for namespace in list(_isolated_namespace_objects.values()):
+            namespace._siblings.clear()
+
+
+_isolated_finder = _IsolatedFinder()
+
+
+def _get_isolated_namespace(directory:str) -> str:
+    ns_name = _isolated_namespaces.get(directory)
+    if ns_name:
+        return ns_name
+
+    with _isolated_namespaces_lock:
+        ns_name = _isolated_namespaces.get(directory)
+        if not ns_name:
+            ns_name = f'{_ISOLATED_NAMESPACE_PREFIX}{next(_isolated_namespace_ids)}'
+
+            spec = importlib.machinery.ModuleSpec(ns_name, None, is_package=True)
+            spec.submodule_search_locations = [directory]
+            ns_package = importlib.util.module_from_spec(spec)
+            _isolated_namespace_objects[ns_name] = _IsolatedNamespace(directory, ns_name)
+            sys.modules[ns_name] = ns_package
+
+            if _isolated_finder not in sys.meta_path:
+                sys.meta_path.insert(0, _isolated_finder)
+
+            # The paths listed by the .pth files of this directory (E.g. its private packages) are added to sys.path once for all;
+            # the directory itself is not, its sibling modules are imported within the namespace package (see _IsolatedNamespace)
+            for name in sorted(n for n in os.listdir(directory) if n.endswith('.pth')):
+                site.addpackage(directory, name, None)
+
+            _isolated_namespaces[directory] = ns_name
+
+    return ns_name
+
+
+def _discard_isolated_namespace(directory:str):
+    with _isolated_namespaces_lock:
+        ns_name = _isolated_namespaces.pop(directory, None)
+        if ns_name:
+            sys.modules.pop(ns_name, None)
+            _isolated_namespace_objects.pop(ns_name, None)
+
+
+def _import_isolated(directory:str, module_name:str) -> types.ModuleType:
+    ns_module_name = _get_isolated_namespace(directory) + '.' + module_name
+    try:
+        return importlib.import_module(ns_module_name)
+    except ModuleNotFoundError as err:
+        if err.name == ns_module_name:
+            raise ModuleNotFoundError(f'No module named {repr(module_name)}', name=module_name) from None
+        raise
+
+
 class ModuleImporter(object):
     """This class manages the context of a user module to be dynamically imported.
 
     :param directory: The directory of being imported user module - the relative path from the configured root directory of all user modules.
     :param module_name: The module name to be imported.
+    :param isolated: A boolean value indicates whether to load the module in isolation mode, which is safe for concurrent requests.
+
+        - By default, the current working directory and sys.path are switched to the module directory during the context, 
+          they are process-global, so concurrent requests to modules in different directories must not be served in parallel;
+        - In isolation mode, the module is loaded through its own import spec under a namespace package keyed by the directory, 
+          so same-named modules in different directories do not clash - including the sibling modules imported by absolute imports
+          (E.g. ``import helpers``), which are resolved within the same namespace package. The current working directory is never changed 
+          (the module should locate its own data files by ``__file__``), and the directory itself is never added to sys.path 
+          (only the paths listed by its .pth files, once when the first module of the directory is loaded), nothing is switched per request.
     """
-    def __init__(self, directory:str, module_name:str):
+    def __init__(self, directory:str, module_name:str, isolated:bool=False):
         self.__orig_cwd = os.getcwd()
         self.__cwd_chg = False
 
-        if directory:
+        if directory and isolated:
+            self.__scope_cwd = self.__orig_cwd
+            self.module = _import_isolated(util.full_path(directory), module_name)
+            self.__added_sys_paths = []
+        elif directory:
             self.__scope_cwd = util.full_path(directory)
 
             if not util.same_path(self.__scope_cwd, self.__orig_cwd):
@@ -135,17 +402,19 @@ class ModuleImporter(object):
                 else:
                     self.__cwd_chg = True
 
-            orig_sys_path_set = util.get_sys_path_as_set()
-            # Insert this directory into sys.path
-            util.insert_sys_path(self.__scope_cwd, orig_sys_path_set)       # right after '' or '.', or at the first position
-            site.addsitedir(self.__scope_cwd)                               # handle .pth files in this directory
-            self.module = importlib.import_module(module_name)
+            # Insert this directory into sys.path right after '' or '.' (or at the first position), with the paths of its .pth files
+            self.__added_sys_paths = util.sys_path_registry.enter(self.__scope_cwd)
+            try:
+                self.module = importlib.import_module(module_name)
+            except BaseException:
+                self.__exit__(None, None, None)     # the context is never entered, restore it here
+                raise
             # Save changes for recovery on exit
-            self.__added_sys_path_set = util.get_sys_path_as_set().difference(orig_sys_path_set)
+            util.sys_path_registry.collect(self.__added_sys_paths)
         else:
             self.__scope_cwd = self.__orig_cwd
             self.module = importlib.import_module(module_name)
-            self.__added_sys_path_set = set()
+            self.__added_sys_paths = []
 
 
     def __enter__(self):
@@ -156,7 +425,7 @@ class ModuleImporter(object):
         if self.__cwd_chg and util.same_path(os.getcwd(), self.__scope_cwd):
             os.chdir(self.__orig_cwd)
 
-        util.remove_sys_path_set(self.__added_sys_path_set)
+        util.sys_path_registry.leave(self.__added_sys_paths)
 
 
     def invoke(self, func_name:str, args:Union[Dict, List[Dict]]={}):
@@ -172,31 +441,264 @@ class ModuleImporter(object):
         * If the args is a list of dictionaries:
             - This function will be called in loop by using each argument dictionary in the list.
 
-    :return: The result object of the module level function returned.
+    :return: The result object of the module level function returned (a coroutine function is awaited on a new event loop).
 
         * If the args is a dictionary, the result of the function execution is returned;
         * If the args is a list of dictionaries, all results of multiple executions of the function will be wrapped into a list and returned together.
 
         If any exception is thrown during the call loop, subsequent calls will be stopped.
         """
-        try:
-            module_level_function = getattr(self.module, func_name)
-            if not callable(module_level_function) or inspect.isclass(module_level_function):
-                raise TypeError(f'{repr(func_name)} is not a function')
-        except AttributeError as err:
-            raise NotImplementedError(str(err).replace(' no attribute ', ' no function '))
+        module_level_function = _get_module_level_function(self.module, func_name)
+        return _invoke(module_level_function, ArgumentBinder(inspect.signature(module_level_function)), args)
+
+
+def _get_module_level_function(module, func_name:str):
+    try:
+        module_level_function = getattr(module, func_name)
+        if not callable(module_level_function) or inspect.isclass(module_level_function):
+            raise TypeError(f'{repr(func_name)} is not a function')
+    except AttributeError as err:
+        message = str(err).replace(' no attribute ', ' no function ')
+        if module.__name__.startswith(_ISOLATED_NAMESPACE_PREFIX):   # hide the isolated namespace from the user
+            message = message.replace(repr(module.__name__), repr(module.__name__.partition('.')[2]))
+        raise NotImplementedError(message)
+    else:
+        return module_level_function
+
+
+def _invoke(func, binder:ArgumentBinder, args:Union[Dict, List[Dict]], stream:bool=False):
+    if inspect.iscoroutinefunction(func):
+        return _run_coroutine(_invoke_async(func, binder, args))
+
+    if isinstance(args, Mapping):
+        return _one_call(func, binder, args)
+    elif _is_batch(args):
+        array = get_vectorized(func)
+        if array is not None:       # the whole batch in a single call
+            columns = _vectorized_arguments(args, array)
+            return _vectorized_result(binder.call(func, columns), stream) if columns is not None else []
+        elif stream:
+            return _bulk_call(func, binder, args)
         else:
-            sig = inspect.signature(module_level_function)
+            return list(_bulk_call(func, binder, args))
+    else:
+        raise TypeError("'args' parameter only accepts a dictionary or a list of dictionaries")
+
+
+async def _invoke_async(func, binder:ArgumentBinder, args:Union[Dict, List[Dict]]):
+    """Invoke a coroutine function (``async def``) and await its result(s), a batch of calls is awaited sequentially."""
+    if isinstance(args, Mapping):
+        return await _one_call(func, binder, args)
+    elif _is_batch(args):
+        array = get_vectorized(func)
+        if array is not None:
+            columns = _vectorized_arguments(args, array)
+            return _vectorized_result(await binder.call(func, columns), False) if columns is not None else []
+
+        results = []
+        for awaitable in _bulk_call(func, binder, args):
+            results.append(None if awaitable is None else await awaitable)
+        return results
+    else:
+        raise TypeError("'args' parameter only accepts a dictionary or a list of dictionaries")
+
+
+def _run_coroutine(coro, token:CancellationToken=None):
+    """Run a coroutine to completion on a new event loop, for the synchronous callers (E.g. WSGI workers).
+    The CancellationToken of the call (the one of the current thread by default) is passed on to the threads of the default executor."""
+    if token is None:
+        token = current_token()
+
+    loop = asyncio.new_event_loop()
+    executor = None
+    if token is not None:
+        executor = TokenThreadPoolExecutor(token)
+        loop.set_default_executor(executor)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
 
-            if isinstance(args, Mapping):
-                return _one_call(module_level_function, sig, args)
-            elif isinstance(args, list):
-                if args:
-                    return list(_bulk_call(module_level_function, sig, args))
-                else:
-                    return []
+#endregion
+####################################################################################################
+
+
+####################################################################################################
+# RouteTable - caches the resolution from a routed path to a module level function.
+#region
+#
+ResolvedRoute = namedtuple('ResolvedRoute', ['directory', 'module_name', 'module', 'function_name', 'function', 'binder'])
+
+class _RouteNotFound(Exception):
+    """Wraps a failed lookup of a route which RouteTable remembers: the directory, the module file or the function itself is absent.
+    Any other error (E.g. a missing dependency or a bug at the module level, raised while executing the module) is not wrapped,
+    since it may be resolved without touching the module file."""
+    def __init__(self, error:Exception):
+        super().__init__(error)
+        self.error = error
+
+
+def _route_key(root:str, routed_path:str) -> tuple:
+    """Normalize a routed path, so that different spellings of the same route (E.g. 'mod.func', '/mod.func//') share one key."""
+    try:
+        module_func = util.extract_path_info(routed_path)
+    except (NameError, ModuleNotFoundError, NotADirectoryError):
+        return (root, routed_path)
+    return (root, os.path.normpath(module_func.directory), module_func.module, module_func.function)
+
+
+def _is_missing_module(err:ModuleNotFoundError, module_name:str) -> bool:
+    return err.name == module_name or module_name.startswith(f'{err.name}.')
+
+
+def _resolve_route(root:str, routed_path:str, isolated:bool) -> ResolvedRoute:
+    """Resolve a routed path to a module level function.
+
+    :raise _RouteNotFound: If the route does not exist, any other error of importing the module is raised as it is.
+    """
+    public_root = util.full_path(root)
+    if not os.path.isdir(public_root):
+        raise _RouteNotFound(NotADirectoryError(f'the root {repr(root)} of user modules is not configured as a valid file system directory'))
+
+    try:
+        module_func = util.extract_path_info(routed_path)
+    except (NameError, ModuleNotFoundError, NotADirectoryError) as err:
+        raise _RouteNotFound(err)
+
+    work_dir = os.path.normpath(os.path.join(public_root, module_func.directory))
+    if not os.path.isdir(work_dir):
+        raise _RouteNotFound(NotADirectoryError(f'the directory {repr(module_func.directory)} specified in the request URL path cannot be found in the file system'))
+
+    try:
+        importer = ModuleImporter(work_dir, module_func.module, isolated)
+    except ModuleNotFoundError as err:
+        if _is_missing_module(err, module_func.module):
+            raise _RouteNotFound(err)
+        raise
+
+    with importer:
+        try:
+            module_level_function = _get_module_level_function(importer.module, module_func.function)
+        except (NotImplementedError, TypeError) as err:
+            raise _RouteNotFound(err)
+
+    return ResolvedRoute(directory=work_dir, module_name=module_func.module, module=importer.module,
+                         function_name=module_func.function, function=module_level_function,
+                         binder=ArgumentBinder(inspect.signature(module_level_function)))
+
+
+class RouteTable(object):
+    """This class maps each ``(root, routed_path)`` to its resolved module, function and compiled ArgumentBinder after the first hit,
+    so that subsequent requests to the same route can skip the path checks, the module import and the function inspection.
+
+    Failed lookups (missing directory, module or function) are remembered as well, so that repeated requests to a missing route stay cheap.
+    An error raised while executing the module (E.g. a missing third-party dependency) is never remembered, the next request tries to import it again.
+    Cached routes are only dropped by an explicit ``invalidate`` (e.g. after user modules have been redeployed).
+    The routed paths are normalized, different spellings of the same route (E.g. ``dir/mod.func`` and ``/dir/mod.func//``) share one entry.
+
+    :param max_failures: The maximum number of failed lookups to be remembered, the least recently used ones are discarded first.
+    :param isolated: A boolean value indicates whether user modules are loaded in isolation mode (see ``ModuleImporter``), 
+        so that ``execute`` can call them without switching the current working directory and sys.path for each request.
+    """
+    def __init__(self, max_failures:int=1024, isolated:bool=False):
+        self.isolated = isolated
+        self._lock = threading.RLock()
+        self._import_lock = threading.RLock()   # serializes the resolutions which switch the process-global working directory and sys.path
+        self._resolving = {}                    # {key: Lock} of the routes being resolved in isolation mode
+        self._routes = {}
+        self._failures = OrderedDict()
+        self._max_failures = max_failures
+
+
+    def resolve(self, root:str, routed_path:str) -> ResolvedRoute:
+        """Resolve a routed path to a module level function, from the cache if it has been resolved before.
+
+    In isolation mode, different routes can be resolved (imported) in parallel, concurrent first hits to the same route wait for a single resolution.
+
+    :param root: The root directory for centrally organizing user modules.
+    :param routed_path: The ``path/module.function`` path comes from URL routing.
+    :return: A ResolvedRoute namedtuple of (directory, module_name, module, function_name, function, binder).
+    :raise NotADirectoryError, ModuleNotFoundError, NotImplementedError, NameError, TypeError: If the route cannot be resolved, this time or a previous time.
+        Any other error of importing the module is raised as it is.
+        """
+        key = _route_key(root, routed_path)
+
+        route = self._routes.get(key)
+        if route is not None:
+            return route
+
+        with self._lock:
+            self._raise_failure(key)
+            if self.isolated:
+                resolving_lock = self._resolving.setdefault(key, threading.Lock())
             else:
-                raise TypeError("'args' parameter only accepts a dictionary or a list of dictionaries")
+                resolving_lock = self._import_lock
+
+        with resolving_lock:
+            route = self._routes.get(key)
+            if route is not None:
+                return route
+
+            try:
+                with self._lock:
+                    self._raise_failure(key)
+
+                try:
+                    route = _resolve_route(root, routed_path, self.isolated)
+                except _RouteNotFound as not_found:
+                    err = not_found.error
+                    with self._lock:
+                        self._failures[key] = (type(err), err.args)
+                        if len(self._failures) > self._max_failures:
+                            self._failures.popitem(last=False)
+                    raise err from None
+
+                self._routes[key] = route
+                return route
+            finally:
+                if self.isolated:
+                    with self._lock:
+                        self._resolving.pop(key, None)
+
+
+    def _raise_failure(self, key:tuple):
+        failure = self._failures.get(key)
+        if failure is not None:
+            self._failures.move_to_end(key)
+            error_type, error_args = failure
+            raise error_type(*error_args)
+
+
+    def lookup(self, root:str, routed_path:str) -> ResolvedRoute:
+        """Get a route only if it has been resolved successfully and cached, without any file system access or import.
+
+    :return: The cached ResolvedRoute, or None if it has not been resolved yet.
+        """
+        return self._routes.get(_route_key(root, routed_path))
+
+
+    def invalidate(self, directory:str=None):
+        """Discard cached routes, so that they will be resolved again on the next request.
+
+    :param directory: Only discard the routes to modules in this directory (or its subdirectories). All routes will be discarded if it is omitted.
+        All remembered lookup failures are always discarded, since any newly deployed file may resolve them.
+        """
+        with self._lock:
+            if directory:
+                scope = util.full_path(directory)
+                prefix = os.path.join(scope, '')
+                for key, route in list(self._routes.items()):
+                    if route.directory == scope or route.directory.startswith(prefix):
+                        del self._routes[key]
+            else:
+                self._routes.clear()
+
+            self._failures.clear()
+
+
+default_route_table = RouteTable()
 
 #endregion
 ####################################################################################################
@@ -206,7 +708,8 @@ class ModuleImporter(object):
 # execute - implements the main entrance: execute(...).
 #region
 #
-def execute(root:str, routed_path:str, args_dict:Union[Dict, List[Dict]]={}):
+def execute(root:str, routed_path:str, args_dict:Union[Dict, List[Dict]]={}, route_table:RouteTable=None, process_pool=None, batch_executor=None, stream:bool=False,
+            single_flight=None, timeout:float=None):
     """This is the main entry point for dynamically executing a function from a specified module path.
 
     :param root: The root directory for centrally organizing user modules.
@@ -221,6 +724,27 @@ def execute(root:str, routed_path:str, args_dict:Union[Dict, List[Dict]]={}):
             - Any extra arguments will be ignored without error.
         * If the ``args_dict`` is a list of dictionaries:
             - The specified function will be called in loop by using each argument dictionary in the list.
+        * If the ``args_dict`` is an iterator of dictionaries (``RequestArguments(request, stream=True).arguments`` of a JSON array body):
+            - The same as a list, but each argument dictionary is taken from the iterator only when its call is about to be made,
+              pass ``stream=True`` as well to keep the memory bounded by a window of items.
+
+    :param route_table: The RouteTable that caches resolved routes, the module level ``default_route_table`` is used if it is omitted.
+        Use a ``RouteTable(isolated=True)`` to serve concurrent requests safely in a threaded or async server.
+    :param process_pool: An optional ``pool.ProcessPool``, the functions it accepts (per directory or per function) are executed in its worker processes.
+    :param batch_executor: An optional ``batch.BatchExecutor`` to opt in the concurrent batch mode - if the ``args_dict`` is a list of dictionaries, 
+        the calls are executed concurrently and each item reports its own success or error (see ``BatchExecutor``).
+    :param stream: A boolean value indicates whether to return the results of a batch call as an iterator, which calls the function for each item 
+        only when it is iterated, so that the results can be formatted and sent incrementally (see ``MediaTypeFormatter.format_iter``).
+    :param single_flight: An optional ``cache.SingleFlight`` to coalesce identical concurrent calls (and duplicate batch items) of pure functions.
+    :param timeout: An optional number of seconds to wait for the result, the shorter one of it and the timeout declared by the function 
+        (see ``deadline.time_limit``) takes effect. If the call does not complete in time, an ``ExecutionTimeout`` is raised and:
+
+        - A call running in a thread is cancelled cooperatively (see ``deadline.is_cancelled``), it keeps only its own thread until it returns
+          (the threads of a concurrent batch, and the executor threads of a coroutine function, see the same cancellation).
+          If the RouteTable is not in isolation mode, the working directory and sys.path of the module are restored as soon as the call
+          times out, not when its thread returns;
+        - A call dispatched to the ``process_pool`` is cancelled if it has not started yet, otherwise its worker process is killed and replaced;
+        - A streamed result (an iterator) is checked against the deadline between items.
 
     :return: The result object of the module level function returned.
 
@@ -229,18 +753,151 @@ def execute(root:str, routed_path:str, args_dict:Union[Dict, List[Dict]]={}):
 
         If any exception is thrown during the call loop, subsequent calls will be stopped.
     """
-    public_root = util.full_path(root)
-    if not os.path.isdir(public_root):
-        raise NotADirectoryError(f'the root {repr(root)} of user modules is not configured as a valid file system directory')
+    if route_table is None:
+        route_table = default_route_table
+
+    route = route_table.resolve(root, routed_path)
+    timeout = get_timeout(route, timeout)
+    start = time.monotonic()
+    in_process = timeout is not None and _dispatched_to_process(route, args_dict, process_pool, batch_executor)
+
+    scoped = not route_table.isolated and timeout is not None and not in_process      # the module scope is entered by the waiting thread
+    call = functools.partial(_execute_route, route, isolated=route_table.isolated or scoped, process_pool=process_pool, batch_executor=batch_executor,
+                             stream=stream, timeout=timeout if in_process else None)
+    if single_flight is not None:
+        call = functools.partial(single_flight.execute, route, call=call)
+
+    if timeout is None:
+        return call(args_dict)
+    elif in_process:
+        return_object = call(args_dict)
+    else:
+        return_object = _run_with_timeout(route, call, args_dict, timeout, scoped=not route_table.isolated)
 
-    module_func = util.extract_path_info(routed_path)
-    work_dir = os.path.normpath(os.path.join(public_root, module_func.directory))
-    if not os.path.isdir(work_dir):
-        raise NotADirectoryError(f'the directory {repr(module_func.directory)} specified in the request URL path cannot be found in the file system')
+    if isinstance(return_object, Iterator):
+        return_object = iter_until(return_object, start + timeout, _describe(route), timeout)
+    return return_object
+
+
+def _run_with_timeout(route:ResolvedRoute, call:Callable, args_dict:Union[Dict, List[Dict]], timeout:float, scoped:bool):
+    """Run a call in its own thread until the timeout. If ``scoped`` (not in isolation mode), the module scope (the process-global working directory and sys.path)
+    is entered and left by the waiting thread rather than by the call, so that a timed out call which keeps running does not hold it while the following requests run.
+    The ``call`` must not enter the module scope itself then."""
+    if not scoped:
+        return run_with_timeout(call, args_dict, timeout, _describe(route))
+
+    with ModuleImporter(route.directory, route.module_name):
+        return_object = run_with_timeout(call, args_dict, timeout, _describe(route))
+
+    if isinstance(return_object, Iterator):
+        return_object = _iter_in_scope(route, return_object)
+    return return_object
+
+
+def _describe(route:ResolvedRoute) -> str:
+    return repr(f'{route.module_name}.{route.function_name}')
+
+
+def _dispatched_to_process(route:ResolvedRoute, args_dict:Union[Dict, List[Dict]], process_pool, batch_executor) -> bool:
+    return (process_pool is not None and process_pool.accepts(route)) and not _batch_executed(args_dict, route, batch_executor)
+
+
+def _batch_executed(args_dict, route:ResolvedRoute, batch_executor) -> bool:
+    """Whether a call goes to the concurrent batch mode - a vectorized function always takes the whole batch in a single call."""
+    return batch_executor is not None and _is_batch(args_dict) and get_vectorized(route.function) is None
+
+
+def _execute_route(route:ResolvedRoute, args_dict:Union[Dict, List[Dict]], isolated:bool, process_pool, batch_executor=None, stream:bool=False, timeout:float=None):
+    if isolated:
+        return _dispatch_route(route, args_dict, process_pool, batch_executor, stream, timeout)
+
+    with ModuleImporter(route.directory, route.module_name):
+        return_object = _dispatch_route(route, args_dict, process_pool, batch_executor, stream, timeout)
+
+    if isinstance(return_object, Iterator):
+        # an iterator (E.g. a generator) is consumed after the call returns, so it has to enter the module context again
+        return_object = _iter_in_scope(route, return_object)
+
+    return return_object
+
+
+def _dispatch_route(route:ResolvedRoute, args_dict:Union[Dict, List[Dict]], process_pool, batch_executor, stream:bool, timeout:float=None):
+    if _batch_executed(args_dict, route, batch_executor):
+        if stream:
+            return batch_executor.iter_invoke(route, args_dict, process_pool)
+        else:
+            return batch_executor.invoke(route, args_dict, process_pool)
+    elif process_pool is not None and process_pool.accepts(route):
+        return process_pool.invoke(route, args_dict, timeout)
+    else:
+        return _invoke(route.function, route.binder, args_dict, stream)
 
-    with ModuleImporter(work_dir, module_func.module) as starter:
-        return_object = starter.invoke(module_func.function, args_dict)
 
+def _iter_in_scope(route:ResolvedRoute, iterator:Iterator):
+    with ModuleImporter(route.directory, route.module_name):
+        yield from iterator
+
+
+async def execute_async(root:str, routed_path:str, args_dict:Union[Dict, List[Dict]]={}, route_table:RouteTable=None, process_pool=None, batch_executor=None, stream:bool=False,
+                        single_flight=None, timeout:float=None):
+    """This is the asynchronous counterpart of ``execute`` for the event loop of an async (E.g. ASGI) server, it takes the same arguments.
+
+    - A coroutine function (``async def``) is awaited on the running event loop directly;
+    - A regular function (or a function dispatched to the ``process_pool``) is run in the default executor of the event loop, 
+      so it does not block the event loop;
+    - The first resolution of a route (which may import the module) is also run in the default executor;
+    - A coroutine function which does not complete within the ``timeout`` is cancelled by ``asyncio``.
+
+    The ``route_table`` should be in isolation mode (``RouteTable(isolated=True)``), since requests are served concurrently.
+    """
+    if route_table is None:
+        route_table = default_route_table
+
+    loop = asyncio.get_running_loop()
+
+    route = route_table.lookup(root, routed_path)
+    if route is None:
+        route = await loop.run_in_executor(None, route_table.resolve, root, routed_path)
+
+    timeout = get_timeout(route, timeout)
+    start = time.monotonic()
+
+    if batch_executor is None and inspect.iscoroutinefunction(route.function) and not (process_pool is not None and process_pool.accepts(route)):
+        if single_flight is not None and isinstance(args_dict, Mapping):
+            awaitable = single_flight.execute_async(route, args_dict, functools.partial(_invoke_async, route.function, route.binder))
+        else:
+            awaitable = _invoke_async(route.function, route.binder, args_dict)
+
+        if timeout is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise timeout_error(_describe(route), timeout) from None
+
+    in_process = timeout is not None and _dispatched_to_process(route, args_dict, process_pool, batch_executor)
+    scoped = not route_table.isolated and timeout is not None and not in_process      # the module scope is entered by the waiting thread
+    call = functools.partial(_execute_route, route, isolated=route_table.isolated or scoped, process_pool=process_pool, batch_executor=batch_executor,
+                             stream=stream, timeout=timeout if in_process else None)
+    if single_flight is not None:
+        call = functools.partial(single_flight.execute, route, call=call)
+
+    if timeout is None:
+        return await loop.run_in_executor(None, call, args_dict)
+    elif in_process:
+        return_object = await loop.run_in_executor(None, call, args_dict)
+    elif scoped:
+        return_object = await loop.run_in_executor(None, _run_with_timeout, route, call, args_dict, timeout, True)
+    else:
+        token = CancellationToken(timeout)
+        try:
+            return_object = await asyncio.wait_for(loop.run_in_executor(None, call_with_token, token, call, args_dict), timeout)
+        except asyncio.TimeoutError:
+            token.cancel()
+            raise timeout_error(_describe(route), timeout) from None
+
+    if isinstance(return_object, Iterator):
+        return_object = iter_until(return_object, start + timeout, _describe(route), timeout)
     return return_object
 
 #endregion
@@ -278,25 +935,180 @@ def _fill_dict(arg_dict:MutableMapping, forms_dict:FormsDict):
         _fill_dict_multi_value(arg_dict, name, values)
 
 
-def _init_dict_list(json_obj) -> List[Dict]:
+def _init_dict_list(json_obj) -> List[Mapping]:
     if json_obj is None:
         return [{}]
     if isinstance(json_obj, Mapping):
-        return [dict(json_obj)]
+        return [json_obj]
     elif isinstance(json_obj, list):
         if all(isinstance(item, Mapping) for item in json_obj):
-            return [dict(item) for item in json_obj]
+            return json_obj
         else:
-            return [{'': list(json_obj)}]
+            return [{'': json_obj}]
     else:
         return [{'': json_obj}]
 
 
+class LayeredArguments(Mapping):
+    """A read-only argument dictionary of one call, which is a view over three layers rather than a merged copy of them:
+
+        1. The argument dictionary of the call from the request body (one item of a batch);
+        2. The arguments from the query string, shared by all calls of a batch;
+        3. The arguments overridden by the server (E.g. ``actual_username``), also shared by all calls of a batch.
+
+    A value is resolved only when it is looked up (by the ArgumentBinder at bind time), by the same merging rules as ``RequestArguments``,
+    so a batch of N items with M query string arguments costs N views instead of N × M copied entries.
+
+    :param item: The argument dictionary from the request body.
+    :param shared: The arguments from the query string, already merged by themselves.
+    :param overrides: The arguments overridden by the server, they always take precedence.
+    """
+    __slots__ = ('item', 'shared', 'overrides')
+
+    def __init__(self, item:Mapping, shared:Mapping, overrides:Mapping):
+        self.item = item
+        self.shared = shared
+        self.overrides = overrides
+
+    def __getitem__(self, key:str):
+        overrides = self.overrides
+        if key in overrides:
+            return overrides[key]
+
+        item = self.item
+        if key not in self.shared:
+            return item[key]
+        value = self.shared[key]
+        if key not in item:
+            return value
+
+        existing = item[key]
+        if not key:     # positional arguments: the query string ones are appended to the body ones
+            return (existing if isinstance(existing, list) else [existing]) + value
+        elif isinstance(existing, list):
+            return existing + (value if isinstance(value, list) else [value])
+        elif value and not existing:
+            return value
+        elif existing is None and value is not None:
+            return value
+        else:
+            return existing
+
+    def __contains__(self, key) -> bool:
+        return key in self.overrides or key in self.item or key in self.shared
+
+    def __iter__(self):
+        overrides = self.overrides
+        yield from overrides
+        for key in self.item:
+            if key not in overrides:
+                yield key
+        for key in self.shared:
+            if key not in overrides and key not in self.item:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def _init_columnar_batch(json_obj, layer) -> ColumnarBatch:
+    if not isinstance(json_obj, Mapping):
+        raise HTTPError(400, "a columnar batch must be a JSON object of column name to the array of values")
+    try:
+        return ColumnarBatch(json_obj, layer)
+    except ValueError as err:
+        raise HTTPError(400, str(err))
+
+
+_body_decoders = {}     # {media type: decoder} of the request bodies other than JSON
+
+
+def register_body_decoder(media_type:str, decoder:Callable[[bytes], object]):
+    """Register a decoder of the request bodies in a media type other than JSON (E.g. ``application/msgpack``), 
+    so that ``RequestArguments`` takes the arguments from such bodies the same way as from a JSON body.
+
+    :param media_type: The ``Content-Type`` of the request bodies.
+    :param decoder: A function which decodes the whole body (bytes) into a dictionary, a list of dictionaries, or any other value (as positional arguments).
+    """
+    _body_decoders[media_type.strip().lower()] = decoder
+
+
+def _content_type(request:Request) -> str:
+    return request.environ.get('CONTENT_TYPE', '').lower().split(';')[0].strip()
+
+
+def _is_json_request(request:Request) -> bool:
+    return _content_type(request) in ('application/json', 'application/json-rpc')
+
+
+def _decode_body(request:Request):
+    content_type = _content_type(request)
+    decoder = _body_decoders.get(content_type)
+    if decoder is None:
+        return request.json
+
+    body = request.body.read()
+    if not body:
+        return None
+    try:
+        return decoder(body)
+    except Exception:
+        raise HTTPError(400, f'Invalid {content_type}')
+
+
+def _query_params(request:Request) -> FormsDict:
+    """The supplementary arguments - a body which carries the arguments itself must not be parsed as a form again."""
+    return request.query if _is_json_request(request) or _content_type(request) in _body_decoders else request.params
+
+
+def _iter_json_body(request:Request):
+    """Parse the JSON array body of a request incrementally, return None if the body is not a JSON array of dictionaries."""
+    if not _is_json_request(request) or request.content_length == 0:
+        return None
+
+    body = request.body
+    if not peek_json_array(body):
+        return None
+
+    items = iter_json_array(body)
+    try:
+        first = next(items, None)
+    except ValueError:
+        raise HTTPError(400, 'Invalid JSON')
+
+    if not isinstance(first, Mapping):      # a JSON array of positional arguments for a single call
+        body.seek(0)
+        return None
+
+    def iter_items():
+        yield first
+        try:
+            yield from items
+        except ValueError:      # json.JSONDecodeError
+            raise HTTPError(400, 'Invalid JSON')
+    return iter_items()
+
+
 class RequestArguments(object):
-    """This class is used to gather all arguments information from the request body (if JSON) and the URL query string,
-    then merge them into a dictionary or a list of dictionary.
+    """This class is used to gather all arguments information from the request body (if JSON, or any media type registered by ``register_body_decoder``) 
+    and the URL query string, then merge them into a dictionary or a list of dictionary.
 
     :param request: The request object passed from bottle.
+    :param columnar: A boolean value indicates whether the JSON body is a batch in the columnar shape - a dictionary of column name 
+        to the array of values, E.g. ``{"ccy": ["USD", "EUR"], "amount": [100, 200]}`` is a batch of 2 calls. Then ``arguments`` is a ``ColumnarBatch``, 
+        which is passed to a vectorized function (see ``columnar.vectorized``) in a single call, or to any other function row by row.
+    :param stream: A boolean value indicates whether to parse a JSON array body incrementally. If it is True and the body is a JSON array of dictionaries,
+        ``arguments`` is an iterator which parses the next argument dictionary only when it is requested, so that a huge batch body 
+        (which is spooled to a temporary file by bottle) never has to be decoded as a whole - pass ``stream=True`` to ``execute`` as well, 
+        then the memory is bounded by a window of items rather than the size of the body. 
+        In this mode, the first element of the array determines the type of the request: a batch if it is a dictionary, 
+        otherwise the whole array is treated as the positional arguments of a single call.
+
+    A compressed request body (``Content-Encoding: gzip``, ``deflate`` or ``zstd``) is decoded transparently by ``compress.decode_request``,
+    call it beforehand to decode with a different limit of the decoded size.
 
     .. note::
 
@@ -313,31 +1125,53 @@ class RequestArguments(object):
     
         Other arguments in the query string are added to current argument dictionary for each function call (same way as above).
     """
-    def __init__(self, request:Request):
+    def __init__(self, request:Request, stream:bool=False, columnar:bool=False):
+        decode_request(request)
+
         self.request = request
-        self.arg_dict_list = _init_dict_list(request.json)
+        self._shared = {}
+        self._overrides = {}
+        self._arg_dict_iter = _iter_json_body(request) if stream and not columnar else None
+
+        _fill_dict(self._shared, _query_params(request))
 
-        for arg_dict in self.arg_dict_list:
-            _fill_dict(arg_dict, request.params)
+        if columnar:
+            self.arg_dict_list = _init_columnar_batch(_decode_body(request), functools.partial(LayeredArguments, shared=self._shared, overrides=self._overrides))
+        elif self._arg_dict_iter is None:
+            self.arg_dict_list = [LayeredArguments(item, self._shared, self._overrides) for item in _init_dict_list(_decode_body(request))]
+        else:
+            self.arg_dict_list = None
+            self._arg_dict_iter = self._iter_arguments(self._arg_dict_iter)
+
+    def _iter_arguments(self, items:Iterator) -> Iterator[Mapping]:
+        for item in items:
+            if isinstance(item, Mapping):
+                yield LayeredArguments(item, self._shared, self._overrides)
+            else:
+                yield item      # to be reported as an invalid item by the call
 
     @property
-    def arguments(self) -> Union[Dict, List[Dict]]:
-        """An argument dictionary or a list of dictionary that can be used to provide the required argument `args_dict` for `execute` function."""
+    def arguments(self) -> Union[Mapping, List[Mapping], Iterator[Mapping], ColumnarBatch]:
+        """An argument dictionary or a list of dictionary that can be used to provide the required argument `args_dict` for `execute` function
+        (an iterator of argument dictionaries in stream mode, a ``ColumnarBatch`` in columnar mode). 
+        Each argument dictionary is a read-only ``LayeredArguments`` view."""
+        if self._arg_dict_iter is not None:
+            return self._arg_dict_iter
+        if isinstance(self.arg_dict_list, ColumnarBatch):
+            return self.arg_dict_list
         return self.arg_dict_list if len(self.arg_dict_list) > 1 else self.arg_dict_list[0]
 
-    def override(self, override_dict:Mapping) -> Union[Dict, List[Dict]]:
+    def override(self, override_dict:Mapping) -> Union[Mapping, List[Mapping]]:
         if override_dict and isinstance(override_dict, Mapping):
             for name, value in override_dict:
                 key = name.strip() if name else ''
                 if key:
-                    for arg_dict in self.arg_dict_list:
-                        arg_dict[key] = value
+                    self.override_value(key, value)
 
         return self.arguments
 
-    def override_value(self, key:str, value) -> Union[Dict, List[Dict]]:
-        for arg_dict in self.arg_dict_list:
-            arg_dict[key] = value
+    def override_value(self, key:str, value) -> Union[Mapping, List[Mapping]]:
+        self._overrides[key] = value        # one layer shared by all argument dictionaries
 
         return self.arguments
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""jsonstream.py
+
+This module implements an incremental parser of a top-level JSON array, so that a huge batch body can be consumed item by item.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import json
+import codecs
+from typing import Iterator, BinaryIO
+
+
+_WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class _Buffer(object):
+    """A window of decoded text over a binary stream, the consumed text is dropped as the window moves forward."""
+    def __init__(self, fp:BinaryIO, chunk_size:int):
+        self._fp = fp
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.chunk_size = chunk_size
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+
+    def fill(self, size:int=None) -> bool:
+        """Read more text into the window, return False at the end of the stream."""
+        if self.eof:
+            return False
+
+        data = self._fp.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+            self.text += self._decoder.decode(b'', final=True)
+            return False
+
+        if self.pos > self.chunk_size:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        self.text += self._decoder.decode(data)
+        return True
+
+
+    def skip_whitespace(self) -> str:
+        """Move to the next non-whitespace character and return it, or return '' at the end of the stream."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+
+    def decode_value(self):
+        """Decode the JSON value starting at the current position, reading more text until the value is complete."""
+        read_size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill(read_size):
+                    raise
+            else:
+                # a number or a literal ending exactly at the end of the window may continue in the next chunk
+                if end < len(self.text) or not self.fill(read_size):
+                    self.pos = end
+                    return value
+                continue
+            read_size *= 2      # a huge item is re-scanned only a logarithmic number of times
+
+
+def iter_json_array(fp:BinaryIO, chunk_size:int=65536) -> Iterator:
+    """Parse a top-level JSON array from a binary stream incrementally, and yield each element as soon as it has been parsed,
+    so that the memory is bounded by the size of the largest element rather than the size of the whole array.
+
+    :param fp: A binary file-like object (E.g. ``request.body`` of bottle) positioned at the start of the JSON text.
+    :param chunk_size: The number of bytes to read at a time.
+    :raise ValueError: If the JSON text is not an array (``json.JSONDecodeError`` if the JSON text is malformed).
+    """
+    buffer = _Buffer(fp, chunk_size)
+
+    if buffer.skip_whitespace() != '[':
+        raise ValueError("the JSON text is not an array")
+    buffer.pos += 1
+
+    if buffer.skip_whitespace() == ']':
+        buffer.pos += 1
+    else:
+        while True:
+            yield buffer.decode_value()
+
+            c = buffer.skip_whitespace()
+            buffer.pos += 1
+            if c == ']':
+                break
+            elif c != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer.text, buffer.pos - 1)
+            buffer.skip_whitespace()
+
+    if buffer.skip_whitespace():
+        raise json.JSONDecodeError("Extra data", buffer.text, buffer.pos)
+
+
+def peek_json_array(fp:BinaryIO) -> bool:
+    """Check whether the JSON text of a seekable binary stream starts with an array, the stream position is restored."""
+    start = fp.tell()
+    try:
+        head = fp.read(64)
+        while head and not head.lstrip(b' \t\n\r\xef\xbb\xbf'):
+            head = fp.read(64)
+        return head.lstrip(b' \t\n\r\xef\xbb\xbf')[:1] == b'['
+    finally:
+        fp.seek(start)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""pool.py
+
+This module implements an execution mode that dispatches calls of CPU-bound user functions to pools of worker processes.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import os
+import inspect
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections.abc import Iterator
+from typing import Union, Dict, List
+
+from . import _util as util
+from .func import ModuleImporter, ArgumentBinder, ResolvedRoute, _get_module_level_function, _invoke, _describe
+from .deadline import timeout_error
+
+
+def cpu_bound(func):
+    """This decorator marks a module level function as CPU-bound,
+    so it will always be dispatched to a worker process if ``execute`` is given a ``ProcessPool``."""
+    func.__pywebapi_cpu_bound__ = True
+    return func
+
+
+####################################################################################################
+# Functions running in the worker processes.
+#region
+#
+_worker_functions = {}      # {(directory, module_name, function_name): (function, binder)}
+
+
+def _worker_load(directory:str, module_name:str, function_name:str) -> tuple:
+    key = (directory, module_name, function_name)
+    loaded = _worker_functions.get(key)
+    if loaded is None:
+        module = ModuleImporter(directory, module_name, isolated=True).module
+        func = _get_module_level_function(module, function_name)
+        loaded = _worker_functions[key] = (func, ArgumentBinder(inspect.signature(func)))
+    return loaded
+
+
+def _worker_init(directory:str, module_names:list):
+    for module_name in module_names:
+        try:
+            ModuleImporter(directory, module_name, isolated=True)
+        except Exception:
+            pass        # the error will be reported by the call itself
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _worker_call(directory:str, module_name:str, function_name:str, args:Union[Dict, List[Dict]]):
+    func, binder = _worker_load(directory, module_name, function_name)
+    return _invoke(func, binder, args)
+
+#endregion
+####################################################################################################
+
+
+class ProcessPool(object):
+    """This class dispatches calls of user functions to pools of pre-warmed worker processes, one pool per user module directory,
+    so that CPU-bound functions holding the GIL do not stall other requests served by the web worker.
+
+    :param root: The root directory for centrally organizing user modules.
+    :param max_workers: The maximum number of worker processes in each pool, it defaults to the number of processors on the machine.
+    :param directories: The directories (relative to the root) whose module level functions are all dispatched to worker processes.
+    :param functions: The ``path/module.function`` routes (relative to the root) which are dispatched to worker processes.
+
+    Besides, any module level function decorated by ``cpu_bound`` is always dispatched to worker processes.
+
+    Call ``start`` at startup to start the pools of the configured directories and functions with all their worker processes,
+    each worker imports the configured modules (in isolation mode, see ``ModuleImporter``) as soon as it is started - all modules
+    of a configured directory, or the module of a configured function. The pool of any other directory (of a function decorated by ``cpu_bound``)
+    is started on its first call, with the module of that call. Each worker keeps all modules it has imported warm for subsequent calls. Arguments and results cross the process boundary by pickle,
+    a batch of calls (a list of argument dictionaries) is sent as a single task. If a worker process crashes, its pool is restarted.
+
+    If a call times out (see ``invoke``) after it has started, its pool is retired - new calls go to a replacement pool at once,
+    the other calls still running in the retired pool are allowed to complete, then the stuck worker processes are killed.
+
+    .. note::
+
+        Functions running in worker processes cannot access the request/response objects of the web server.
+    """
+    def __init__(self, root:str, max_workers:int=None, directories:list=(), functions:list=()):
+        self.root = util.full_path(root)
+        self.max_workers = max_workers
+        self._directories = {os.path.normpath(os.path.join(self.root, d)) for d in directories}
+        self._functions = set()
+        for routed_path in functions:
+            module_func = util.extract_path_info(routed_path)
+            self._functions.add((os.path.normpath(os.path.join(self.root, module_func.directory)), module_func.module, module_func.function))
+
+        self._preload = {}      # {directory: [names of the modules imported by each worker as soon as it is started]}
+        for directory, module_name, _ in self._functions:
+            self._preload.setdefault(directory, []).append(module_name)
+
+        self._lock = threading.Lock()
+        self._executors = {}    # {directory: ProcessPoolExecutor}
+        self._running = {}      # {ProcessPoolExecutor: set of Futures not done yet}
+        self._retired = {}      # {ProcessPoolExecutor: set of timed out Futures} of the pools to be killed
+
+
+    def accepts(self, route:ResolvedRoute) -> bool:
+        """Check whether a resolved route should be dispatched to worker processes."""
+        return (getattr(route.function, '__pywebapi_cpu_bound__', False)
+                or route.directory in self._directories
+                or (route.directory, route.module_name, route.function_name) in self._functions)
+
+
+    def _preloaded_modules(self, directory:str) -> list:
+        module_names = list(self._preload.get(directory, ()))
+        if directory in self._directories and os.path.isdir(directory):
+            module_names.extend(name[:-3] for name in sorted(os.listdir(directory)) if name.endswith('.py') and name[:-3].isidentifier())
+        return list(dict.fromkeys(module_names))
+
+
+    def _get_executor(self, directory:str, module_name:str=None) -> ProcessPoolExecutor:
+        executor = self._executors.get(directory)
+        if executor is None:
+            with self._lock:
+                executor = self._executors.get(directory)
+                if executor is None:
+                    module_names = self._preloaded_modules(directory)
+                    if module_name and module_name not in module_names:
+                        module_names.append(module_name)
+                    executor = ProcessPoolExecutor(self.max_workers, initializer=_worker_init, initargs=(directory, module_names))
+                    self._executors[directory] = executor
+        return executor
+
+
+    def _warm_up(self, directory:str) -> ProcessPoolExecutor:
+        """Start all worker processes of the pool of a directory, without waiting for them to import their modules."""
+        executor = self._get_executor(directory)
+        for _ in range(self.max_workers or os.cpu_count() or 1):      # every submission starts a new worker while none of the started ones is idle
+            executor.submit(_worker_ready)
+        return executor
+
+
+    def start(self):
+        """Start the pools of the configured directories and functions (see above) with all their worker processes, 
+    so that even the first calls do not wait for a worker process to start and import the user modules. 
+    It should be called at startup, before serving any request."""
+        for directory in sorted(self._directories | set(self._preload)):
+            self._warm_up(directory)
+
+
+    def _restart(self, directory:str, broken:ProcessPoolExecutor):
+        with self._lock:
+            if self._executors.get(directory) is broken:
+                del self._executors[directory]
+        broken.shutdown(wait=False)
+
+
+    def restart(self, directory:str=None):
+        """Restart the pools of worker processes, so that new workers will import the latest version of user modules.
+    The pools of the configured directories and functions are started again at once (see ``start``), the others on their next calls.
+
+    :param directory: Only restart the pools for modules in this directory (or its subdirectories). All pools will be restarted if it is omitted.
+        """
+        with self._lock:
+            if directory:
+                scope = util.full_path(directory)
+                prefix = os.path.join(scope, '')
+                keys = [d for d in self._executors if d == scope or d.startswith(prefix)]
+            else:
+                keys = list(self._executors)
+            executors = [self._executors.pop(d) for d in keys]
+
+        for executor in executors:
+            executor.shutdown(wait=False)
+
+        for d in keys:
+            if d in self._directories or d in self._preload:
+                self._warm_up(d)
+
+
+    def submit(self, route:ResolvedRoute, args:Union[Dict, List[Dict]]) -> Future:
+        """Submit a call of the module level function of a resolved route to a worker process.
+
+    :param route: The ResolvedRoute of the function.
+    :param args: A argument dictionary or a list of argument dictionary to be passed to the function.
+    :return: A Future of the result object.
+        """
+        executor = self._get_executor(route.directory, route.module_name)
+
+        def restart_if_broken(future:Future):
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._restart(route.directory, executor)
+
+        try:
+            future = executor.submit(_worker_call, route.directory, route.module_name, route.function_name, args)
+        except BrokenProcessPool:
+            self._restart(route.directory, executor)
+            raise
+
+        with self._lock:
+            self._running.setdefault(executor, set()).add(future)
+
+        def complete(future:Future):
+            with self._lock:
+                running = self._running.get(executor)
+                if running is not None:
+                    running.discard(future)
+                    if not running:
+                        del self._running[executor]
+            self._kill_if_stuck(executor)
+
+        future.add_done_callback(complete)
+        future.add_done_callback(restart_if_broken)
+        return future
+
+
+    def invoke(self, route:ResolvedRoute, args:Union[Dict, List[Dict]], timeout:float=None):
+        """Invoke the module level function of a resolved route in a worker process, and wait for its result.
+
+    :param route: The ResolvedRoute of the function.
+    :param args: A argument dictionary or a list of argument dictionary to be passed to the function.
+    :param timeout: An optional number of seconds to wait for the result. A timed out call is cancelled if it has not started yet,
+        otherwise its worker process will be killed and replaced (see above).
+    :return: The result object of the module level function returned.
+    :raise ExecutionTimeout: If the call does not complete within the timeout.
+        """
+        if isinstance(args, Iterator):
+            args = list(args)       # a batch is sent to a worker process as a whole
+        future = self.submit(route, args)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                self._retire(route.directory, future)
+            raise timeout_error(_describe(route), timeout) from None
+
+
+    def _retire(self, directory:str, stuck:Future):
+        with self._lock:
+            executor = next((e for e, running in self._running.items() if stuck in running), None)
+            if executor is None:
+                return      # it has just completed
+            if self._executors.get(directory) is executor:
+                del self._executors[directory]      # new calls go to a replacement pool
+            self._retired.setdefault(executor, set()).add(stuck)
+
+        self._kill_if_stuck(executor)
+
+
+    def _kill_if_stuck(self, executor:ProcessPoolExecutor):
+        """Kill the worker processes of a retired pool once all its running calls are the timed out ones."""
+        with self._lock:
+            stuck = self._retired.get(executor)
+            if stuck is None:
+                return
+            running = self._running.get(executor, set())
+            if not running.issubset(stuck):
+                return
+            del self._retired[executor]
+
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+
+    def shutdown(self, wait:bool=True):
+        """Shut down all pools of worker processes."""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+
+        for executor in executors:
+            executor.shutdown(wait=wait)
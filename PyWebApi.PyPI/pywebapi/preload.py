@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""preload.py
+
+This module implements a startup phase that imports all user modules in advance and builds an index of their module level functions.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import os
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import _util as util
+from .func import RouteTable, ModuleImporter, default_route_table, _run_coroutine
+
+
+def _scan_modules(root:str) -> dict:
+    """Find all candidate user modules under the root directory: {relative directory: [module names]},
+    hidden directories (E.g. ``.venv``), ``__pycache__`` directories and package directories are skipped."""
+    modules = {}
+
+    for directory, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if not d.startswith('.') and d != '__pycache__'
+                        and not os.path.isfile(os.path.join(directory, d, '__init__.py'))]
+
+        if directory == root:
+            continue    # a module must be placed in a directory under the root
+
+        names = sorted(f[:-3] for f in file_names if f.endswith('.py') and not f.startswith('_'))
+        if names:
+            modules[os.path.relpath(directory, root).replace(os.sep, '/')] = names
+
+    return modules
+
+
+def _module_level_functions(module) -> list:
+    """List the public functions defined by the module itself (excluding the imported ones)."""
+    return [name for name, value in vars(module).items()
+            if not name.startswith('_') and inspect.isfunction(value) and value.__module__ == module.__name__]
+
+
+class Preloader(object):
+    """This class scans the root directory of user modules at startup, imports all modules and resolves all their module level functions
+    into the RouteTable, so that the first request to each module does not pay the import cost.
+
+    After a module is imported, its optional warm-up hook - a module level function named ``__warm_up__`` without required parameters - is called,
+    so that the module can open its connection pools or load its models in advance. A coroutine function (``async def __warm_up__``) is run to completion
+    on a new event loop, the same way ``execute`` runs a coroutine function for a synchronous caller.
+
+    :param root: The root directory for centrally organizing user modules, it should be the same one passed to ``execute``, 
+        since the routes are cached by it.
+    :param route_table: The RouteTable to be populated, the module level ``default_route_table`` is used if it is omitted.
+    :param max_workers: The maximum number of directories to be preloaded in parallel.
+        It only takes effect if the RouteTable is in isolation mode, otherwise all modules are preloaded sequentially
+        since the process-global working directory and sys.path are switched for each module.
+    :param warm_up_hook: The name of the module level warm-up function.
+
+    Attributes:
+
+        - ``index``: {``path/module.function``: inspect.Signature} of all preloaded module level functions;
+        - ``errors``: {``path/module`` or ``path/module.function``: error message} of all modules or functions which failed to be preloaded;
+        - ``ready``: A threading.Event which is set once all modules have been preloaded and warmed up.
+    """
+    def __init__(self, root:str, route_table:RouteTable=None, max_workers:int=4, warm_up_hook:str='__warm_up__'):
+        self.root = root
+        self.route_table = default_route_table if route_table is None else route_table
+        self.max_workers = max_workers if self.route_table.isolated else 1
+        self.warm_up_hook = warm_up_hook
+        self.index = {}
+        self.errors = {}
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether all modules have been preloaded and warmed up."""
+        return self.ready.is_set()
+
+
+    def start(self) -> threading.Thread:
+        """Run the preloading in a background thread, and return the thread."""
+        thread = threading.Thread(target=self.run, name='pywebapi-preloader', daemon=True)
+        thread.start()
+        return thread
+
+
+    def run(self) -> dict:
+        """Run the preloading in the current thread, until all modules have been preloaded and warmed up.
+
+    :return: The index of all preloaded module level functions.
+        """
+        try:
+            modules = _scan_modules(util.full_path(self.root))
+            with ThreadPoolExecutor(self.max_workers, thread_name_prefix='pywebapi-preloader') as executor:
+                for directory, module_names in modules.items():
+                    executor.submit(self._preload_directory, directory, module_names)
+        finally:
+            self.ready.set()
+
+        return self.index
+
+
+    def _preload_directory(self, directory:str, module_names:list):
+        work_dir = os.path.join(util.full_path(self.root), directory)
+
+        # modules in the same directory may import each other, so they are preloaded sequentially
+        for module_name in module_names:
+            module_path = f'{directory}/{module_name}'
+            try:
+                with ModuleImporter(work_dir, module_name, self.route_table.isolated) as importer:
+                    module = importer.module
+            except Exception as err:
+                self._add_error(module_path, err)
+                continue
+
+            for function_name in _module_level_functions(module):
+                routed_path = f'{module_path}.{function_name}'
+                try:
+                    route = self.route_table.resolve(self.root, routed_path)
+                except Exception as err:
+                    self._add_error(routed_path, err)
+                else:
+                    with self._lock:
+                        self.index[routed_path] = route.binder.signature
+
+            self._warm_up(work_dir, module_path, module)
+
+
+    def _warm_up(self, work_dir:str, module_path:str, module):
+        hook = getattr(module, self.warm_up_hook, None)
+        if not callable(hook):
+            return
+
+        call = (lambda: _run_coroutine(hook())) if inspect.iscoroutinefunction(hook) else hook
+        try:
+            if self.route_table.isolated:
+                call()
+            else:
+                with ModuleImporter(work_dir, module.__name__):
+                    call()
+        except Exception as err:
+            self._add_error(f'{module_path}.{self.warm_up_hook}', err)
+
+
+    def _add_error(self, path:str, err:Exception):
+        with self._lock:
+            self.errors[path] = f'{type(err).__name__}: {err}'
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""watch.py
+
+This module implements the hot reload of user modules when their files are changed under the root directory of user modules.
+
+| Homepage and documentation: https://github.com/DataBooster/PyWebApi
+| Copyright (c) 2020 Abel Cheng
+| License: MIT (See LICENSE file in the repository root for details)
+"""
+
+import os
+import sys
+import types
+import threading
+import importlib
+
+from . import _util as util
+from .func import RouteTable, default_route_table, _discard_isolated_namespace
+
+
+_WATCHED_EXTENSIONS = ('.py', '.pth')
+
+
+def _scan_files(root:str) -> dict:
+    """Take a snapshot {file path: modification time} of all .py and .pth files under the root directory,
+    hidden directories (E.g. ``.venv``) and ``__pycache__`` directories are skipped."""
+    snapshot = {}
+    pending = [root]
+
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.') and entry.name != '__pycache__':
+                            pending.append(entry.path)
+                    elif entry.name.endswith(_WATCHED_EXTENSIONS):
+                        snapshot[entry.path] = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+
+    return snapshot
+
+
+def _module_file(module) -> str:
+    file = getattr(module, '__file__', None)
+    if file and isinstance(file, str):
+        return util.full_path(file)
+    else:
+        return None
+
+
+def _references(module, targets:dict) -> bool:
+    """Check whether a module refers to any of the target modules {name: module} by its globals (``import x`` or ``from x import y``)."""
+    for value in list(vars(module).values()):
+        if isinstance(value, types.ModuleType):
+            if targets.get(value.__name__) is value:
+                return True
+        else:
+            try:
+                if getattr(value, '__module__', None) in targets:
+                    return True
+            except Exception:
+                continue
+    return False
+
+
+class ModuleWatcher(object):
+    """This class watches all .py and .pth files under the root directory of user modules by polling their modification times.
+    When any file is changed, added or removed, the affected user modules and all their dependents (within the root directory)
+    are discarded from ``sys.modules`` and their cached routes are invalidated, so they will be re-imported by the next request.
+
+    Requests in flight still hold the old module and function objects, so they finish on the old version.
+
+    :param root: The root directory for centrally organizing user modules.
+    :param route_table: The RouteTable whose cached routes will be invalidated, the module level ``default_route_table`` is used if it is omitted.
+    :param interval: The number of seconds between two scans of the file system.
+    :param process_pool: An optional ``pool.ProcessPool`` whose worker processes will be restarted for the affected directories.
+    :param result_cache: An optional ``cache.ResultCache`` whose entries will be discarded for the affected directories.
+    """
+    def __init__(self, root:str, route_table:RouteTable=None, interval:float=2.0, process_pool=None, result_cache=None):
+        self.root = util.full_path(root)
+        self.route_table = default_route_table if route_table is None else route_table
+        self.process_pool = process_pool
+        self.result_cache = result_cache
+        self.interval = interval
+        self._snapshot = _scan_files(self.root)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        """Start watching in a background daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='pywebapi-module-watcher', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """Stop the background watching thread."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                continue
+
+
+    def check(self) -> set:
+        """Scan the file system once and reload the user modules whose files have been changed since the last scan.
+
+    :return: A set of names of all discarded modules (the affected modules and their dependents).
+        """
+        snapshot = _scan_files(self.root)
+        changed = {path for path in snapshot.keys() | self._snapshot.keys() if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+
+        if not changed:
+            return set()
+
+        importlib.invalidate_caches()
+        return self._discard(changed)
+
+
+    def _discard(self, changed_files:set) -> set:
+        changed_modules = set()
+        pth_directories = set()
+
+        for path in changed_files:
+            if path.endswith('.pth'):
+                pth_directories.add(os.path.dirname(path))
+            else:
+                changed_modules.add(path)
+
+        user_modules = {}       # {name: module} of all loaded modules under the root directory
+        module_files = {}       # {name: file path} of the above modules
+        prefix = os.path.join(self.root, '')
+        for name, module in list(sys.modules.items()):
+            file = _module_file(module)
+            if file and file.startswith(prefix):
+                user_modules[name] = module
+                module_files[name] = file
+
+        affected = {name: module for name, module in user_modules.items()
+                    if module_files[name] in changed_modules or os.path.dirname(module_files[name]) in pth_directories}
+
+        # Extend to all dependents within the root directory
+        while True:
+            dependents = {name: module for name, module in user_modules.items()
+                          if name not in affected and _references(module, affected)}
+            if not dependents:
+                break
+            affected.update(dependents)
+
+        for name, module in affected.items():
+            if sys.modules.get(name) is module:
+                del sys.modules[name]
+
+        for directory in pth_directories:
+            _discard_isolated_namespace(directory)
+            util.sys_path_registry.forget(directory)
+
+        directories = {os.path.dirname(path) for path in changed_files}
+        directories.update(os.path.dirname(module_files[name]) for name in affected)
+        for directory in directories:
+            self.route_table.invalidate(directory)
+            if self.process_pool is not None:
+                self.process_pool.restart(directory)
+            if self.result_cache is not None:
+                self.result_cache.invalidate(directory)
+
+        return set(affected.keys())
@@ -14,5 +14,5 @@ setup(name='pywebapi',
       license='MIT',
       platforms='any',
       packages=['pywebapi'],
-      python_requires='>=3',
+      python_requires='>=3.7',
       install_requires=['bottle'])
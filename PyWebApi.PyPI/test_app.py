@@ -4,7 +4,12 @@ import os
 import sys
 import unittest
 
-from pywebapi import ModuleImporter, _util as util
+import inspect
+import asyncio
+from pywebapi import register_body_decoder, ColumnarBatch, RequestArguments, ExecutionTimeout, AdmissionController, AdmissionError, ResultCache, SingleFlight, ModuleImporter, RouteTable, ModuleWatcher, ProcessPool, BatchExecutor, Preloader, MediaTypeFormatter, MediaTypeFormatterManager, execute, execute_async, _util as util
+from pywebapi.func import ArgumentBinder, bind_arguments
+from pywebapi.jsonstream import iter_json_array
+from pywebapi.cache import _expand_iter
 
 
 class TestMain(unittest.TestCase):
@@ -75,5 +80,858 @@ class TestMain(unittest.TestCase):
                 t = e
 
 
+    def test_route_table(self):
+        root = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS', 'user-script-root')
+        routes = RouteTable()
+
+        r1 = routes.resolve(root, 'test_directory/test_module.module_level_function')
+        r2 = routes.resolve(root, 'test_directory/test_module.module_level_function')
+        self.assertIs(r1, r2)
+        self.assertEqual(r1.function_name, 'module_level_function')
+
+        result = execute(root, 'test_directory/test_module.module_level_function', {'': [2, 11, 12]}, routes)
+        self.assertEqual(result['result1'], str(2 * 3.14))
+
+        for _ in range(2):
+            with self.assertRaises(NotImplementedError):
+                routes.resolve(root, 'test_directory/test_module.no_such_function')
+            with self.assertRaises(NotADirectoryError):
+                routes.resolve(root, 'no_such_directory/test_module.module_level_function')
+        self.assertEqual(len(routes._failures), 2)
+
+        self.assertIs(routes.resolve(root, '/test_directory//test_module.module_level_function/'), r1)      # the same route in another spelling
+        self.assertIs(routes.lookup(root, 'test_directory/./test_module.module_level_function.'), r1)
+
+        routes.invalidate(os.path.join(root, 'test_directory'))
+        self.assertIsNot(routes.resolve(root, 'test_directory/test_module.module_level_function'), r1)
+        self.assertEqual(len(routes._failures), 0)
+
+
+    def test_route_import_error(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'broken_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'needs_dependency.py'), 'w') as f:
+                f.write("import no_such_dependency_yet\ndef f():\n    return 1\n")
+
+            routes = RouteTable(isolated=True)
+            cwd, sys_path = os.getcwd(), list(sys.path)
+            for isolated in (True, False):
+                routes.isolated = isolated
+                with self.assertRaisesRegex(ModuleNotFoundError, "'no_such_dependency_yet'"):
+                    routes.resolve(root, 'broken_app/needs_dependency.f')
+                self.assertEqual((os.getcwd(), sys.path), (cwd, sys_path))
+            self.assertEqual(len(routes._failures), 0)      # a failure of executing the module is not remembered
+
+            with open(os.path.join(app_dir, 'no_such_dependency_yet.py'), 'w') as f:
+                f.write("")         # the dependency has been installed
+            self.assertEqual(execute(root, 'broken_app/needs_dependency.f', {}, routes), 1)
+
+            with self.assertRaises(ModuleNotFoundError):
+                routes.resolve(root, 'broken_app/no_such_module.f')
+            self.assertEqual(len(routes._failures), 1)
+
+
+    def test_argument_binder(self):
+        def f(a, b=2, *args, c, d=4, **kwargs):
+            return (a, b, args, c, d, kwargs)
+
+        binder = ArgumentBinder(inspect.signature(f))
+        self.assertEqual(binder.call(f, {'': [1, 20, 30, 40], 'c': 3, 'x': 9}), (1, 20, (30, 40), 3, 4, {'x': 9}))
+        self.assertEqual(binder.call(f, {'a': 1, 'c': 3}), (1, 2, (), 3, 4, {}))
+        self.assertEqual(binder.call(f, {'a': 1, 'kwargs': {'c': 3, 'y': 8}}), (1, 2, (), 3, 4, {'y': 8}))
+
+        with self.assertRaisesRegex(TypeError, r"^missing 2 required arguments: 'a', 'c'$"):
+            binder.bind({'b': 1})
+        with self.assertRaisesRegex(TypeError, r"^missing 1 required argument: 'c'$"):
+            binder.bind({'': 1})
+
+        bound = bind_arguments(inspect.signature(f), {'': [1], 'c': 3, 'x': 9})
+        self.assertEqual(bound.arguments['b'], 2)
+        self.assertEqual(bound.kwargs, {'c': 3, 'd': 4, 'x': 9})
+
+
+    def test_isolated_import(self):
+        root = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS', 'user-script-root')
+        routes = RouteTable(isolated=True)
+        cwd = os.getcwd()
+
+        result = execute(root, 'test_directory/test_module.module_level_function', {'': [2, 11, 12]}, routes)
+        self.assertEqual(result['result1'], str(2 * 3.14))
+        self.assertEqual(os.getcwd(), cwd)
+        sys_path = list(sys.path)
+
+        module = routes.resolve(root, 'test_directory/test_module.module_level_function').module
+        self.assertTrue(module.__name__.endswith('.test_module'))
+        self.assertIsNot(module, sys.modules.get('test_module'))
+
+        execute(root, 'test_directory/test_module.module_level_function', {'': [3, 11, 12]}, routes)
+        self.assertEqual(sys.path, sys_path)
+
+        with self.assertRaisesRegex(ModuleNotFoundError, "'no_such_module'"):
+            execute(root, 'test_directory/no_such_module.func', {}, routes)
+
+
+    def test_isolated_sibling_import(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            for i in (1, 2):
+                app_dir = os.path.join(root, f'app{i}')
+                os.mkdir(app_dir)
+                with open(os.path.join(app_dir, 'helpers.py'), 'w') as f:
+                    f.write(f"VALUE = {i}\n")
+                with open(os.path.join(app_dir, 'main.py'), 'w') as f:
+                    f.write("import helpers\nfrom helpers import VALUE\n"
+                            "def get():\n    import helpers as late\n    return (helpers.VALUE, VALUE, late.VALUE)\n")
+
+            routes = RouteTable(isolated=True)
+            sys_path = list(sys.path)
+            self.assertEqual(execute(root, 'app1/main.get', {}, routes), (1, 1, 1))
+            self.assertEqual(execute(root, 'app2/main.get', {}, routes), (2, 2, 2))     # each directory imports its own helpers
+            self.assertNotIn('helpers', sys.modules)
+            self.assertEqual(sys.path, sys_path)
+
+            os.mkdir(os.path.join(root, 'app1', 'json'))       # a data directory is not a sibling package
+            with open(os.path.join(root, 'app1', 'dumper.py'), 'w') as f:
+                f.write("import json\ndef dump():\n    return json.dumps({'a': 1})\n")
+            self.assertEqual(execute(root, 'app1/dumper.dump', {}, routes), '{"a": 1}')
+
+
+    def test_sys_path_registry(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'app')
+            lib_dir = os.path.join(root, 'lib')
+            os.mkdir(app_dir)
+            os.mkdir(lib_dir)
+            with open(os.path.join(app_dir, 'extra.pth'), 'w') as f:
+                f.write(lib_dir + '\n')
+
+            registry = util.SysPathRegistry()
+            sys_path = list(sys.path)
+
+            sys.path[:] = [p for p in sys_path if p and p != '.']      # no '' or '.' head, the directory is inserted at the first position
+            try:
+                added = registry.enter(app_dir)
+                self.assertEqual(sys.path[0], app_dir)
+                registry.leave(added)
+                self.assertNotIn(app_dir, sys.path)
+            finally:
+                sys.path[:] = sys_path
+
+            added = registry.enter(app_dir)
+            self.assertEqual(added, [app_dir, lib_dir])
+            self.assertTrue(registry.contains(lib_dir))
+            self.assertEqual(registry.enter(app_dir), [])
+            registry.leave(added)
+            self.assertEqual(sys.path, sys_path)
+
+            os.remove(os.path.join(app_dir, 'extra.pth'))     # the recorded contribution is replayed without accessing the directory
+            added = registry.enter(app_dir)
+            self.assertEqual(added, [app_dir, lib_dir])
+            registry.leave(added)
+            registry.forget(app_dir)
+            added = registry.enter(app_dir)
+            self.assertEqual(added, [app_dir])
+            registry.leave(added)
+            self.assertEqual(sys.path, sys_path)
+
+
+    def test_result_cache(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'cached_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'cached_lookup.py'), 'w') as f:
+                f.write("__pywebapi_cached__ = {'rate': 60}\ncalls = []\n"
+                        "def rate(ccy, scale=1):\n    calls.append(ccy)\n    return {'ccy': ccy, 'rate': 1.5 * scale}\n"
+                        "def now(ccy):\n    return ccy\n")
+
+            routes = RouteTable(isolated=True)
+            cache = ResultCache(max_size=2, route_table=routes)
+            self.assertIsNone(cache.key(root, 'cached_app/cached_lookup.rate', {'ccy': 'USD'}))     # not resolved yet
+
+            execute(root, 'cached_app/cached_lookup.rate', {'ccy': 'USD'}, routes)
+            execute(root, 'cached_app/cached_lookup.now', {'ccy': 'USD'}, routes)
+            self.assertIsNone(cache.key(root, 'cached_app/cached_lookup.now', {'ccy': 'USD'}))
+            self.assertIsNone(cache.key(root, 'cached_app/cached_lookup.rate', [{'ccy': 'USD'}]))
+
+            key = cache.key(root, 'cached_app/cached_lookup.rate', {'ccy': 'USD'}, 'application/json')
+            self.assertEqual(key, cache.key(root, 'cached_app/cached_lookup.rate', {'': ['USD', 1]}, 'application/json'))
+            self.assertNotEqual(key, cache.key(root, 'cached_app/cached_lookup.rate', {'ccy': 'USD'}, 'text/csv'))
+            self.assertNotEqual(key, cache.key(root, 'cached_app/cached_lookup.rate', {'ccy': 'USD', 'scale': 1.0}, 'application/json'))
+
+            self.assertIsNone(cache.get(key))
+            cache.put(key, b'{"rate": 1.5}', {'Content-Type': 'application/json'})
+            self.assertEqual(cache.get(key).body, b'{"rate": 1.5}')
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            cache.put(cache.key(root, 'cached_app/cached_lookup.rate', {'ccy': 'EUR'}), b'1')
+            cache.put(cache.key(root, 'cached_app/cached_lookup.rate', {'ccy': 'JPY'}), b'2')
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get(key))       # the least recently used entry is evicted
+
+            cache.invalidate(app_dir)
+            self.assertEqual(len(cache), 0)
+
+
+    def test_conditional_request(self):
+        import tempfile
+        from bottle import BaseRequest, BaseResponse, HTTPError
+        from pywebapi import conditional, compress
+
+        request = BaseRequest({'HTTP_IF_NONE_MATCH': 'W/"a", "b"'})
+        response = BaseResponse()
+        self.assertFalse(conditional.not_modified(request, response, '"c"'))
+        self.assertEqual((response.status_code, response.get_header('ETag')), (200, '"c"'))
+        self.assertTrue(conditional.not_modified(request, response, '"a"'))
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(conditional.if_none_match(BaseRequest({'HTTP_IF_NONE_MATCH': '*'}), '"c"'))
+        self.assertTrue(conditional.not_modified(BaseRequest({'REQUEST_METHOD': 'HEAD', 'HTTP_IF_NONE_MATCH': '"a"'}), BaseResponse(), '"a"'))
+
+        request = BaseRequest({'REQUEST_METHOD': 'POST', 'HTTP_IF_NONE_MATCH': '"a"'})
+        response = BaseResponse()
+        with self.assertRaises(HTTPError) as ctx:       # an unsafe method is not answered by 304
+            conditional.not_modified(request, response, '"a"')
+        self.assertEqual(ctx.exception.status_code, 412)
+        self.assertFalse(conditional.not_modified(request, response, '"a"', precondition=False))
+        self.assertEqual((response.status_code, response.get_header('ETag')), (200, '"a"'))
+
+        etag = conditional.make_etag('{"rate": 1.5}')
+        self.assertEqual(etag, conditional.make_etag(b'{"rate": 1.5}'))
+        response = BaseResponse()
+        response.set_header('ETag', etag)
+        compress.encode_response(b'x' * 100, BaseRequest({'HTTP_ACCEPT_ENCODING': 'gzip'}), response, 16)
+        self.assertEqual(response.get_header('ETag'), 'W/' + etag)      # the compressed content is not the one hashed
+
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'versioned_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'versioned_lookup.py'), 'w') as f:
+                f.write("__pywebapi_versioned__ = {'rates': 'rates_version'}\nversions = {'USD': 1}\n"
+                        "def rates_version(ccy):\n    return versions.get(ccy)\n"
+                        "def rates(ccy, scale=1):\n    return {'ccy': ccy, 'rate': 1.5 * scale}\n")
+
+            routes = RouteTable(isolated=True)
+            cache = ResultCache(route_table=routes)
+            module = routes.resolve(root, 'versioned_app/versioned_lookup.rates').module
+
+            key = cache.key(root, 'versioned_app/versioned_lookup.rates', {'ccy': 'USD'}, 'application/json')
+            self.assertEqual((key.ttl, key.version), (None, 1))
+            etag = cache.version_etag(key)
+            self.assertEqual(etag, cache.version_etag(cache.key(root, 'versioned_app/versioned_lookup.rates', {'': ['USD']}, 'application/json')))
+            self.assertIsNone(cache.version_etag(cache.key(root, 'versioned_app/versioned_lookup.rates', {'ccy': 'EUR'})))
+
+            cache.put(key, b'{"rate": 1.5}', {'Content-Type': 'application/json'}, etag)
+            self.assertEqual(cache.get(key).etag, etag)
+
+            module.versions['USD'] = 2      # the data has changed
+            key = cache.key(root, 'versioned_app/versioned_lookup.rates', {'ccy': 'USD'}, 'application/json')
+            self.assertIsNone(cache.get(key))
+            self.assertNotEqual(cache.version_etag(key), etag)
+
+
+    def test_single_flight(self):
+        import tempfile
+        import threading
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'flight_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'flight_lookup.py'), 'w') as f:
+                f.write("import time\n__pywebapi_cached__ = {'slow': 60}\ncalls = []\n"
+                        "def slow(x):\n    calls.append(x)\n    time.sleep(0.2)\n    return x * 10\n"
+                        "def impure(x):\n    calls.append(x)\n    return x\n")
+
+            routes = RouteTable(isolated=True)
+            flight = SingleFlight()
+            module = routes.resolve(root, 'flight_app/flight_lookup.slow').module
+
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(execute(root, 'flight_app/flight_lookup.slow', {'x': 7}, routes, single_flight=flight)))
+                       for _ in range(5)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(results, [70] * 5)
+            self.assertEqual(module.calls, [7])
+            self.assertEqual(flight.coalesced, 4)
+
+            del module.calls[:]
+            result = execute(root, 'flight_app/flight_lookup.slow', [{'x': 1}, {'': [2]}, {'x': 1}, None, {'x': 2}], routes, single_flight=flight)
+            self.assertEqual(result, [10, 20, 10, None, 20])
+            self.assertEqual(module.calls, [1, 2])
+
+            stream = execute(root, 'flight_app/flight_lookup.slow', [{'x': 3}, {'x': 3}, {'x': 4}], routes, stream=True, single_flight=flight)
+            self.assertEqual(list(stream), [30, 30, 40])
+
+            import gc, weakref
+            class Row(object):
+                def __init__(self, x): self.x = x
+            alive = weakref.WeakSet()
+            def produce(n):
+                for x in range(n):
+                    row = Row(x)
+                    alive.add(row)
+                    yield row
+                    del row
+            expanded = _expand_iter(produce(4), [0, 1, 0, 2, 2, 3])
+            self.assertEqual([next(expanded).x for _ in range(4)], [0, 1, 0, 2])
+            gc.collect()
+            self.assertEqual(sorted(row.x for row in alive), [2])       # rows 0 and 1 are not needed again
+            self.assertEqual([row.x for row in expanded], [2, 3])
+
+            del module.calls[:]
+            execute(root, 'flight_app/flight_lookup.impure', [{'x': 1}, {'x': 1}], routes, single_flight=flight)
+            self.assertEqual(module.calls, [1, 1])
+
+
+    def test_admission_controller(self):
+        import time
+        import threading
+        controller = AdmissionController()
+        controller.limit_app('etl', 2, max_queue=1, queue_timeout=0.2)
+        controller.limit_function('etl/loader.run', 1, max_queue=1)
+
+        first = controller.admit('etl/loader.run', 'etl')
+        other = controller.admit('etl/loader.check', 'etl')     # not limited by the function limit
+        with self.assertRaises(AdmissionError) as ctx:           # the app queue times out
+            controller.admit('etl/loader.check', 'etl')
+        self.assertEqual(ctx.exception.scope, 'etl')
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        other.release()
+
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(controller.admit('etl/loader.run', 'etl')))
+        waiter.start()
+        time.sleep(0.05)
+        stats = controller.stats()
+        self.assertEqual(stats['Functions']['etl/loader.run']['Queued'], 1)
+        with self.assertRaisesRegex(AdmissionError, 'too many concurrent calls'):     # the function queue is full
+            controller.admit('etl/loader.run')
+
+        first.release()
+        first.release()
+        waiter.join()
+        with admitted[0] as admission:
+            stream = admission.release_after(iter([1, 2]))
+        self.assertEqual(controller.stats()['Apps']['etl']['Running'], 1)
+        self.assertEqual(list(stream), [1, 2])
+        self.assertEqual(controller.stats()['Apps']['etl']['Running'], 0)
+        self.assertEqual(controller.stats()['Functions']['etl/loader.run']['Rejected'], 1)
+
+        with controller.admit('other/module.func', 'other'):    # no applicable limit
+            pass
+
+        from concurrent.futures import ThreadPoolExecutor
+        controller.limit_function('etl/loader.load', 1, max_queue=8, queue_timeout=0.1)
+        async def call(loop):
+            with await controller.admit_async('etl/loader.load'):
+                await loop.run_in_executor(None, time.sleep, 0.01)     # the admitted call needs an executor thread
+        async def burst(loop):
+            return await asyncio.gather(*(call(loop) for _ in range(8)), return_exceptions=True)
+        async def cancelled(loop):
+            waiting = loop.create_task(call(loop))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(2)
+        loop.set_default_executor(executor)
+        try:
+            with controller.admit('etl/loader.load'):
+                self.assertIsInstance(loop.run_until_complete(burst(loop))[0], AdmissionError)      # timed out in the queue
+                loop.run_until_complete(cancelled(loop))
+            self.assertEqual(controller.stats()['Functions']['etl/loader.load']['Queued'], 0)
+            self.assertEqual(loop.run_until_complete(burst(loop)), [None] * 8)      # more waiters than executor threads
+            stats = controller.stats()['Functions']['etl/loader.load']
+            self.assertEqual((stats['Running'], stats['Queued']), (0, 0))
+        finally:
+            loop.close()
+            executor.shutdown()
+
+
+    def test_module_watcher(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'watched_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'watched_helper.py'), 'w') as f:
+                f.write('def version():\n    return 1\n')
+            with open(os.path.join(app_dir, 'watched_main.py'), 'w') as f:
+                f.write('from watched_helper import version\ndef get():\n    return version()\n')
+
+            routes = RouteTable(isolated=True)
+            watcher = ModuleWatcher(root, routes)
+            self.assertEqual(execute(root, 'watched_app/watched_main.get', {}, routes), 1)
+            self.assertEqual(watcher.check(), set())
+
+            with open(os.path.join(app_dir, 'watched_helper.py'), 'w') as f:
+                f.write('def version():\n    return 2\n')
+            os.utime(os.path.join(app_dir, 'watched_helper.py'), ns=(0, 10**9))
+
+            discarded = watcher.check()
+            self.assertTrue(any(name.endswith('.watched_helper') for name in discarded))     # the sibling is imported within the namespace package
+            self.assertTrue(any(name.endswith('.watched_main') for name in discarded))
+            self.assertEqual(execute(root, 'watched_app/watched_main.get', {}, routes), 2)
+
+
+    def test_process_pool(self):
+        root = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS', 'user-script-root')
+        pool = ProcessPool(root, max_workers=1, directories=['test_directory'])
+        try:
+            result = execute(root, 'test_directory/test_module.module_level_function', [{'': [2, 11, 12]}, {'': [3, 11, 12]}], process_pool=pool)
+            self.assertEqual([r['result1'] for r in result], [str(2 * 3.14), str(3 * 3.14)])
+
+            with self.assertRaisesRegex(TypeError, 'missing'):
+                execute(root, 'test_directory/test_module.module_level_function', {}, process_pool=pool)
+        finally:
+            pool.shutdown()
+
+
+    def test_process_pool_warm_up(self):
+        import time
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'pool_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'pool_module.py'), 'w') as f:
+                f.write("import os, time\ndef pid():\n    return os.getpid()\ndef slow():\n    time.sleep(0.5)\n")
+
+            pool = ProcessPool(root, max_workers=2, directories=['pool_app'])
+            try:
+                pool.start()
+                executor = pool._executors[app_dir]
+                self.assertEqual(len(executor._processes), 2)       # started before the first call
+                self.assertIs(pool._get_executor(app_dir), executor)
+
+                route = RouteTable(isolated=True).resolve(root, 'pool_app/pool_module.slow')
+                futures = [pool.submit(route, {}) for _ in range(4)]
+                with self.assertRaises(AssertionError):     # a cancelled call does not break the done callbacks
+                    with self.assertLogs('concurrent.futures', level='ERROR'):
+                        self.assertTrue(futures[-1].cancel())
+                for future in futures[:-1]:
+                    future.result()
+            finally:
+                pool.shutdown()
+
+
+    def test_coroutine_function(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'async_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'async_module.py'), 'w') as f:
+                f.write('import asyncio\nasync def double(x):\n    await asyncio.sleep(0)\n    return x * 2\ndef triple(x):\n    return x * 3\n')
+
+            routes = RouteTable(isolated=True)
+            self.assertEqual(execute(root, 'async_app/async_module.double', {'x': 2}, routes), 4)
+            self.assertEqual(execute(root, 'async_app/async_module.double', [{'x': 1}, None, {'x': 3}], routes), [2, None, 6])
+
+            async def run_all():
+                return await asyncio.gather(execute_async(root, 'async_app/async_module.double', {'x': 5}, routes),
+                                            execute_async(root, 'async_app/async_module.triple', {'x': 5}, routes))
+            loop = asyncio.new_event_loop()
+            try:
+                self.assertEqual(loop.run_until_complete(run_all()), [10, 15])
+            finally:
+                loop.close()
+
+
+    def test_timeout(self):
+        import time
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'slow_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'slow_module.py'), 'w') as f:
+                f.write("import time\nimport asyncio\nfrom pywebapi import is_cancelled\n__pywebapi_timeout__ = {'limited': 0.1}\nstate = {}\n"
+                        "def spin(seconds):\n    start = time.monotonic()\n    while time.monotonic() - start < seconds:\n"
+                        "        if is_cancelled():\n            state['cancelled'] = True\n            return None\n        time.sleep(0.01)\n    return seconds\n"
+                        "def limited():\n    return spin(5)\n"
+                        "async def nap(seconds):\n    await asyncio.sleep(seconds)\n    return seconds\n"
+                        "def hang(seconds):\n    time.sleep(seconds)\n    return seconds\n"
+                        "async def spin_in_executor(seconds):\n    return await asyncio.get_running_loop().run_in_executor(None, spin, seconds)\n")
+
+            routes = RouteTable(isolated=True)
+            self.assertEqual(execute(root, 'slow_app/slow_module.spin', {'seconds': 0.01}, routes, timeout=5), 0.01)
+            with self.assertRaisesRegex(ExecutionTimeout, 'within 0.1 seconds'):
+                execute(root, 'slow_app/slow_module.spin', {'seconds': 5}, routes, timeout=0.1)
+            with self.assertRaises(ExecutionTimeout):
+                execute(root, 'slow_app/slow_module.limited', {}, routes, timeout=10)     # the declared timeout is shorter
+            module = routes.resolve(root, 'slow_app/slow_module.spin').module
+            time.sleep(0.1)
+            self.assertTrue(module.state.get('cancelled'))
+
+            module.state.clear()        # the threads of a concurrent batch see the cancellation
+            batch = BatchExecutor(2)
+            try:
+                with self.assertRaises(ExecutionTimeout):
+                    execute(root, 'slow_app/slow_module.spin', [{'seconds': 5}] * 4, routes, batch_executor=batch, timeout=0.1)
+                time.sleep(0.1)
+                self.assertTrue(module.state.get('cancelled'))
+            finally:
+                batch.shutdown()
+
+            module.state.clear()        # so do the executor threads of a coroutine function
+            with self.assertRaises(ExecutionTimeout):
+                execute(root, 'slow_app/slow_module.spin_in_executor', {'seconds': 5}, routes, timeout=0.1)
+            time.sleep(0.1)
+            self.assertTrue(module.state.get('cancelled'))
+
+            cwd, sys_path = os.getcwd(), list(sys.path)     # out of isolation mode, the module scope is left as soon as the call times out
+            with self.assertRaises(ExecutionTimeout):
+                execute(root, 'slow_app/slow_module.hang', {'seconds': 0.5}, RouteTable(), timeout=0.05)
+            self.assertEqual((os.getcwd(), sys.path), (cwd, sys_path))
+
+            loop = asyncio.new_event_loop()
+            try:
+                with self.assertRaises(ExecutionTimeout):
+                    loop.run_until_complete(execute_async(root, 'slow_app/slow_module.nap', {'seconds': 5}, routes, timeout=0.1))
+                with self.assertRaises(ExecutionTimeout):
+                    loop.run_until_complete(execute_async(root, 'slow_app/slow_module.hang', {'seconds': 0.5}, RouteTable(), timeout=0.05))
+                self.assertEqual((os.getcwd(), sys.path), (cwd, sys_path))
+                self.assertEqual(loop.run_until_complete(execute_async(root, 'slow_app/slow_module.nap', {'seconds': 0}, routes, timeout=1)), 0)
+            finally:
+                loop.close()
+
+            pool = ProcessPool(root, max_workers=2, directories=['slow_app'])
+            try:
+                running = pool.submit(routes.resolve(root, 'slow_app/slow_module.hang'), {'seconds': 1})
+                started = time.monotonic()
+                with self.assertRaises(ExecutionTimeout):
+                    execute(root, 'slow_app/slow_module.hang', {'seconds': 60}, routes, process_pool=pool, timeout=0.5)
+                # the replacement pool serves new calls, while the other running call of the retired pool completes
+                self.assertEqual(execute(root, 'slow_app/slow_module.hang', {'seconds': 0}, routes, process_pool=pool, timeout=30), 0)
+                self.assertEqual(running.result(), 1)
+                self.assertLess(time.monotonic() - started, 30)
+            finally:
+                pool.shutdown()
+
+
+    def test_concurrent_batch(self):
+        root = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS', 'user-script-root')
+        batch = BatchExecutor(4)
+        try:
+            args = [{'': [i, 11, 12]} for i in range(10)]
+            args[3] = {}
+            args[5] = None
+            args[7] = 'invalid'
+            reports = execute(root, 'test_directory/test_module.module_level_function', args, RouteTable(isolated=True), batch_executor=batch)
+
+            self.assertEqual(len(reports), 10)
+            self.assertEqual([r['Succeeded'] for r in reports], [True, True, True, False, True, True, True, False, True, True])
+            self.assertEqual(reports[9]['Result']['result1'], str(9 * 3.14))
+            self.assertEqual(reports[3]['ExceptionType'], 'TypeError')
+            self.assertIsNone(reports[5]['Result'])
+        finally:
+            batch.shutdown()
+
+
+    def test_stream(self):
+        root = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS', 'user-script-root')
+        args = [{'': [i, 11, 12]} for i in range(3)] + [{}]
+        results = execute(root, 'test_directory/test_module.module_level_function', args, stream=True)
+
+        self.assertEqual(next(results)['result1'], str(0 * 3.14))
+        self.assertEqual(next(results)['result1'], str(1 * 3.14))
+        next(results)
+        with self.assertRaises(TypeError):
+            next(results)
+
+        class ReprFormatter(MediaTypeFormatter):
+            @property
+            def supported_media_types(self):
+                return ['text/plain']
+            def format(self, obj, media_type, **kwargs):
+                return repr(obj)
+
+        headers = {}
+        chunks = MediaTypeFormatterManager(ReprFormatter()).respond_as(iter([1, 2]), 'text/plain', headers)
+        self.assertEqual(list(chunks), ['[1, 2]'])
+        self.assertEqual(headers['Content-Type'], ['text/plain'])
+
+
+    def test_json_stream(self):
+        import io
+        import json
+        from bottle import BaseRequest
+
+        items = [{"a": 1.5, "b": [1, {"c": "x,]y"}], "\u00e9": None}, 12345678, "s", [], True, {"d": -0.25e-3}]
+        text = json.dumps(items, ensure_ascii=False).encode('utf-8')
+        for chunk_size in (1, 2, 3, 7, 64):
+            self.assertEqual(list(iter_json_array(io.BytesIO(b'\xef\xbb\xbf ' + text + b' \n'), chunk_size)), items)
+
+        self.assertEqual(list(iter_json_array(io.BytesIO(b' [ ] '))), [])
+        for invalid in (b'{"a": 1}', b'[1 2]', b'[1,', b'[1] 2', b'[{"a": }]'):
+            with self.assertRaises(ValueError):
+                list(iter_json_array(io.BytesIO(invalid), 2))
+
+        body = json.dumps([{'': [i, 11, 12]} for i in range(100)]).encode('utf-8')
+        request = BaseRequest({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                               'QUERY_STRING': 'q=1', 'wsgi.input': io.BytesIO(body)})
+        ra = RequestArguments(request, stream=True)
+        ra.override_value('actual_username', 'tester')
+        args = ra.arguments
+        first = next(args)
+        self.assertEqual(first, {'': [0, 11, 12], 'q': '1', 'actual_username': 'tester'})
+
+        root = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS', 'user-script-root')
+        batch = BatchExecutor(2)
+        try:
+            reports = execute(root, 'test_directory/test_module.module_level_function', args, RouteTable(isolated=True), batch_executor=batch, stream=True)
+            self.assertEqual([r['Result']['result1'] for r in reports], [str(i * 3.14) for i in range(1, 100)])
+        finally:
+            batch.shutdown()
+
+        request = BaseRequest({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': '9', 'wsgi.input': io.BytesIO(b'[1, 2, 3]')})
+        self.assertEqual(RequestArguments(request, stream=True).arguments[''], [1, 2, 3])
+
+
+    def test_layered_arguments(self):
+        import io
+        import json
+        import pickle
+        from bottle import BaseRequest
+
+        items = [{'': [1], 'a': [2], 'b': '', 'c': None, 'd': 'body'}, {'e': 3}]
+        body = json.dumps(items).encode('utf-8')
+        request = BaseRequest({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                               'QUERY_STRING': '=9&a=x&b=y&c=z&d=query&q=1', 'wsgi.input': io.BytesIO(body)})
+        ra = RequestArguments(request)
+        ra.override_value('actual_username', 'tester')
+        first, second = ra.arguments
+
+        self.assertEqual(first[''], [1, '9'])
+        self.assertEqual(first['a'], [2, 'x'])
+        self.assertEqual((first['b'], first['c'], first['d'], first['q']), ('y', 'z', 'body', '1'))
+        self.assertEqual(second[''], ['9'])
+        self.assertEqual(second['e'], 3)
+        self.assertEqual(second['actual_username'], 'tester')
+        self.assertNotIn('e', first)
+        self.assertIs(first.shared, second.shared)
+        self.assertEqual(items[0]['a'], [2])        # the body is never modified
+
+        ra.override_value('d', 'server')
+        self.assertEqual(first['d'], 'server')
+        self.assertEqual(pickle.loads(pickle.dumps(first)), first)
+        binder = ArgumentBinder(inspect.signature(lambda e, *args, d, **kwargs: None))
+        self.assertEqual(binder.bind(second), binder.bind(dict(second)))
+        self.assertEqual(binder.bind(second)[0], ['9'])
+
+
+    def test_columnar_batch(self):
+        import io
+        import json
+        import tempfile
+        from bottle import BaseRequest
+
+        with tempfile.TemporaryDirectory() as root:
+            app_dir = os.path.join(root, 'columnar_app')
+            os.mkdir(app_dir)
+            with open(os.path.join(app_dir, 'pricing.py'), 'w') as f:
+                f.write("__pywebapi_vectorized__ = {'total': 'list'}\ncalls = []\n"
+                        "def total(price, qty, currency):\n    calls.append(len(price))\n    return [f'{p * q} {currency}' for p, q in zip(price, qty)]\n"
+                        "def row_total(price, qty, currency):\n    return f'{price * qty} {currency}'\n")
+
+            body = json.dumps({'price': [1.5, 2, 4], 'qty': [2, 3, 1]}).encode('utf-8')
+            request = BaseRequest({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                                   'QUERY_STRING': 'currency=USD', 'wsgi.input': io.BytesIO(body)})
+            ra = RequestArguments(request, columnar=True)
+            batch = ra.arguments
+            self.assertIsInstance(batch, ColumnarBatch)
+            self.assertEqual(len(batch), 3)
+            self.assertEqual((batch[1]['price'], batch[1]['qty'], batch[1]['currency']), (2, 3, 'USD'))
+
+            routes = RouteTable(isolated=True)
+            expected = ['3.0 USD', '6 USD', '4 USD']
+            self.assertEqual(execute(root, 'columnar_app/pricing.total', batch, routes), expected)
+            self.assertEqual(execute(root, 'columnar_app/pricing.row_total', batch, routes), expected)
+            self.assertEqual(list(execute(root, 'columnar_app/pricing.total', list(batch), routes, stream=True)), expected)
+            self.assertEqual(routes.resolve(root, 'columnar_app/pricing.total').module.calls, [3, 3])    # one call per batch
+
+            batch_executor = BatchExecutor(2)
+            try:
+                self.assertEqual(execute(root, 'columnar_app/pricing.total', batch, routes, batch_executor=batch_executor), expected)
+            finally:
+                batch_executor.shutdown()
+
+        with self.assertRaises(ValueError):
+            ColumnarBatch({'a': [1, 2], 'b': [3]})
+        with self.assertRaises(ValueError):
+            ColumnarBatch({'': [1, 2]})
+
+
+    def test_body_decoder(self):
+        import io
+        from bottle import BaseRequest, HTTPError
+
+        def decode(body:bytes):
+            return [dict(pair.split('=') for pair in row.split(',')) for row in body.decode('ascii').split(';')]
+
+        register_body_decoder('Application/X-Test-Rows', decode)
+
+        def request_of(body:bytes, query:str=''):
+            return BaseRequest({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/x-test-rows; charset=ascii', 'CONTENT_LENGTH': str(len(body)),
+                                'QUERY_STRING': query, 'wsgi.input': io.BytesIO(body)})
+
+        first, second = RequestArguments(request_of(b'a=1,b=2;a=3', 'c=&=4')).arguments
+        self.assertEqual(dict(first), {'a': '1', 'b': '2', 'c': '', '': ['4']})     # the body is not parsed as a form again
+        self.assertEqual(second['a'], '3')
+
+        with self.assertRaises(HTTPError) as context:
+            RequestArguments(request_of(b'a'))
+        self.assertEqual(context.exception.status_code, 400)
+
+
+    def test_accept_negotiation(self):
+        class NamedFormatter(MediaTypeFormatter):
+            def __init__(self, *media_types):
+                self.media_types = list(media_types)
+            @property
+            def supported_media_types(self):
+                return self.media_types
+            def format(self, obj, media_type, **kwargs):
+                return media_type
+
+        json_fmtr = NamedFormatter('application/json', 'application/x-ndjson')
+        csv_fmtr = NamedFormatter('text/csv', 'Text/Plain')
+        manager = MediaTypeFormatterManager(json_fmtr, cache_size=2)
+        manager.register(csv_fmtr, False)
+
+        negotiate = lambda accept: manager.respond_as(None, accept, None)
+        self.assertEqual(negotiate('text/csv'), 'text/csv')
+        self.assertEqual(negotiate('text/csv;q=0.5, application/json'), 'application/json')
+        self.assertEqual(negotiate('text/*, application/json;q=0.9'), 'text/csv')
+        self.assertEqual(negotiate('*/*'), 'application/json')
+        self.assertEqual(negotiate('text/*;q=0.8, text/plain'), 'text/plain')
+        self.assertEqual(negotiate('application/json;q=0, */*;q=0.1'), 'application/x-ndjson')
+        self.assertEqual(negotiate('image/png'), 'application/json')
+        self.assertEqual(negotiate('text/csv;q=abc, text/plain;level=1'), 'text/plain')
+        self.assertEqual(negotiate(''), 'application/json')
+        self.assertEqual(len(manager._cache), 2)
+
+        manager.register(NamedFormatter('text/csv', 'text/plain', 'text/tab-separated-values'), False)     # replaces csv_fmtr
+        self.assertEqual(len(manager._cache), 0)
+        self.assertEqual(negotiate('text/tab-separated-values, */*;q=0.1'), 'text/tab-separated-values')
+
+
+    def test_tabular_formatters(self):
+        sample_dir = os.path.join(self.cur_dir, '..', 'Sample', 'PyWebApi.IIS')
+        utilities_dir = os.path.join(self.cur_dir, '..', 'Utilities.PyPI')
+        sys.path[:0] = [sample_dir, utilities_dir]
+        try:
+            from csv_fmtr import CsvFormatter
+            from dbdatareader import ListOfList, ListOfDict, DictOfList
+        finally:
+            del sys.path[:2]
+
+        def read(container):
+            container.set_column_names(['id', 'name', 'price'])
+            for row in ([1, 'a', 1.5], [2, 'b', None], [3, 'c,d', 2.0]):
+                container.add_row_values(row)
+            return container.result
+
+        expected = 'id,name,price\r\n1,a,1.5\r\n2,b,\r\n3,"c,d",2.0\r\n'
+        csv_fmtr = CsvFormatter()
+        for container in (ListOfList, ListOfDict, DictOfList):
+            self.assertEqual(csv_fmtr.format(read(container(None, None)), 'text/csv').decode('utf-8'), expected)
+
+        two_by_two = ListOfList(None, None)
+        two_by_two.set_column_names(['a', 'b'])
+        two_by_two.add_row_values([1, 2])
+        self.assertEqual(csv_fmtr.format(iter([two_by_two.result, two_by_two.result]), 'text/csv'), b'a,b\r\n1,2\r\n1,2\r\n')     # the header is written once
+
+        try:
+            import pyarrow
+        except ImportError:
+            return
+        sys.path.insert(0, sample_dir)
+        try:
+            import arrow_fmtr
+        finally:
+            del sys.path[0]
+
+        for formatter in arrow_fmtr.available_formatters():
+            media_type = formatter.supported_media_types[0]
+            for container in (ListOfList, ListOfDict, DictOfList):
+                content = formatter.format(read(container(None, None)), media_type)
+                self.assertIsInstance(content, bytes)
+                reader = pyarrow.ipc.open_stream(content) if 'arrow' in media_type else pyarrow.parquet.read_table(pyarrow.BufferReader(content))
+                table = reader.read_all() if 'arrow' in media_type else reader
+                self.assertEqual(table.to_pydict(), {'id': [1, 2, 3], 'name': ['a', 'b', 'c,d'], 'price': [1.5, None, 2.0]})
+            self.assertEqual(formatter.format(two_by_two.result, media_type), b''.join(formatter.format_iter(iter([two_by_two.result]), media_type)))
+
+
+    def test_compression(self):
+        import io
+        import zlib
+        from bottle import BaseRequest, BaseResponse, HTTPError
+        from pywebapi import compress
+
+        self.assertEqual(compress.negotiate_encoding('deflate, gzip;q=0.8'), 'deflate')
+        self.assertEqual(compress.negotiate_encoding('gzip;q=0, deflate;q=0.4'), 'deflate')
+        self.assertEqual(compress.negotiate_encoding('*'), compress.available_encodings()[0])
+        self.assertIsNone(compress.negotiate_encoding('identity, gzip;q=0.5'))
+        self.assertIsNone(compress.negotiate_encoding('unknown'))
+
+        def encode(body, min_size=16):
+            request = BaseRequest({'HTTP_ACCEPT_ENCODING': 'gzip'})
+            response = BaseResponse()
+            body = compress.encode_response(body, request, response, min_size)
+            if not isinstance(body, (bytes, str)):
+                body = b''.join(body)
+            return body, response.get_header('Content-Encoding'), response.get_header('Vary')
+
+        self.assertEqual(encode('short'), ('short', None, 'Accept-Encoding'))
+        self.assertEqual(encode(iter(['a', 'b'])), (b'ab', None, 'Accept-Encoding'))
+        body, coding, _ = encode(iter(['x' * 10, b'y' * 10, 'z' * 10]))
+        self.assertEqual((zlib.decompress(body, 31), coding), (b'x' * 10 + b'y' * 10 + b'z' * 10, 'gzip'))
+
+        def request_of(body:bytes, coding:str):
+            return BaseRequest({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                                'HTTP_CONTENT_ENCODING': coding, 'wsgi.input': io.BytesIO(body)})
+
+        gzip = zlib.compressobj(9, zlib.DEFLATED, 31)
+        body = gzip.compress(b'[{"a": 1}, {"a": 2}]') + gzip.flush()
+        self.assertEqual([dict(args) for args in RequestArguments(request_of(body, 'gzip')).arguments], [{'a': 1}, {'a': 2}])
+
+        with self.assertRaises(HTTPError) as context:
+            RequestArguments(request_of(b'[{"a": 1}]', 'gzip'))
+        self.assertEqual(context.exception.status_code, 400)
+
+        with self.assertRaises(HTTPError) as context:
+            compress.decode_request(request_of(zlib.compress(b'0' * 100000), 'deflate'), max_size=65536)
+        self.assertEqual(context.exception.status_code, 413)
+
+
+    def test_preloader(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            for app in ('preload_app1', 'preload_app2'):
+                os.mkdir(os.path.join(root, app))
+                with open(os.path.join(root, app, app + '_module.py'), 'w') as f:
+                    f.write('warmed = False\ndef __warm_up__():\n    global warmed\n    warmed = True\ndef is_warm(x=1):\n    return warmed\n')
+            with open(os.path.join(root, 'preload_app2', 'broken_module.py'), 'w') as f:
+                f.write('raise ImportError("broken")\n')
+            with open(os.path.join(root, 'preload_app2', 'async_module.py'), 'w') as f:
+                f.write('import asyncio\nwarmed = False\nasync def __warm_up__():\n    global warmed\n    await asyncio.sleep(0)\n    warmed = True\n')
+
+            routes = RouteTable(isolated=True)
+            preloader = Preloader(root, routes)
+            self.assertFalse(preloader.is_ready)
+            preloader.start().join()
+            self.assertTrue(preloader.is_ready)
+
+            self.assertEqual(sorted(preloader.index), ['preload_app1/preload_app1_module.is_warm', 'preload_app2/preload_app2_module.is_warm'])
+            self.assertIn('preload_app2/broken_module', preloader.errors)
+            self.assertIsNotNone(routes.lookup(root, 'preload_app1/preload_app1_module.is_warm'))
+            self.assertTrue(execute(root, 'preload_app2/preload_app2_module.is_warm', {}, routes))
+            self.assertTrue(routes.resolve(root, 'preload_app2/async_module.__warm_up__').module.warmed)
+            self.assertNotIn('preload_app2/async_module.__warm_up__', preloader.errors)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -18,6 +18,7 @@ if '--debug' in sys.argv[1:] or 'SERVER_DEBUG' in os.environ:
 def wsgi_app():
     """Returns the application to make available through wfastcgi. This is used
     when the site is published to Microsoft Azure."""
+    routes.preload()
     return bottle.default_app()
 
 if __name__ == '__main__':
@@ -28,4 +29,5 @@ if __name__ == '__main__':
         PORT = 8080
 
     # Starts a local test server.
+    routes.preload()
     bottle.run(server='wsgiref', host=HOST, port=PORT)
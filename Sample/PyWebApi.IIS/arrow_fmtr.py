@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""arrow_fmtr.py
+
+    This module implements the MediaTypeFormatters with Apache Arrow IPC stream (application/vnd.apache.arrow.stream)
+    and Apache Parquet (application/vnd.apache.parquet) responses for tabular results, it requires the package pyarrow.
+
+    The columns are built by pyarrow directly from the following shapes of a result, with typed columns instead of per-cell JSON values:
+
+        - DictOfList: ``{"col1": [v11, v21, ...], "col2": [v12, v22, ...]}`` (a column can also be a NumPy array, which is not copied);
+        - ListOfDict: ``[{"col1": v11, "col2": v12}, {"col1": v21, "col2": v22}, ...]``;
+        - ListOfList: ``{"column_names": ["col1", "col2"], "value_matrix": [[v11, v12], [v21, v22], ...]}`` - the columns are named by the column_names;
+        - A list of rows: ``[[v11, v12], [v21, v22], ...]`` - the columns are named ``f0``, ``f1``, ...;
+        - A pandas DataFrame (its index is not included), a pyarrow Table or RecordBatch.
+
+    Like the other formatters, ``format`` returns the whole content as bytes. An iterable result formatted by ``format_iter``
+    is emitted record batch by record batch (row group by row group for Parquet), so a large result is streamed.
+    An iterator (E.g. a generator returned by the function, or the results of a streamed batch call) can produce either rows or tables,
+    the rows are collected into record batches of ``batch_size`` rows. The schema is taken from the first record batch,
+    the later ones must be compatible with it.
+
+    This module was originally shipped as an example code from https://github.com/DataBooster/PyWebApi, licensed under the MIT license.
+    Anyone who obtains a copy of this code is welcome to modify it for any purpose, and holds all rights to the modified part only.
+    The above license notice and permission notice shall be included in all copies or substantial portions of the Software.
+"""
+
+from collections.abc import Mapping
+from pywebapi import MediaTypeFormatter
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class _Drain(object):
+    """A write-only sink for the pyarrow writers, the written bytes are taken away as soon as each record batch is written."""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _is_list_of_list(obj:Mapping) -> bool:
+    """Whether a result is in the ListOfList shape of dbdatareader: {'column_names': [...], 'value_matrix': [[...], ...]}."""
+    return len(obj) == 2 and 'column_names' in obj and 'value_matrix' in obj
+
+
+def _is_dict_of_list(obj:Mapping) -> bool:
+    return bool(obj) and all(hasattr(v, '__len__') and not isinstance(v, (str, bytes, Mapping)) for v in obj.values())
+
+
+def _is_scalar_row(obj) -> bool:
+    return not any(isinstance(v, (Mapping, list, tuple)) for v in obj)
+
+
+def _table_of_rows(rows:list, names:list=None):
+    if rows and isinstance(rows[0], Mapping):
+        return pyarrow.Table.from_pylist(rows)
+
+    if names is None:
+        names = [f'f{i}' for i in range(len(rows[0]))]
+    columns = [[row[i] for row in rows] for i in range(len(names))]
+    return pyarrow.Table.from_arrays([pyarrow.array(c) for c in columns], names=[str(n) for n in names])
+
+
+def _as_table(obj):
+    """Convert a tabular result into a pyarrow Table, or return None if the result is a single row (or a scalar)."""
+    if isinstance(obj, pyarrow.Table):
+        return obj
+    elif isinstance(obj, pyarrow.RecordBatch):
+        return pyarrow.Table.from_batches([obj])
+    elif type(obj).__module__.partition('.')[0] == 'pandas' and hasattr(obj, 'columns'):      # a DataFrame
+        return pyarrow.Table.from_pandas(obj, preserve_index=False)
+    elif isinstance(obj, Mapping):
+        if _is_list_of_list(obj):
+            return _table_of_rows(obj['value_matrix'], obj['column_names'])
+        return pyarrow.table(dict(obj)) if _is_dict_of_list(obj) else None
+    elif isinstance(obj, (list, tuple)):
+        if not obj:
+            return pyarrow.table({})
+        if _is_scalar_row(obj):
+            return None
+        return _table_of_rows([item if isinstance(item, (Mapping, list, tuple)) else [item] for item in obj])
+    else:
+        return None
+
+
+def _iter_tables(iterable, batch_size:int):
+    """Yield the tables of an iterable result, the single rows are collected into tables of ``batch_size`` rows."""
+    rows = []
+    for item in iterable:
+        table = _as_table(item)
+        if table is None:
+            rows.append(item if isinstance(item, (Mapping, list, tuple)) else [item])
+            if len(rows) >= batch_size:
+                yield _table_of_rows(rows)
+                rows = []
+        else:
+            if rows:
+                yield _table_of_rows(rows)
+                rows = []
+            yield table
+
+    if rows:
+        yield _table_of_rows(rows)
+
+
+class _ArrowFormatterBase(MediaTypeFormatter):
+    """The common implementation of the columnar formatters.
+
+    :param batch_size: The maximum number of rows of a record batch (or a Parquet row group).
+    """
+    def __init__(self, batch_size:int=65536):
+        self.batch_size = batch_size
+
+
+    def _open_writer(self, sink:_Drain, schema):
+        raise NotImplementedError()
+
+
+    def format(self, obj, media_type:str, **kwargs):
+        return b''.join(self._stream((obj,)))
+
+
+    def format_iter(self, iterable, media_type:str, **kwargs):
+        """Return an iterator of the content chunks, one chunk per record batch."""
+        return self._stream(iterable)
+
+
+    def _stream(self, iterable):
+        sink = _Drain()
+        writer = None
+        schema = None
+
+        for table in _iter_tables(iterable, self.batch_size):
+            if writer is None:
+                schema = table.schema
+                writer = self._open_writer(sink, schema)
+            elif table.schema != schema:
+                table = table.select(schema.names).cast(schema)
+
+            for batch in table.to_batches(max_chunksize=self.batch_size):
+                writer.write_batch(batch)       # a record batch, or a row group of Parquet
+                chunk = sink.take()
+                if chunk:
+                    yield chunk
+
+        if writer is None:      # an empty result
+            writer = self._open_writer(sink, pyarrow.schema([]))
+        writer.close()
+        yield sink.take()
+
+
+class ArrowStreamFormatter(_ArrowFormatterBase):
+    """A MediaTypeFormatter with Apache Arrow IPC stream responses."""
+
+    @property
+    def supported_media_types(self):
+        return ['application/vnd.apache.arrow.stream']
+
+
+    def _open_writer(self, sink:_Drain, schema):
+        return pyarrow.ipc.new_stream(sink, schema)
+
+
+class ParquetFormatter(_ArrowFormatterBase):
+    """A MediaTypeFormatter with Apache Parquet responses."""
+
+    @property
+    def supported_media_types(self):
+        return ['application/vnd.apache.parquet', 'application/x-parquet']
+
+
+    def _open_writer(self, sink:_Drain, schema):
+        return pyarrow.parquet.ParquetWriter(sink, schema)
+
+
+def available_formatters() -> list:
+    """The columnar MediaTypeFormatters, if pyarrow is installed."""
+    return [ArrowStreamFormatter(), ParquetFormatter()] if pyarrow is not None else []
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+    ASGI entry point for the sample PyWebApi Service.
+
+    It serves the same URL routes as routes.py (``/whoami`` and ``/pys/<app_id>/<module_func:path>``) on an event loop,
+    so that I/O-bound user functions defined by ``async def`` can serve many concurrent requests without a thread per request.
+    Run it by any ASGI server, E.g.: ``uvicorn asgi:application``
+
+    This module was originally shipped as an example code from https://github.com/DataBooster/PyWebApi, licensed under the MIT license.
+    Anyone who obtains a copy of this code is welcome to modify it for any purpose, and holds all rights to the modified part only.
+    The above license notice and permission notice shall be included in all copies or substantial portions of the Software.
+"""
+
+import os
+import io
+import asyncio
+import traceback
+from tempfile import NamedTemporaryFile
+from collections.abc import Iterator
+import bottle
+from bottle import BaseRequest, BaseResponse, HTTPError
+from pywebapi import RequestArguments, RouteTable, ModuleWatcher, Preloader, ResultCache, AdmissionError, ExecutionTimeout, execute_async, cors, compress, conditional
+
+# The configuration and the permission check are shared with the WSGI routes.
+from routes import _user_script_root, _server_debug, _anonymous_readiness, _reload_interval, _mediatype_formatter_manager, _process_pool, _single_flight, _admission_controller, _compression_min_size, _get_batch_executor, _columnar_batch, _stream_batch, _get_timeout, check_permission
+
+
+_route_table = RouteTable(isolated=True)
+
+_result_cache = ResultCache(int(os.getenv("RESULT_CACHE_SIZE", "1024")), _route_table)
+
+if _reload_interval > 0:
+    _module_watcher = ModuleWatcher(_user_script_root, _route_table, _reload_interval, _process_pool, _result_cache)
+    _module_watcher.start()
+
+_preloader = Preloader(_user_script_root, _route_table) if os.getenv("USER_SCRIPT_PRELOAD") == "1" else None
+
+
+def _make_environ(scope:dict, body, content_length:int) -> dict:
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(content_length),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': io.StringIO(),
+        'bottle.request.body': body,        # already spooled, bottle does not need to copy it again
+    }
+
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ[key] = value
+        elif key != 'CONTENT_LENGTH':
+            key = 'HTTP_' + key
+            environ[key] = environ[key] + ',' + value if key in environ else value
+
+    return environ
+
+
+async def _read_body(receive) -> tuple:
+    """Receive the request body like bottle does: it is kept in memory up to ``BaseRequest.MEMFILE_MAX`` bytes, and spooled to a temporary file beyond that.
+
+    :return: (the body file positioned at the start, the number of bytes)
+    """
+    body, size, is_temp_file = io.BytesIO(), 0, False
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not chunk:
+            continue
+
+        body.write(chunk)
+        size += len(chunk)
+        if not is_temp_file and size > BaseRequest.MEMFILE_MAX:
+            body, tmp = NamedTemporaryFile(mode='w+b'), body
+            body.write(tmp.getvalue())
+            del tmp
+            is_temp_file = True
+
+    body.seek(0)
+    return body, size
+
+
+def _request_arguments(request:BaseRequest, media_types:str, user_name:str) -> RequestArguments:
+    """Decode (and decompress) the request body and gather the arguments, this is CPU-bound so it runs in the default executor."""
+    # a JSON array body of a streamed batch is parsed incrementally, item by item as the calls are made
+    ra = RequestArguments(request, stream=_stream_batch(request, media_types), columnar=_columnar_batch(request))
+    ra.override_value('actual_username', user_name)
+    return ra
+
+
+def _get_user(request:BaseRequest) -> str:
+    return request.auth[0] if request.auth else None
+
+
+def _error_result(request:BaseRequest, response:BaseResponse, status:int, err:Exception):
+    response.status = status
+    if isinstance(err, HTTPError):
+        err.apply(response)     # E.g. the Retry-After header of a 503
+        resp_error = {"ExceptionMessage": err.body if err.body else str(err)}
+    else:
+        resp_error = {"ExceptionType": type(err).__name__, "ExceptionMessage": str(err)}
+        if bottle.DEBUG:
+            resp_error["StackTrace"] = traceback.format_exc()
+
+    media_types = request.get_header('Accept', 'application/json')
+    return _mediatype_formatter_manager.respond_as(resp_error, media_types, response.headers.dict)
+
+
+def _readiness(detailed:bool) -> dict:
+    if _preloader is not None and not _preloader.is_ready:
+        raise HTTPError(503, "The user modules are being preloaded.", headers={'Retry-After': '5'})
+
+    status = {"Ready": True}
+    if detailed and _preloader is not None:
+        status["Functions"] = len(_preloader.index)
+        status["Errors"] = _preloader.errors
+    return status
+
+
+async def _dispatch(request:BaseRequest, response:BaseResponse):
+    path = request.path
+    if path == '/ready' and _anonymous_readiness and request.method == 'GET' and not _get_user(request):
+        media_types = request.get_header('Accept', 'application/json')
+        return _mediatype_formatter_manager.respond_as(_readiness(False), media_types, response.headers.dict)
+    elif path in ('/ready', '/stats', '/whoami'):
+        module_func = None
+    elif path.startswith('/pys/'):
+        app_id, _, module_func = path[len('/pys/'):].partition('/')
+        if not app_id or not module_func:
+            raise HTTPError(404, f"Not found: {repr(path)}")
+    else:
+        raise HTTPError(404, f"Not found: {repr(path)}")
+
+    if cors.enable_cors(request, response):
+        return None
+
+    user_name = _get_user(request)
+    if not user_name and _server_debug != 'VisualStudio':
+        raise HTTPError(401, "The requested resource requires user authentication.")
+
+    if path == '/ready':
+        media_types = request.get_header('Accept', 'application/json')
+        return _mediatype_formatter_manager.respond_as(_readiness(True), media_types, response.headers.dict)
+    elif path == '/stats':
+        media_types = request.get_header('Accept', 'application/json')
+        return _mediatype_formatter_manager.respond_as({"Admission": _admission_controller.stats()}, media_types, response.headers.dict)
+    elif module_func is None:
+        return user_name
+
+    if check_permission(app_id, user_name, module_func):
+        media_types = request.get_header('Accept', 'application/json')
+
+        ra = await asyncio.get_running_loop().run_in_executor(None, _request_arguments, request, media_types, user_name)
+
+        try:
+            admission = await _admission_controller.admit_async(module_func, app_id)
+        except AdmissionError as err:
+            raise HTTPError(503, str(err), headers={'Retry-After': str(err.retry_after)})
+
+        with admission:
+            # the cache key of a versioned function calls its version function (user code), so it is not built on the event loop
+            cache_key = await asyncio.get_running_loop().run_in_executor(None, _result_cache.key, _user_script_root, module_func, ra.arguments, media_types)
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                response.headers.update(cached.headers)
+                if conditional.not_modified(request, response, cached.etag):
+                    return b''
+                return compress.encode_response(cached.body, request, response, _compression_min_size)
+
+            # the ETag of a versioned function is known before calling it
+            etag = _result_cache.version_etag(cache_key)
+            if conditional.not_modified(request, response, etag):
+                return b''
+
+            try:
+                raw_result = await execute_async(_user_script_root, module_func, ra.arguments, _route_table, _process_pool,
+                                                 _get_batch_executor(request), _stream_batch(request, media_types), _single_flight, _get_timeout(request))
+            except ExecutionTimeout as err:
+                raise HTTPError(504, str(err))
+            fmt_result = _mediatype_formatter_manager.respond_as(raw_result, media_types, response.headers.dict)
+            if isinstance(fmt_result, Iterator):      # the first chunks may call the user function, so they are not awaited on the event loop
+                return await asyncio.get_running_loop().run_in_executor(None, compress.encode_response, admission.release_after(fmt_result), request, response, _compression_min_size)
+
+        if etag is None and isinstance(fmt_result, (bytes, str)):
+            etag = conditional.make_etag(fmt_result)
+        _result_cache.put(cache_key, fmt_result, {'Content-Type': response.content_type}, etag)
+        if conditional.not_modified(request, response, etag, precondition=False):
+            return b''
+        return compress.encode_response(fmt_result, request, response, _compression_min_size)
+    else:
+        raise HTTPError(401, f"Current user ({repr(user_name)}) does not have permission to execute the requested {repr(module_func)}.")
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _process_pool.start()
+            if _preloader is not None:      # the startup completes only once all user modules have been preloaded and warmed up
+                await asyncio.get_running_loop().run_in_executor(None, _preloader.run)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """The ASGI application callable."""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body, content_length = await _read_body(receive)
+    request = BaseRequest(_make_environ(scope, body, content_length))
+    response = BaseResponse()
+
+    try:
+        try:
+            result = await _dispatch(request, response)
+        except HTTPError as err:
+            result = _error_result(request, response, err.status_code, err)
+        except Exception as err:
+            result = _error_result(request, response, 500, err)
+
+        if isinstance(result, Iterator):
+            return await _send_stream(send, request, response, result)
+
+        await _send_body(send, response, _to_bytes(result))
+    finally:
+        body.close()        # a temporary file is deleted as soon as the response has been sent
+
+
+def _header_list(response:BaseResponse, content_length:int=None) -> list:
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.headerlist if name.lower() != 'content-length']
+    if content_length is not None:
+        headers.append((b'content-length', str(content_length).encode('latin-1')))
+    return headers
+
+
+async def _send_body(send, response:BaseResponse, body:bytes):
+    content_length = len(body) if response.status_code not in (204, 304) else None
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': _header_list(response, content_length)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _to_bytes(chunk) -> bytes:
+    if chunk is None:
+        return b''
+    elif isinstance(chunk, bytes):
+        return chunk
+    else:
+        return str(chunk).encode('utf-8')
+
+
+async def _send_stream(send, request:BaseRequest, response:BaseResponse, chunks:Iterator):
+    """Send the chunks of a streamed result as soon as each of them is produced (in the default executor, since producing a chunk may call the user function)."""
+    loop = asyncio.get_running_loop()
+    end = object()
+
+    try:
+        chunk = await loop.run_in_executor(None, next, chunks, end)
+    except Exception as err:        # an error before the first chunk can still be responded as an error status
+        return await _send_body(send, response, _to_bytes(_error_result(request, response, 500, err)))
+
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': _header_list(response)})
+
+    while chunk is not end:
+        await send({'type': 'http.response.body', 'body': _to_bytes(chunk), 'more_body': True})
+        chunk = await loop.run_in_executor(None, next, chunks, end)
+
+    await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""binary_fmtr.py
+
+    This module implements the MediaTypeFormatters with MessagePack (application/msgpack) and CBOR (application/cbor) responses,
+    and the decoders of the request bodies in these media types.
+
+    Unlike JSON, both formats carry bytes, floats and datetimes natively, and Decimal by an extension type (MessagePack) or a tag (CBOR).
+    A naive datetime is regarded as UTC. Any other object is flattened the same way as the JSON responses (by jsonpickle).
+
+    The packages msgpack and cbor2 are optional, the formatter of a package which is not installed is simply not available.
+
+    This module was originally shipped as an example code from https://github.com/DataBooster/PyWebApi, licensed under the MIT license.
+    Anyone who obtains a copy of this code is welcome to modify it for any purpose, and holds all rights to the modified part only.
+    The above license notice and permission notice shall be included in all copies or substantial portions of the Software.
+"""
+
+import datetime
+from decimal import Decimal
+from jsonpickle.pickler import Pickler
+from pywebapi import MediaTypeFormatter
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+_MSGPACK_DECIMAL_EXT = 1        # the extension type code of a Decimal, the payload is its string form in UTF-8
+
+
+def _flatten(obj):
+    return Pickler(unpicklable=False).flatten(obj)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, datetime.datetime):      # a naive datetime, an aware one is packed as a Timestamp natively
+        return msgpack.Timestamp.from_datetime(obj.replace(tzinfo=datetime.timezone.utc))
+    elif isinstance(obj, datetime.date):
+        return obj.isoformat()
+    elif isinstance(obj, Decimal):
+        return msgpack.ExtType(_MSGPACK_DECIMAL_EXT, str(obj).encode('utf-8'))
+    elif isinstance(obj, (set, frozenset)):
+        return list(obj)
+    else:
+        return _flatten(obj)
+
+
+def _msgpack_ext_hook(code:int, data:bytes):
+    if code == _MSGPACK_DECIMAL_EXT:
+        return Decimal(data.decode('utf-8'))
+    return msgpack.ExtType(code, data)
+
+
+def msgpack_dumps(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True, datetime=True, default=_msgpack_default)
+
+
+def msgpack_loads(data:bytes):
+    return msgpack.unpackb(data, raw=False, timestamp=3, ext_hook=_msgpack_ext_hook, strict_map_key=False)
+
+
+def _cbor_default(encoder, obj):
+    if isinstance(obj, (set, frozenset)):
+        encoder.encode(list(obj))
+    else:
+        encoder.encode(_flatten(obj))
+
+
+def cbor_dumps(obj) -> bytes:
+    return cbor2.dumps(obj, timezone=datetime.timezone.utc, default=_cbor_default)
+
+
+def cbor_loads(data:bytes):
+    return cbor2.loads(data)
+
+
+class MessagePackFormatter(MediaTypeFormatter):
+    """A MediaTypeFormatter with MessagePack responses, it requires the package msgpack."""
+
+    @property
+    def supported_media_types(self):
+        return ['application/msgpack', 'application/x-msgpack']
+
+
+    def format(self, obj, media_type:str, **kwargs):
+        return msgpack_dumps(obj)
+
+
+class CborFormatter(MediaTypeFormatter):
+    """A MediaTypeFormatter with CBOR responses, it requires the package cbor2."""
+
+    @property
+    def supported_media_types(self):
+        return ['application/cbor']
+
+
+    def format(self, obj, media_type:str, **kwargs):
+        return cbor_dumps(obj)
+
+
+    def format_iter(self, iterable, media_type:str, **kwargs):
+        """Encode each element as soon as it is available, into an indefinite-length CBOR array."""
+        yield b'\x9f'
+        for item in iterable:
+            yield cbor_dumps(item)
+        yield b'\xff'
+
+
+def available_formatters() -> list:
+    """The binary MediaTypeFormatters whose packages are installed."""
+    formatters = []
+    if msgpack is not None:
+        formatters.append(MessagePackFormatter())
+    if cbor2 is not None:
+        formatters.append(CborFormatter())
+    return formatters
+
+
+def available_decoders() -> dict:
+    """{media type: decoder} of the request bodies whose packages are installed, to be registered by ``pywebapi.register_body_decoder``."""
+    decoders = {}
+    if msgpack is not None:
+        decoders['application/msgpack'] = decoders['application/x-msgpack'] = msgpack_loads
+    if cbor2 is not None:
+        decoders['application/cbor'] = cbor_loads
+    return decoders
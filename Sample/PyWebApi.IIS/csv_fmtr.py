@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""csv_fmtr.py
+
+    This module implements a MediaTypeFormatter with CSV (text/csv) or TSV (text/tab-separated-values) response for tabular results.
+
+    The following shapes of a result are recognized (E.g. the results of dbdatareader):
+
+        - ListOfDict: ``[{"col1": v11, "col2": v12}, {"col1": v21, "col2": v22}, ...]`` - the keys of the first row make the header 
+          (the header is written only once, later rows are written by the same columns);
+        - DictOfList: ``{"col1": [v11, v21, ...], "col2": [v12, v22, ...]}`` - the keys make the header;
+        - ListOfList: ``{"column_names": ["col1", "col2"], "value_matrix": [[v11, v12], [v21, v22], ...]}`` - the column_names make the header
+          (written only once, like the header of ListOfDict), the value_matrix makes the rows;
+        - A list of rows: ``[[v11, v12], [v21, v22], ...]`` - the rows are written as they are, without a header;
+        - A pandas DataFrame - its columns make the header;
+        - A single dictionary is one row with a header, a scalar is one cell.
+
+    An iterator (E.g. a generator returned by the function, or the results of a streamed batch call) is written incrementally in chunks of rows,
+    so the memory stays constant no matter how many rows there are. If an element is itself a table (E.g. the result of each call in a batch), its rows are written in turn.
+
+    This module was originally shipped as an example code from https://github.com/DataBooster/PyWebApi, licensed under the MIT license.
+    Anyone who obtains a copy of this code is welcome to modify it for any purpose, and holds all rights to the modified part only.
+    The above license notice and permission notice shall be included in all copies or substantial portions of the Software.
+"""
+
+import csv
+from collections.abc import Mapping, Iterable
+from pywebapi import MediaTypeFormatter
+
+
+_CHUNK_SIZE = 65536
+
+
+class _Echo(object):
+    """A file-like object for csv.writer, whose ``writerow`` then returns the formatted line instead of writing it anywhere."""
+    def write(self, line:str) -> str:
+        return line
+
+
+class _Header(list):
+    """The column names of a ListOfList result, to be written as the header row."""
+    pass
+
+
+def _is_list_of_list(obj) -> bool:
+    """Whether a result is in the ListOfList shape of dbdatareader: {'column_names': [...], 'value_matrix': [[...], ...]}."""
+    return isinstance(obj, Mapping) and len(obj) == 2 and 'column_names' in obj and 'value_matrix' in obj
+
+
+def _is_dict_of_list(obj) -> bool:
+    if not isinstance(obj, Mapping) or not obj:
+        return False
+    lengths = {len(v) if isinstance(v, (list, tuple)) else -1 for v in obj.values()}
+    return len(lengths) == 1 and -1 not in lengths
+
+
+def _iter_rows(obj):
+    """Yield the rows of a result as dictionaries (with a header) or sequences (without a header), a _Header precedes the rows of a ListOfList."""
+    if isinstance(obj, Mapping):
+        if _is_list_of_list(obj):
+            yield _Header(obj['column_names'])
+            yield from obj['value_matrix']
+        elif _is_dict_of_list(obj):
+            names = list(obj)
+            for values in zip(*obj.values()):
+                yield dict(zip(names, values))
+        else:
+            yield obj
+    elif type(obj).__module__.partition('.')[0] == 'pandas' and hasattr(obj, 'columns'):       # a DataFrame
+        names = [str(c) for c in obj.columns]
+        for values in obj.itertuples(index=False, name=None):
+            yield dict(zip(names, values))
+    elif isinstance(obj, (list, tuple)) and not any(isinstance(v, (Mapping, list, tuple)) for v in obj):
+        yield obj       # a row of scalars
+    elif isinstance(obj, Iterable) and not isinstance(obj, (str, bytes)):
+        for item in obj:
+            yield from _iter_rows(item)
+    elif obj is not None:
+        yield [obj]
+
+
+class CsvFormatter(MediaTypeFormatter):
+    """A MediaTypeFormatter with CSV or TSV responses for tabular results (see above)."""
+
+    @property
+    def supported_media_types(self):
+        return ['text/csv', 'text/tab-separated-values']
+
+
+    def format(self, obj, media_type:str, **kwargs):
+        return b''.join(self.format_iter(obj, media_type, **kwargs))
+
+
+    def format_iter(self, iterable, media_type:str, **kwargs):
+        """Write the rows as soon as each of them is produced, in chunks of about 64 KB."""
+        dialect = 'excel-tab' if media_type == 'text/tab-separated-values' else 'excel'
+        writer = csv.writer(_Echo(), dialect=dialect)
+        header = None
+        lines = []
+        size = 0
+
+        for row in _iter_rows(iterable):
+            if isinstance(row, _Header):
+                if header is not None:
+                    continue
+                header = list(row)
+                line = writer.writerow(header)
+            elif isinstance(row, Mapping):
+                if header is None:
+                    header = list(row)
+                    lines.append(writer.writerow(header))
+                line = writer.writerow([row.get(name) for name in header])
+            elif isinstance(row, (list, tuple)):
+                line = writer.writerow(row)
+            else:
+                line = writer.writerow([row])
+
+            lines.append(line)
+            size += len(line)
+            if size >= _CHUNK_SIZE:
+                yield ''.join(lines).encode('utf-8')
+                lines.clear()
+                size = 0
+
+        if lines:
+            yield ''.join(lines).encode('utf-8')
@@ -1,25 +1,144 @@
 # -*- coding: utf-8 -*-
 """json_fmtr.py
 
-    This module implements a MediaTypeFormatter with JSON response.
+    This module implements the MediaTypeFormatters with JSON (or NDJSON - newline delimited JSON) response.
+
+    - JsonFormatter flattens every object by jsonpickle (reflection), then encodes it by the standard json module;
+    - FastJsonFormatter encodes the common types directly into UTF-8 bytes - by orjson if it is installed, otherwise by the standard json module.
+      datetime, date and time are written in ISO 8601, Decimal and UUID as strings, bytes in base64, NumPy arrays and scalars as lists and numbers, 
+      pandas DataFrames as lists of records. Only the objects of other types are flattened by jsonpickle, the same way as JsonFormatter.
+      Its output is not identical to JsonFormatter's: besides the types above, NaN and Infinity are written as null by orjson
+      (the standard json module writes them as NaN and Infinity, which are not valid JSON), so the sample routes use it only if opted in.
 
     This module was originally shipped as an example code from https://github.com/DataBooster/PyWebApi, licensed under the MIT license.
     Anyone who obtains a copy of this code is welcome to modify it for any purpose, and holds all rights to the modified part only.
     The above license notice and permission notice shall be included in all copies or substantial portions of the Software.
 """
 
+import json
+import base64
+from uuid import UUID
+from decimal import Decimal
 from jsonpickle import dumps
+from jsonpickle.pickler import Pickler
 from pywebapi import MediaTypeFormatter
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class JsonFormatter(MediaTypeFormatter):
     """description of class"""
 
     @property
     def supported_media_types(self):
-       return ['application/json', 'text/json']
+       return ['application/json', 'text/json', 'application/x-ndjson']
 
 
     def format(self, obj, media_type:str, **kwargs):
         kwargs['unpicklable'] = kwargs.get('unpicklable', False)
+        if media_type == 'application/x-ndjson' and isinstance(obj, list):
+            return ''.join(dumps(item, **kwargs) + '\n' for item in obj)
         return dumps(obj, **kwargs)
+
+
+    def format_iter(self, iterable, media_type:str, **kwargs):
+        """Encode each element as soon as it is available - as a chunked JSON array, or one JSON document per line for NDJSON."""
+        kwargs['unpicklable'] = kwargs.get('unpicklable', False)
+
+        if media_type == 'application/x-ndjson':
+            for item in iterable:
+                yield dumps(item, **kwargs) + '\n'
+            return
+
+        iterator = iter(iterable)
+        try:
+            first = next(iterator)      # any error before the first chunk can still be responded as an error status
+        except StopIteration:
+            yield '[]'
+            return
+
+        yield '[' + dumps(first, **kwargs)
+        for item in iterator:
+            yield ', ' + dumps(item, **kwargs)
+        yield ']'
+
+
+def _default(obj):
+    """Encode the objects which are not supported by the JSON encoder natively."""
+    if isinstance(obj, Decimal):
+        return str(obj)     # keep all digits, a float would lose precision
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(obj).decode('ascii')
+    elif isinstance(obj, UUID):
+        return str(obj)
+    elif isinstance(obj, (set, frozenset)):
+        return list(obj)
+
+    isoformat = getattr(obj, 'isoformat', None)     # datetime, date, time and their subclasses (E.g. pandas.Timestamp)
+    if callable(isoformat):
+        return isoformat()
+
+    if type(obj).__module__.partition('.')[0] == 'pandas':
+        if hasattr(obj, 'columns'):     # a DataFrame
+            return obj.to_dict(orient='records')
+        elif hasattr(obj, 'tolist'):    # a Series or an Index
+            return obj.tolist()
+
+    tolist = getattr(obj, 'tolist', None)       # NumPy arrays and scalars not supported by the encoder natively
+    if callable(tolist) and type(obj).__module__ == 'numpy':
+        return tolist()
+
+    return Pickler(unpicklable=False).flatten(obj)
+
+
+_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(',', ':'))
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def fast_dumps(obj) -> bytes:
+    """Encode an object into JSON (UTF-8 bytes)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:       # E.g. an integer beyond 64 bits, which the standard json module can still encode
+            pass
+    return _encoder.encode(obj).encode('utf-8')
+
+
+class FastJsonFormatter(MediaTypeFormatter):
+    """A MediaTypeFormatter with JSON or NDJSON responses, it encodes the results into bytes directly (see above)."""
+
+    @property
+    def supported_media_types(self):
+       return ['application/json', 'text/json', 'application/x-ndjson']
+
+
+    def format(self, obj, media_type:str, **kwargs):
+        if media_type == 'application/x-ndjson' and isinstance(obj, list):
+            return b''.join(fast_dumps(item) + b'\n' for item in obj)
+        return fast_dumps(obj)
+
+
+    def format_iter(self, iterable, media_type:str, **kwargs):
+        """Encode each element as soon as it is available - as a chunked JSON array, or one JSON document per line for NDJSON."""
+        if media_type == 'application/x-ndjson':
+            for item in iterable:
+                yield fast_dumps(item) + b'\n'
+            return
+
+        iterator = iter(iterable)
+        try:
+            first = next(iterator)      # any error before the first chunk can still be responded as an error status
+        except StopIteration:
+            yield b'[]'
+            return
+
+        yield b'[' + fast_dumps(first)
+        for item in iterator:
+            yield b',' + fast_dumps(item)
+        yield b']'
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+    Preforking launcher for the sample PyWebApi Service (POSIX only).
+
+    The master process imports the routes and all user modules once, then forks the worker processes,
+    which share the memory of those modules copy-on-write and serve requests on the sockets bound by the master.
+    Each worker serves one request at a time, so the default (non-isolated) RouteTable is safe; the concurrency comes from the number of workers.
+
+    Configuration (environment variables):
+
+        - ``PREFORK_BIND``: The address of the default worker group, E.g. ``0.0.0.0:8080`` (it defaults to ``SERVER_HOST``:``SERVER_PORT``);
+        - ``PREFORK_WORKERS``: The number of workers of the default group (it defaults to the number of processors);
+        - ``PREFORK_APP_GROUPS``: Dedicated worker groups per app_id, so that one app's load cannot starve another's,
+          E.g. ``reporting,finance=2@0.0.0.0:8081;etl=1@0.0.0.0:8082`` - each group is ``app_ids=workers@host:port``.
+          A group only serves its own app_ids, and the default group does not serve any app_id which has a dedicated group
+          (such requests are answered by ``421 Misdirected Request``), a reverse proxy is expected to route ``/pys/<app_id>/`` to the right group;
+        - ``PREFORK_GRACEFUL_TIMEOUT``: The number of seconds a stopping worker is given to finish its current request (default: 30).
+
+    Signals to the master process:
+
+        - ``SIGHUP``: Graceful rolling restart - the master re-imports all user modules, then replaces the workers one by one,
+          each old worker finishes its current request before it exits, so the service is never down;
+        - ``SIGTERM`` or ``SIGINT``: Graceful shutdown.
+
+    The hot reload by ``USER_SCRIPT_RELOAD_INTERVAL`` should be turned off (``0``), use ``SIGHUP`` instead.
+    The process pool of ``PROCESS_POOL_DIRECTORIES`` is not started by the master, each worker starts its own pool after the fork.
+
+    Run it by: ``python prefork.py``
+
+    This module was originally shipped as an example code from https://github.com/DataBooster/PyWebApi, licensed under the MIT license.
+    Anyone who obtains a copy of this code is welcome to modify it for any purpose, and holds all rights to the modified part only.
+    The above license notice and permission notice shall be included in all copies or substantial portions of the Software.
+"""
+
+import os
+import sys
+import gc
+import time
+import signal
+import socket
+import importlib
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+import bottle
+
+# routes contains the HTTP handlers for our server and must be imported.
+import routes
+from pywebapi import Preloader, default_route_table
+
+
+class WorkerGroup(object):
+    """A group of worker processes serving the requests on one listening socket.
+
+    :param name: The name of the group, for the log.
+    :param app_ids: The app_ids served by this group, None means all app_ids without a dedicated group.
+    :param workers: The number of worker processes.
+    :param address: The (host, port) to listen on.
+    """
+    def __init__(self, name:str, app_ids:set, workers:int, address:tuple):
+        self.name = name
+        self.app_ids = app_ids
+        self.workers = workers
+        self.address = address
+        self.socket = None
+        self.pids = set()
+
+
+def _parse_address(address:str) -> tuple:
+    host, _, port = address.rpartition(':')
+    return (host or '0.0.0.0', int(port))
+
+
+def _load_groups() -> list:
+    default_address = os.getenv("PREFORK_BIND") or f"{os.getenv('SERVER_HOST', 'localhost')}:{os.getenv('SERVER_PORT', '8080')}"
+    default_workers = int(os.getenv("PREFORK_WORKERS", "0")) or os.cpu_count() or 1
+    groups = [WorkerGroup('default', None, default_workers, _parse_address(default_address))]
+
+    for item in filter(None, (s.strip() for s in os.getenv("PREFORK_APP_GROUPS", "").split(';'))):
+        app_ids, _, spec = item.partition('=')
+        workers, _, address = spec.partition('@')
+        app_ids = {a.strip() for a in app_ids.split(',') if a.strip()}
+        groups.append(WorkerGroup(','.join(sorted(app_ids)), app_ids, int(workers), _parse_address(address)))
+
+    return groups
+
+
+def _bind(address:tuple) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(128)
+    sock.setblocking(False)     # the workers compete for connections, a worker which loses the race must not block in accept()
+    return sock
+
+
+####################################################################################################
+# Worker process
+#region
+#
+def _group_filter(app, group:WorkerGroup, dedicated_app_ids:set):
+    """Only let the requests to the app_ids of a group pass."""
+    def filtered_app(environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith('/pys/'):
+            app_id = path[len('/pys/'):].partition('/')[0]
+            if (app_id not in group.app_ids) if group.app_ids is not None else (app_id in dedicated_app_ids):
+                start_response('421 Misdirected Request', [('Content-Type', 'text/plain')])
+                return [f"The app {repr(app_id)} is not served by this worker group.".encode('utf-8')]
+        return app(environ, start_response)
+    return filtered_app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, code='-', size='-'):
+        if bottle.DEBUG:
+            super().log_request(code, size)
+
+
+def _run_worker(group:WorkerGroup, dedicated_app_ids:set):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)       # the master stops the workers gracefully
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    server = WSGIServer(group.address, _QuietHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = group.socket
+    host, port = group.socket.getsockname()[:2]
+    server.server_name = socket.getfqdn(host)
+    server.server_port = port
+    server.setup_environ()
+    server.set_app(_group_filter(bottle.default_app(), group, dedicated_app_ids))
+    server.timeout = 1.0        # wake up regularly to check the stop signal
+
+    routes._process_pool.start()        # each worker owns its own pool of worker processes
+    try:
+        while not stopping:
+            server.handle_request()
+    finally:
+        routes._process_pool.shutdown()
+
+    server.server_close()
+
+#endregion
+####################################################################################################
+
+
+####################################################################################################
+# Master process
+#region
+#
+class Master(object):
+    def __init__(self, groups:list):
+        self.groups = groups
+        self.dedicated_app_ids = set().union(*(g.app_ids for g in groups if g.app_ids is not None))
+        self.graceful_timeout = float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", "30"))
+        self._stopping = False
+        self._restart_requested = False
+        self._retiring = set()      # pids of the workers being replaced
+
+
+    def _log(self, message:str):
+        print(f"[prefork {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+    def _preload(self):
+        # only the modules are preloaded by the master, its process pool is started by each worker after the fork,
+        # since the management thread of a ProcessPoolExecutor does not survive a fork
+        if routes._preloader is not None:
+            if not routes._preloader.is_ready:
+                routes._preloader.run()
+        else:
+            Preloader(routes._user_script_root).run()
+
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()     # keep the preloaded objects out of the collections in the workers, so their pages stay shared
+
+
+    def _reload(self):
+        """Discard all imported user modules and import them again, before the workers are replaced by a rolling restart."""
+        prefix = os.path.join(routes._user_script_root, '')
+        for name, module in list(sys.modules.items()):
+            file = getattr(module, '__file__', None)
+            if isinstance(file, str) and os.path.abspath(file).startswith(prefix):
+                del sys.modules[name]
+
+        importlib.invalidate_caches()
+        default_route_table.invalidate()
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        routes._preloader = Preloader(routes._user_script_root) if routes._preloader is not None else None
+        self._preload()
+
+
+    def _spawn(self, group:WorkerGroup) -> int:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                _run_worker(group, self.dedicated_app_ids)
+            except BaseException:
+                exit_code = 1
+            finally:
+                os._exit(exit_code)     # never run the master's cleanup in a worker
+
+        group.pids.add(pid)
+        return pid
+
+
+    def _group_of(self, pid:int) -> WorkerGroup:
+        return next((g for g in self.groups if pid in g.pids), None)
+
+
+    def _reap(self) -> list:
+        reaped = []
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            reaped.append(pid)
+            group = self._group_of(pid)
+            if group is not None:
+                group.pids.discard(pid)
+                if pid in self._retiring:
+                    self._retiring.discard(pid)
+                elif not self._stopping:
+                    self._log(f"worker {pid} of group {repr(group.name)} exited unexpectedly, respawning")
+                    self._spawn(group)
+        return reaped
+
+
+    def _wait_exit(self, pids:set, timeout:float) -> set:
+        """Wait until the given workers exit, return the ones still alive after the timeout."""
+        deadline = time.monotonic() + timeout
+        alive = set(pids)
+        while alive and time.monotonic() < deadline:
+            self._reap()
+            alive = {pid for pid in alive if self._group_of(pid) is not None}
+            if alive:
+                time.sleep(0.1)
+        return alive
+
+
+    def _stop_workers(self, pids:set):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        for pid in self._wait_exit(pids, self.graceful_timeout):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._wait_exit(pids, 5)
+
+
+    def _rolling_restart(self):
+        self._log("reloading user modules for a rolling restart")
+        self._reload()
+
+        for group in self.groups:
+            for old_pid in list(group.pids):
+                self._spawn(group)      # start the replacement first, so the group never loses capacity
+                self._retiring.add(old_pid)
+                self._stop_workers({old_pid})
+
+        self._log("rolling restart completed")
+
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_stopping', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_stopping', True))
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_restart_requested', True))
+
+        self._preload()
+
+        for group in self.groups:
+            group.socket = _bind(group.address)
+            for _ in range(group.workers):
+                self._spawn(group)
+            self._log(f"group {repr(group.name)}: {group.workers} workers listening on {group.address[0]}:{group.address[1]}")
+
+        while not self._stopping:
+            if self._restart_requested:
+                self._restart_requested = False
+                self._rolling_restart()
+            self._reap()
+            time.sleep(0.5)
+
+        self._log("shutting down")
+        self._stop_workers(set().union(*(g.pids for g in self.groups)))
+        for group in self.groups:
+            group.socket.close()
+
+#endregion
+####################################################################################################
+
+
+if __name__ == '__main__':
+    if '--debug' in sys.argv[1:] or 'SERVER_DEBUG' in os.environ:
+        bottle.debug(True)
+
+    Master(_load_groups()).run()
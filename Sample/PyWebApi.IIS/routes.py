@@ -8,9 +8,15 @@
 """
 
 import os
-from bottle import route, request, response, abort, error, make_default_app_wrapper
-from pywebapi import RequestArguments, execute, cors, MediaTypeFormatterManager
-from json_fmtr import JsonFormatter
+import math
+from collections.abc import Iterator
+from bottle import route, request, response, abort, error, make_default_app_wrapper, HTTPError
+from pywebapi import RequestArguments, execute, cors, compress, conditional, MediaTypeFormatterManager, ModuleWatcher, ProcessPool, BatchExecutor, Preloader, ResultCache, SingleFlight
+from pywebapi import AdmissionController, AdmissionError, ExecutionTimeout, register_body_decoder
+from json_fmtr import JsonFormatter, FastJsonFormatter
+from csv_fmtr import CsvFormatter
+import arrow_fmtr
+import binary_fmtr
 
 
 _user_script_root = os.getenv("USER_SCRIPT_ROOT")
@@ -20,12 +26,115 @@ _user_script_root = os.path.normpath(_user_script_root)
 
 _server_debug = os.getenv("SERVER_DEBUG")
 
-_mediatype_formatter_manager = MediaTypeFormatterManager(JsonFormatter())
+# Directories (separated by ';', relative to USER_SCRIPT_ROOT) whose functions are executed in worker processes
+_process_pool = ProcessPool(_user_script_root, directories=list(filter(None, os.getenv("PROCESS_POOL_DIRECTORIES", "").split(';'))))
+
+# The degree of parallelism of concurrent batch calls, a client opts in by the request header "X-Batch-Mode: concurrent"
+_batch_executor = BatchExecutor(int(os.getenv("BATCH_PARALLELISM", "8")))
+
+# The formatted responses of functions declared as cached (by @cached or __pywebapi_cached__) or versioned (by @versioned or __pywebapi_versioned__) are kept for reuse;
+# every response carries an ETag, a request with a matching If-None-Match is answered by 304 Not Modified
+_result_cache = ResultCache(int(os.getenv("RESULT_CACHE_SIZE", "1024")))
+# Identical concurrent calls of the same cached functions share one execution
+_single_flight = SingleFlight()
+
+_reload_interval = float(os.getenv("USER_SCRIPT_RELOAD_INTERVAL", "0"))
+if _reload_interval > 0:
+    _module_watcher = ModuleWatcher(_user_script_root, interval=_reload_interval, process_pool=_process_pool, result_cache=_result_cache)
+    _module_watcher.start()
+
+# Responses (of at least this number of bytes) are compressed by the Accept-Encoding of the request - gzip, deflate, and zstd or br if zstandard or brotli is installed;
+# the compressed request bodies (Content-Encoding: gzip, deflate or zstd) are decoded by RequestArguments transparently
+_compression_min_size = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
+# The JSON responses are written by jsonpickle (JsonFormatter) unless "JSON_FORMATTER=fast" opts in FastJsonFormatter,
+# which is much faster but writes some values differently (E.g. NaN and Infinity become null under orjson, datetimes are ISO 8601 strings)
+_json_formatter = FastJsonFormatter() if os.getenv("JSON_FORMATTER", "").strip().lower() == 'fast' else JsonFormatter()
+_mediatype_formatter_manager = MediaTypeFormatterManager(_json_formatter)
+_mediatype_formatter_manager.register(CsvFormatter(), False)
+
+# MessagePack and CBOR requests and responses, if the optional packages msgpack and cbor2 are installed;
+# Arrow IPC stream and Parquet responses, if the optional package pyarrow is installed
+for _formatter in binary_fmtr.available_formatters() + arrow_fmtr.available_formatters():
+    _mediatype_formatter_manager.register(_formatter, False)
+for _media_type, _decoder in binary_fmtr.available_decoders().items():
+    register_body_decoder(_media_type, _decoder)
+
+
+def _load_concurrency_limits(spec:str) -> AdmissionController:
+    """Load the concurrency limits from a specification like ``reporting=4;etl/loader=2,10;etl/loader.run=1,5,60``,
+    each limit is ``scope=max_concurrency[,max_queue[,queue_timeout]]``, the scope is an app id, a ``path/module`` or a ``path/module.function``."""
+    controller = AdmissionController()
+
+    for item in filter(None, (s.strip() for s in spec.split(';'))):
+        scope, _, values = item.rpartition('=')
+        values = values.split(',')
+        max_concurrency = int(values[0])
+        max_queue = int(values[1]) if len(values) > 1 else 0
+        queue_timeout = float(values[2]) if len(values) > 2 else None
+
+        if '/' not in scope:
+            controller.limit_app(scope, max_concurrency, max_queue, queue_timeout)
+        elif '.' in scope.rpartition('/')[2]:
+            controller.limit_function(scope, max_concurrency, max_queue, queue_timeout)
+        else:
+            controller.limit_module(scope, max_concurrency, max_queue, queue_timeout)
+
+    return controller
+
+_admission_controller = _load_concurrency_limits(os.getenv("CONCURRENCY_LIMITS", ""))
+
+_preloader = Preloader(_user_script_root) if os.getenv("USER_SCRIPT_PRELOAD") == "1" else None
+
+# /ready and /stats require an authenticated user like /whoami; "READINESS_PROBE_ANONYMOUS=1" lets an anonymous client (E.g. the health probe of a load balancer)
+# GET /ready as well, but it only sees whether the service is ready, without the details of the preloaded functions
+_anonymous_readiness = os.getenv("READINESS_PROBE_ANONYMOUS") == "1"
+
+
+def preload():
+    """Start the worker processes and import all user modules and call their warm-up hooks at startup. 
+    It must be called before serving any request, since the default RouteTable switches the process-global working directory."""
+    _process_pool.start()
+    if _preloader is not None and not _preloader.is_ready:
+        _preloader.run()
+
 
 def _get_user() -> str:
     return request.auth[0] if request.auth else None
 
 
+def _get_batch_executor(request) -> BatchExecutor:
+    return _batch_executor if request.get_header('X-Batch-Mode', '').strip().lower() == 'concurrent' else None
+
+
+def _columnar_batch(request) -> bool:
+    """A client sends a batch in the columnar shape ({"column": [values...], ...}) with the request header "X-Batch-Shape: columnar"."""
+    return request.get_header('X-Batch-Shape', '').strip().lower() == 'columnar'
+
+
+_STREAMED_MEDIA_TYPES = ('application/x-ndjson', 'text/csv', 'text/tab-separated-values', 'application/vnd.apache.arrow.stream', 'application/vnd.apache.parquet')
+
+
+def _stream_batch(request, media_types:str) -> bool:
+    """Batch results are streamed if the client accepts NDJSON, CSV, TSV or the columnar formats, or opts in the concurrent batch mode (every item reports its own error)."""
+    media_types = media_types.lower()
+    return any(mt in media_types for mt in _STREAMED_MEDIA_TYPES) or _get_batch_executor(request) is not None
+
+
+def _get_timeout(request) -> float:
+    """A client can limit the time it waits for the result by the request header "X-Request-Timeout: <seconds>"."""
+    timeout = request.get_header('X-Request-Timeout')
+    if not timeout:
+        return None
+    try:
+        seconds = float(timeout)
+    except ValueError:
+        seconds = None
+    if seconds is None or not math.isfinite(seconds) or seconds <= 0:
+        raise HTTPError(400, f"the X-Request-Timeout header must be a positive number of seconds - receiving {repr(timeout)} is not acceptable")
+    return seconds
+
+
 def authorize_cors(func):
     def wrapped(*args, **kwargs):
         if cors.enable_cors(request, response):
@@ -43,6 +152,35 @@ def who_am_i():
     return _get_user()
 
 
+def _readiness(detailed:bool):
+    if _preloader is not None and not _preloader.is_ready:
+        raise HTTPError(503, "The user modules are being preloaded.", headers={'Retry-After': '5'})
+
+    status = {"Ready": True}
+    if detailed and _preloader is not None:
+        status["Functions"] = len(_preloader.index)
+        status["Errors"] = _preloader.errors
+
+    media_types = request.get_header('Accept', 'application/json')
+    return _mediatype_formatter_manager.respond_as(status, media_types, response.headers.dict)
+
+
+@route(path='/ready', method=['GET', 'OPTIONS'])
+def readiness():
+    if _anonymous_readiness and request.method == 'GET' and not _get_user():
+        return _readiness(False)
+    return authorize_cors(_readiness)(True)
+
+
+@route(path='/stats', method=['GET', 'OPTIONS'])
+@authorize_cors
+def statistics():
+    stats = {"Admission": _admission_controller.stats()}
+
+    media_types = request.get_header('Accept', 'application/json')
+    return _mediatype_formatter_manager.respond_as(stats, media_types, response.headers.dict)
+
+
 def check_permission(app_id:str, user_id:str, module_func:str) -> bool:
     #TODO: add your implementation of permission checks
     return True
@@ -54,21 +192,59 @@ def execute_module_level_function(app_id:str, module_func:str):
     user_name = _get_user()
 
     if check_permission(app_id, user_name, module_func):
-        ra = RequestArguments(request)
+        media_types = request.get_header('Accept', 'application/json')
+
+        # a JSON array body of a streamed batch is parsed incrementally, item by item as the calls are made
+        ra = RequestArguments(request, stream=_stream_batch(request, media_types), columnar=_columnar_batch(request))
         ra.override_value('actual_username', user_name)
 
-        media_types = request.get_header('Accept', 'application/json')
+        try:
+            admission = _admission_controller.admit(module_func, app_id)
+        except AdmissionError as err:
+            raise HTTPError(503, str(err), headers={'Retry-After': str(err.retry_after)})
+
+        with admission:
+            # the cache key of a versioned function calls its version function, which is user code as well
+            cache_key = _result_cache.key(_user_script_root, module_func, ra.arguments, media_types)
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                response.headers.update(cached.headers)
+                if conditional.not_modified(request, response, cached.etag):
+                    return b''
+                return compress.encode_response(cached.body, request, response, _compression_min_size)
+
+            # the ETag of a versioned function is known before calling it
+            etag = _result_cache.version_etag(cache_key)
+            if conditional.not_modified(request, response, etag):
+                return b''
 
-        raw_result = execute(_user_script_root, module_func, ra.arguments)
-        fmt_result = _mediatype_formatter_manager.respond_as(raw_result, media_types, response.headers.dict)
+            try:
+                raw_result = execute(_user_script_root, module_func, ra.arguments, process_pool=_process_pool, batch_executor=_get_batch_executor(request),
+                                     stream=_stream_batch(request, media_types), single_flight=_single_flight, timeout=_get_timeout(request))
+            except ExecutionTimeout as err:
+                raise HTTPError(504, str(err))
+            fmt_result = _mediatype_formatter_manager.respond_as(raw_result, media_types, response.headers.dict)
+            if isinstance(fmt_result, Iterator):      # compressed chunk by chunk as the results are produced
+                return compress.encode_response(admission.release_after(fmt_result), request, response, _compression_min_size)
 
-        return fmt_result
+        if etag is None and isinstance(fmt_result, (bytes, str)):
+            etag = conditional.make_etag(fmt_result)
+        _result_cache.put(cache_key, fmt_result, {'Content-Type': response.content_type}, etag)
+        if conditional.not_modified(request, response, etag, precondition=False):
+            return b''
+        return compress.encode_response(fmt_result, request, response, _compression_min_size)
     else:
         abort(401, f"Current user ({repr(user_name)}) does not have permission to execute the requested {repr(module_func)}.")
 
 
+@error(400)
 @error(401)
+@error(412)
+@error(413)
+@error(415)
 @error(500)
+@error(503)
+@error(504)
 def error_handler(err):
     try:
         if err.exception: